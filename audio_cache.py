@@ -0,0 +1,147 @@
+"""
+Content-addressed cache of canned therapist turns, such as the greeting and the farewell.
+
+The model's spoken reply to a fixed prompt depends only on the model, the voice, the system
+instruction and the prompt text, so the first rendition is kept on disk under a hash of those
+and later sessions play it straight away:
+
+    cache = AudioCache()
+    entry = cache.get(MODEL, "Kore", GREETING_PROMPT, instruction)   # None on a miss
+    cache.put(MODEL, "Kore", GREETING_PROMPT, instruction, pcm, 24000, transcript)
+
+Invalidation: changing any part of the key (or CACHE_VERSION) addresses a different entry;
+entries older than max_age_seconds are treated as misses so voices pick up model updates;
+the least recently used entries are deleted once the cache exceeds max_bytes or max_entries.
+"""
+import hashlib, json, os, threading, time
+
+CACHE_VERSION = 1
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", "audio_cache")
+AUDIO_CACHE_MAX_BYTES = 16 * 1024 * 1024
+AUDIO_CACHE_MAX_ENTRIES = 64
+AUDIO_CACHE_MAX_AGE_SECONDS = 7 * 24 * 3600
+
+def cache_key(model, voice, text, instruction=""):
+    """Hex digest addressing the rendition of text by model in voice under instruction."""
+    material = json.dumps([CACHE_VERSION, model, voice, text, instruction])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+class CachedTurn:
+    def __init__(self, key, pcm, rate, transcript, created):
+        self.key = key
+        self.pcm = pcm
+        self.rate = rate
+        self.transcript = transcript
+        self.created = created
+
+class AudioCache:
+    """Raw PCM plus a JSON sidecar per entry in directory; entries are also kept in memory once read."""
+    def __init__(self, directory=AUDIO_CACHE_DIR, max_bytes=AUDIO_CACHE_MAX_BYTES,
+                 max_entries=AUDIO_CACHE_MAX_ENTRIES, max_age_seconds=AUDIO_CACHE_MAX_AGE_SECONDS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.loaded = {}
+        self.lock = threading.Lock()
+        self.metrics = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0}
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + ".pcm", base + ".json"
+
+    def get(self, model, voice, text, instruction=""):
+        """The cached rendition, or None if there is none or it has expired."""
+        key = cache_key(model, voice, text, instruction)
+        with self.lock:
+            entry = self.loaded.get(key) or self._load(key)
+            if entry and time.time() - entry.created > self.max_age_seconds:
+                self.metrics["expired"] += 1
+                self._delete(key)
+                entry = None
+            if entry is None:
+                self.metrics["misses"] += 1
+                return None
+            self.metrics["hits"] += 1
+            self.loaded[key] = entry
+            # The pcm file's access time orders entries for eviction
+            try:
+                os.utime(self._paths(key)[0])
+            except FileNotFoundError:
+                pass
+            return entry
+
+    def put(self, model, voice, text, instruction, pcm, rate, transcript=None):
+        # The entry outlives the caller's buffer, which may be a view reused for the next turn
+        pcm = bytes(pcm)
+        key = cache_key(model, voice, text, instruction)
+        pcm_path, meta_path = self._paths(key)
+        meta = {"model": model, "voice": voice, "text": text, "rate": rate,
+                "transcript": transcript, "created": time.time()}
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            # Write then rename, so a crash never leaves a truncated entry behind
+            for path, data in ((pcm_path, pcm), (meta_path, json.dumps(meta).encode("utf-8"))):
+                with open(path + ".tmp", "wb") as file:
+                    file.write(data)
+                os.replace(path + ".tmp", path)
+            self.loaded[key] = CachedTurn(key, pcm, rate, transcript, meta["created"])
+            self._enforce_limits()
+        return key
+
+    def invalidate(self, model=None, voice=None):
+        """Delete every entry, or only those rendered by model and/or in voice."""
+        with self.lock:
+            for key, meta in self._entries():
+                if (model is None or meta.get("model") == model) and (voice is None or meta.get("voice") == voice):
+                    self._delete(key)
+
+    def _load(self, key):
+        pcm_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, "rb") as file:
+                meta = json.load(file)
+            with open(pcm_path, "rb") as file:
+                pcm = file.read()
+        except (OSError, ValueError):
+            return None
+        return CachedTurn(key, pcm, meta["rate"], meta.get("transcript"), meta["created"])
+
+    def _entries(self):
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for filename in os.listdir(self.directory):
+            if filename.endswith(".json"):
+                try:
+                    with open(os.path.join(self.directory, filename), "rb") as file:
+                        entries.append((filename[:-5], json.load(file)))
+                except (OSError, ValueError):
+                    entries.append((filename[:-5], {}))
+        return entries
+
+    def _delete(self, key):
+        self.loaded.pop(key, None)
+        for path in self._paths(key):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def _enforce_limits(self):
+        sizes = []
+        for key, _ in self._entries():
+            pcm_path = self._paths(key)[0]
+            try:
+                stat = os.stat(pcm_path)
+            except FileNotFoundError:
+                self._delete(key)
+                continue
+            sizes.append((stat.st_atime, stat.st_size, key))
+        sizes.sort()
+        total = sum(size for _, size, _ in sizes)
+        while sizes and (total > self.max_bytes or len(sizes) > self.max_entries):
+            _, size, key = sizes.pop(0)
+            total -= size
+            self._delete(key)
+            self.metrics["evicted"] += 1
@@ -0,0 +1,103 @@
+"""
+Encodings for stored turns.
+
+Every turn is stored as 16-bit PCM WAV, which transcription reads and every browser plays.
+The codecs named in TURN_CODECS (see therapist.py) are stored next to it under the same
+name with their own extension, and the audio routes pick one per request with negotiate().
+FLAC and Opus need the optional soundfile package (pip install soundfile); without it only
+WAV is stored and served.
+"""
+import io, os
+import numpy as np
+from turn_store import wav_bytes
+
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+class Codec:
+    """One stored encoding: how to produce it and which Content-Type to serve it with."""
+    def __init__(self, name, mimetype, extension, format=None, subtype=None, aliases=()):
+        self.name = name
+        self.mimetype = mimetype
+        self.extension = extension
+        self.format = format
+        self.subtype = subtype
+        # Accept header media types that select this codec
+        self.media_types = {mimetype.split(';')[0].strip(), *aliases}
+
+    @property
+    def available(self):
+        return self.format is None or soundfile is not None
+
+    def encode(self, pcm, rate):
+        """Encode 16-bit mono PCM bytes; CPU-bound, so call it from a worker thread."""
+        if self.format is None:
+            return wav_bytes(pcm, rate)
+        buffer = io.BytesIO()
+        soundfile.write(buffer, np.frombuffer(pcm, dtype=np.int16), rate, format=self.format, subtype=self.subtype)
+        return buffer.getvalue()
+
+CODECS = {
+    "wav": Codec("wav", "audio/wav", ".wav", aliases=("audio/x-wav", "audio/wave")),
+    "flac": Codec("flac", "audio/flac", ".flac", "FLAC", "PCM_16", aliases=("audio/x-flac",)),
+    # libsndfile's Opus encoder takes 8, 12, 16, 24 and 48 kHz, which covers both directions
+    "opus": Codec("opus", "audio/ogg; codecs=opus", ".opus", "OGG", "OPUS", aliases=("audio/opus",)),
+}
+WAV = CODECS["wav"]
+
+def configured_codecs(names):
+    """The available codecs named in a comma-separated list, besides WAV, which is always stored."""
+    codecs = []
+    for name in (n.strip().lower() for n in names.split(',')):
+        if not name or name == "wav":
+            continue
+        if name not in CODECS:
+            raise ValueError(f"Unknown codec '{name}', expected one of {', '.join(CODECS)}")
+        if CODECS[name].available:
+            codecs.append(CODECS[name])
+    return codecs
+
+def variant_key(key, codec):
+    """Store key of a turn's encoding in codec, e.g. therapist_output_3.wav -> therapist_output_3.opus."""
+    return os.path.splitext(key)[0] + codec.extension
+
+def accepted_media_types(accept):
+    """Explicit media types of an Accept header with q > 0, most preferred first; wildcards are skipped."""
+    ranked = []
+    for index, part in enumerate((accept or "").split(',')):
+        media_type, *params = [p.strip() for p in part.split(';')]
+        if not media_type or '*' in media_type:
+            continue
+        q = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            ranked.append((-q, index, media_type.lower()))
+    return [media_type for _, _, media_type in sorted(ranked)]
+
+def negotiate(key, requested_format, accept, has_key):
+    """
+    Choose which stored encoding of turn key to send: (store key, codec).
+    An explicit ?format= wins, then explicit Accept types by preference; wildcards and
+    anything not stored get WAV, which every client can play.
+    """
+    for codec in CODECS.values():
+        if codec is not WAV and key.endswith(codec.extension):
+            return key, codec
+    candidates = []
+    if requested_format in CODECS:
+        candidates.append(CODECS[requested_format])
+    for media_type in accepted_media_types(accept):
+        candidates += [codec for codec in CODECS.values() if media_type in codec.media_types]
+    for codec in candidates:
+        if codec is WAV:
+            break
+        if has_key(variant_key(key, codec)):
+            return variant_key(key, codec), codec
+    return key, WAV
@@ -0,0 +1,910 @@
+"""
+Performance benchmarks for the virtual therapist. Run one by name:
+
+    python benchmark.py vad [noise:clip.wav | speech:clip.wav ...]
+    python benchmark.py endpoint [--max-latency=SECONDS] [utterance.wav ...]
+    python benchmark.py web [pollers] [fetchers] [seconds]
+    python benchmark.py serve [recording-minutes]
+    python benchmark.py codec [turn-seconds] [link-kbit/s] [rtt-ms]
+    python benchmark.py import [--max-ms=MILLISECONDS]
+    python benchmark.py pool [connect-seconds] [conversations] [interval-seconds]
+    python benchmark.py retry [sessions] [outage-seconds]
+    python benchmark.py faults
+    python benchmark.py e2e [turns] [speed] [--max-p95-ms=MILLISECONDS] [--no-speculation]
+    python benchmark.py stt [--engines=google,vosk] [utterance.wav ...]
+    python benchmark.py bargein [mic.wav:playback.wav[:speech-onset-seconds] ...]
+    python benchmark.py pcm [minutes] [turn-seconds]
+    python benchmark.py persist [write-ms] [turns]
+
+Clips are 16-bit mono WAV recordings; without any, synthetic clips are generated.
+"""
+import contextlib, io, os, sys, time, wave, threading, tracemalloc, urllib.request
+import numpy as np
+from vad import VoiceActivityDetector, Endpointer, BargeInDetector, replay, replay_barge_in
+from turn_store import wav_bytes, DiskTurnStore, MemoryTurnStore, TurnWriter
+from pcm_buffer import PCMBuffer, WAV_HEADER_BYTES
+
+CHUNK_SIZE = 1024
+RATE = 16000
+
+def read_wav(path):
+    """Return the samples of a 16-bit WAV file as int16, keeping only the first channel."""
+    with wave.open(path, 'rb') as wf:
+        if wf.getsampwidth() != 2:
+            raise ValueError(f"{path}: expected 16-bit samples")
+        samples = np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+        return samples[::wf.getnchannels()], wf.getframerate()
+
+def split_chunks(samples, size=CHUNK_SIZE):
+    return [samples[i:i + size] for i in range(0, len(samples) - size + 1, size)]
+
+def to_int16(x):
+    return np.clip(x, -32768, 32767).astype(np.int16)
+
+def voiced_speech(seconds, amplitude=400, rate=RATE):
+    """Stand-in for voiced speech: 140 Hz harmonics with formant-like emphasis and a syllable-rate envelope."""
+    t = np.arange(int(seconds * rate)) / rate
+    harmonics = sum(np.sin(2 * np.pi * 140 * k * t) / k * (3 if 3 <= k <= 6 else 1) for k in range(1, 20))
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t) ** 2
+    return amplitude * harmonics * envelope
+
+def white_noise(seconds, rms, rate=RATE, seed=0):
+    return np.random.default_rng(seed).normal(0, rms, int(seconds * rate))
+
+def synthetic_clips(seconds=10, rate=RATE):
+    """Labelled stand-ins for room recordings: (label, samples)."""
+    t = np.arange(int(seconds * rate)) / rate
+    return {
+        "white noise (rms 300)": ("noise", to_int16(white_noise(seconds, 300, rate))),
+        "mains hum (rms 150)": ("noise", to_int16(212 * np.sin(2 * np.pi * 50 * t))),
+        "fan rumble (rms 400)": ("noise", to_int16(np.convolve(white_noise(seconds, 1600, rate), np.ones(16) / 16, "same"))),
+        "voiced speech": ("speech", to_int16(voiced_speech(seconds, rate=rate))),
+    }
+
+def synthetic_utterances(rate=RATE):
+    """Single utterances padded with room noise: 0.5 s lead-in, 2 s of speech, 3 s of trailing silence."""
+    fixtures = {}
+    for room, noise_rms, amplitude in [("quiet room", 30, 400), ("office", 120, 400),
+                                       ("noisy room", 250, 900), ("soft speaker", 30, 120)]:
+        speech = voiced_speech(2.0, amplitude, rate)
+        signal = np.concatenate((np.zeros(int(0.5 * rate)), speech, np.zeros(3 * rate)))
+        fixtures[room] = to_int16(signal + white_noise(len(signal) / rate, noise_rms, rate, seed=len(fixtures)))
+    # A click before a soft speaker who pauses mid-sentence: the click must not count as their
+    # speech, or the loud start shortens the silence window and the pause ends the turn
+    phrase = voiced_speech(1.0, 120, rate)
+    signal = np.concatenate((np.zeros(rate), phrase, np.zeros(int(0.9 * rate)), phrase, np.zeros(3 * rate)))
+    signal[8192:8192 + 1024] += 8000 * np.sin(np.linspace(0, 200 * np.pi, 1024))
+    fixtures["click, soft pause"] = to_int16(signal + white_noise(len(signal) / rate, 30, rate, seed=len(fixtures)))
+    return fixtures
+
+def legacy_detector(threshold=200):
+    """The per-chunk RMS check that get_audio_input used before VoiceActivityDetector."""
+    def detect(chunk):
+        audio_data = chunk.astype(np.float32)
+        rms = np.sqrt(np.mean(audio_data**2)) if audio_data.size > 0 else 0
+        np.abs(audio_data).mean()  # volume bar
+        return rms > threshold
+    return detect
+
+def bench_vad(args):
+    """Per-chunk cost and trigger rate of each detector configuration."""
+    if args:
+        clips = {}
+        for arg in args:
+            label, path = arg.split(":", 1) if arg.startswith(("noise:", "speech:")) else ("noise", arg)
+            samples, rate = read_wav(path)
+            if rate != RATE:
+                print(f"warning: {path} is {rate} Hz, expected {RATE} Hz")
+            clips[path] = (label, samples)
+    else:
+        clips = synthetic_clips()
+
+    detectors = {
+        "legacy float RMS": legacy_detector(),
+        "energy": VoiceActivityDetector(CHUNK_SIZE, RATE).is_speech,
+        "energy+zcr": VoiceActivityDetector(CHUNK_SIZE, RATE, use_zcr=True).is_speech,
+        "energy+zcr+spectral": VoiceActivityDetector(CHUNK_SIZE, RATE, use_zcr=True, use_spectral=True).is_speech,
+    }
+    all_chunks = [chunk for _, samples in clips.values() for chunk in split_chunks(samples)]
+
+    print(f"{'detector':<22}{'us/chunk':>10}  " + "  ".join(f"{name[:22]:>22}" for name in clips))
+    for name, detect in detectors.items():
+        start = time.perf_counter()
+        repeats = 5
+        for _ in range(repeats):
+            for chunk in all_chunks:
+                detect(chunk)
+        per_chunk = (time.perf_counter() - start) / (repeats * len(all_chunks)) * 1e6
+        rates = []
+        for label, samples in clips.values():
+            chunks = split_chunks(samples)
+            hits = sum(bool(detect(chunk)) for chunk in chunks)
+            # For noise clips this is the false-trigger rate; for speech clips, the detection rate
+            rates.append(f"{label} {100 * hits / max(1, len(chunks)):5.1f}%")
+        print(f"{name:<22}{per_chunk:>10.1f}  " + "  ".join(f"{r:>22}" for r in rates))
+
+def bench_endpoint(args):
+    """Turn-end latency (end of speech to end of turn) for the fixed rule and the adaptive endpointer."""
+    max_latency = None
+    paths = []
+    for arg in args:
+        if arg.startswith("--max-latency="):
+            max_latency = float(arg.split("=", 1)[1])
+        else:
+            paths.append(arg)
+    fixtures = {path: read_wav(path)[0] for path in paths} or synthetic_utterances()
+
+    def latency(endpointer, samples):
+        ended, speech_end = replay(endpointer, samples, CHUNK_SIZE, RATE)
+        if ended is None or speech_end is None:
+            return None
+        # Speech after the end of the turn means the user was cut off mid-utterance
+        if any(endpointer.vad.is_speech(chunk) for chunk in split_chunks(samples[round(ended * RATE):])):
+            return "cut off"
+        return ended - speech_end
+
+    print(f"{'fixture':<28}{'fixed (s)':>12}{'adaptive (s)':>14}")
+    failures = []
+    for name, samples in fixtures.items():
+        fixed = latency(Endpointer(CHUNK_SIZE, RATE, adaptive=False), samples)
+        adaptive = latency(Endpointer(CHUNK_SIZE, RATE), samples)
+        def show(value):
+            return "never" if value is None else value if isinstance(value, str) else f"{value:.3f}"
+        print(f"{name[:28]:<28}{show(fixed):>12}{show(adaptive):>14}")
+        if max_latency is not None and (not isinstance(adaptive, float) or adaptive > max_latency):
+            failures.append(name)
+    if failures:
+        print(f"FAIL: turn-end latency above {max_latency} s, or speech cut off, for {', '.join(failures)}")
+        sys.exit(1)
+
+def percentile(values, q):
+    """Nearest-rank percentile of a list of numbers, q in 0-100."""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))]
+
+def tone_wav(seconds, rate=24000):
+    """WAV bytes of a 220 Hz tone, standing in for a therapist turn."""
+    return wav_bytes(to_int16(3000 * np.sin(2 * np.pi * 220 * np.arange(int(seconds * rate)) / rate)).tobytes(), rate)
+
+def load_test(base_url, paths, pollers, fetchers, seconds):
+    """Hammer base_url with pollers on the status path and fetchers on the audio path; return latencies per path."""
+    latencies = {name: [] for name in paths}
+    errors = {name: 0 for name in paths}
+    deadline = time.perf_counter() + seconds
+
+    def worker(name):
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(base_url + paths[name], timeout=10) as response:
+                    response.read()
+                latencies[name].append(time.perf_counter() - start)
+            except Exception:
+                errors[name] += 1
+
+    threads = [threading.Thread(target=worker, args=("poll",)) for _ in range(pollers)]
+    threads += [threading.Thread(target=worker, args=("audio",)) for _ in range(fetchers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors
+
+def bench_web(args):
+    """Request latency of the Flask and ASGI servers under concurrent polling and audio fetches."""
+    pollers = int(args[0]) if len(args) > 0 else 16
+    fetchers = int(args[1]) if len(args) > 1 else 4
+    seconds = float(args[2]) if len(args) > 2 else 5
+    import logging
+    from werkzeug.serving import make_server
+    import therapist_web
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    # One seeded session shared by both servers, with a 30 s therapist turn in its store
+    session = therapist_web.registry.create()
+    session.active = True
+    filename = "benchmark_turn.wav"
+    session.therapist.therapist_turns.put(filename, tone_wav(30))
+    session.therapist.turns.append("therapist", filename)
+    paths = {"poll": f"/get_audio_files?session_id={session.session_id}",
+             "audio": session.latest_audio()['therapist_audio']}
+
+    servers = []
+    flask_server = make_server("127.0.0.1", 8701, therapist_web.app, threaded=True)
+    threading.Thread(target=flask_server.serve_forever, daemon=True).start()
+    servers.append(("flask (threaded dev server)", "http://127.0.0.1:8701", flask_server.shutdown))
+    try:
+        import uvicorn, therapist_asgi
+        asgi_server = uvicorn.Server(uvicorn.Config(therapist_asgi.app, host="127.0.0.1", port=8702, log_level="warning", lifespan="off"))
+        threading.Thread(target=asgi_server.run, daemon=True).start()
+        while not asgi_server.started:
+            time.sleep(0.05)
+        servers.append(("asgi (uvicorn)", "http://127.0.0.1:8702", lambda: setattr(asgi_server, "should_exit", True)))
+    except ImportError as e:
+        print(f"Skipping ASGI server: {e}")
+
+    print(f"{pollers} pollers + {fetchers} audio fetchers for {seconds:.0f} s per server")
+    print(f"{'server':<30}{'route':<8}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    try:
+        for name, base_url, stop in servers:
+            latencies, errors = load_test(base_url, paths, pollers, fetchers, seconds)
+            for route, values in latencies.items():
+                ms = [v * 1000 for v in values]
+                print(f"{name:<30}{route:<8}{len(values) / seconds:>8.0f}{percentile(ms, 50):>9.1f}"
+                      f"{percentile(ms, 95):>9.1f}{percentile(ms, 99):>9.1f}{errors[route]:>8}")
+            stop()
+    finally:
+        therapist_web.registry.remove(session.session_id)
+        therapist_web.cleanup_audio_directories()
+
+def bench_serve(args):
+    """Peak Python memory and throughput serving a long recording: file.read(), then each turn store."""
+    minutes = float(args[0]) if args else 30
+    import therapist_web
+    from flask import Flask
+
+    # The route as it was: read the whole file into memory on every request
+    legacy = Flask("legacy")
+    @legacy.route('/audio/<path:file_path>')
+    def legacy_audio(file_path):
+        with open(file_path, 'rb') as file:
+            audio_data = file.read()
+        return legacy.response_class(response=audio_data, status=200, mimetype='audio/wav')
+
+    session = therapist_web.registry.create()
+    filename = "benchmark_recording.wav"
+    memory_store = session.therapist.therapist_turns
+    disk_store = DiskTurnStore(session.therapist_audio_dir, max_bytes=1 << 40)
+    memory_store.max_bytes = 1 << 40
+    data = tone_wav(minutes * 60)
+    memory_store.put(filename, data)
+    disk_store.put(filename, data)
+    size = len(data)
+    del data
+    url = f"/audio/therapist/{session.session_id}/{filename}"
+    cases = [
+        ("legacy file.read()", legacy.test_client(), f"/audio/{disk_store.path(filename)}", {}, disk_store),
+        ("disk store, send_file", therapist_web.app.test_client(), url, {}, disk_store),
+        ("disk store, last 1 MB", therapist_web.app.test_client(), url, {"Range": f"bytes={size - 1_000_000}-"}, disk_store),
+        ("memory store", therapist_web.app.test_client(), url, {}, memory_store),
+        ("memory store, last 1 MB", therapist_web.app.test_client(), url, {"Range": f"bytes={size - 1_000_000}-"}, memory_store),
+    ]
+
+    print(f"Recording: {minutes:.0f} min, {size / 1e6:.1f} MB")
+    print(f"{'handler':<26}{'status':>7}{'peak MB':>10}{'MB/s':>10}")
+    try:
+        for name, client, url, headers, store in cases:
+            session.therapist.therapist_turns = store
+            tracemalloc.start()
+            start = time.perf_counter()
+            received = 0
+            response = client.get(url, headers=headers, buffered=False)
+            for block in response.response:
+                received += len(block)
+            response.close()
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{name:<26}{response.status_code:>7}{peak / 1e6:>10.1f}{received / 1e6 / elapsed:>10.0f}")
+    finally:
+        disk_store.clear()
+        therapist_web.registry.remove(session.session_id)
+        therapist_web.cleanup_audio_directories()
+
+def bench_codec(args):
+    """Bytes per turn, encode CPU, and time to first byte and full download over a modelled remote link."""
+    seconds = float(args[0]) if len(args) > 0 else 10
+    link_kbps = float(args[1]) if len(args) > 1 else 1000
+    rtt_ms = float(args[2]) if len(args) > 2 else 80
+    import asyncio, logging
+    from werkzeug.serving import make_server
+    import therapist_web
+    from audio_codec import CODECS
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    # A therapist turn: 24 kHz voiced speech over faint room noise
+    rate = 24000
+    pcm = to_int16(voiced_speech(seconds, 3000, rate) + white_noise(seconds, 30, rate)).tobytes()
+    session = therapist_web.registry.create()
+    session.therapist.codecs = [codec for codec in CODECS.values() if codec.available and codec.name != "wav"]
+
+    async def publish():
+        await session.therapist.publish_turn("therapist", pcm, rate)
+        await session.therapist.turn_writer.close()
+        return session.therapist.turns.last("therapist")
+    entry = asyncio.run(publish())
+    url = session.turn_url(entry)
+    server = make_server("127.0.0.1", 8703, therapist_web.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    print(f"{seconds:.0f} s turn at {rate} Hz; remote link modelled as {link_kbps:.0f} kbit/s with {rtt_ms:.0f} ms RTT")
+    print(f"{'codec':<8}{'bytes':>10}{'kbit/s':>8}{'encode ms':>11}{'x realtime':>12}{'TTFB ms':>9}{'download ms':>13}")
+    try:
+        for codec in [CODECS["wav"]] + session.therapist.codecs:
+            repeats = 5
+            start = time.process_time()
+            for _ in range(repeats):
+                data = codec.encode(pcm, rate)
+            encode = (time.process_time() - start) / repeats
+            ttfbs, totals = [], []
+            for _ in range(20):
+                start = time.perf_counter()
+                with urllib.request.urlopen(f"http://127.0.0.1:8703{url}?format={codec.name}") as response:
+                    response.read(1)
+                    ttfbs.append(time.perf_counter() - start)
+                    size = 1 + len(response.read())
+                totals.append(time.perf_counter() - start)
+            # Loopback times plus one round trip for the request, and the body at link speed
+            ttfb = (percentile(ttfbs, 50) * 1000) + rtt_ms
+            download = (percentile(totals, 50) * 1000) + rtt_ms + size * 8 / link_kbps
+            print(f"{codec.name:<8}{size:>10}{size * 8 / 1000 / seconds:>8.0f}{encode * 1000:>11.1f}"
+                  f"{seconds / max(encode, 1e-9):>12.0f}{ttfb:>9.1f}{download:>13.0f}")
+    finally:
+        server.shutdown()
+        therapist_web.registry.remove(session.session_id)
+
+def bench_pool(args):
+    """Time from a new conversation to the greeting's first audio, connecting on demand vs from the pool."""
+    connect_delay = float(args[0]) if len(args) > 0 else 0.5
+    conversations = int(args[1]) if len(args) > 1 else 20
+    interval = float(args[2]) if len(args) > 2 else 1.0
+    import asyncio
+    from fake_live import FakeLiveClient
+    from session_pool import LiveSessionPool
+    from therapist import MODEL, live_config
+
+    async def first_audio(connection):
+        start = time.perf_counter()
+        async with connection as session:
+            await session.send(input="Hello, I'm here as your virtual therapist. How are you feeling?", end_of_turn=True)
+            async for response in session.receive():
+                if response.data:
+                    return time.perf_counter() - start
+
+    async def run(pool_size):
+        client = FakeLiveClient(connect_delay=connect_delay, first_chunk_delay=0.2)
+        pool = LiveSessionPool(client, MODEL, live_config(), pool_size) if pool_size else None
+        if pool:
+            pool.start()
+            await asyncio.sleep(connect_delay * 2)
+        # Conversations start every interval seconds and overlap, like visitors to the server
+        tasks = []
+        for _ in range(conversations):
+            connection = pool.session() if pool else client.aio.live.connect(model=MODEL, config=live_config())
+            tasks.append(asyncio.create_task(first_audio(connection)))
+            await asyncio.sleep(interval)
+        latencies = await asyncio.gather(*tasks)
+        if pool:
+            await pool.close()
+        return [v * 1000 for v in latencies], pool.metrics if pool else {}
+
+    print(f"Fake live service: {connect_delay * 1000:.0f} ms connect, 200 ms to first audio; "
+          f"{conversations} conversations, one every {interval:.1f} s")
+    print(f"{'pool size':<12}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}  pool")
+    for size in (0, 1, 2):
+        latencies, metrics = asyncio.run(run(size))
+        print(f"{size or 'off':<12}{percentile(latencies, 50):>9.0f}{percentile(latencies, 95):>9.0f}{max(latencies):>9.0f}  {metrics}")
+
+class NoJitter:
+    """rng for RetryPolicy that always waits the full delay, like the fixed sleeps it replaced."""
+    def uniform(self, low, high):
+        return high
+
+def offline_therapist(client, transcripts, breaker, base_delay=0.01, max_delay=0.05, reconnects=5, jitter=True, speed=8.0,
+                      audio_cache=False):
+    """A VirtualTherapist on the fake live API, microphone and recognizer, retrying on breaker."""
+    from fake_live import FakeRecognizer, ScriptedAudioStreams
+    from retry_policy import RetryPolicy, TRANSIENT, RECONNECT
+    from therapist import VirtualTherapist
+    rng = None if jitter else NoJitter()
+    multiplier = 2.0 if jitter else 1.0
+    utterances = [to_int16(voiced_speech(0.5)).tobytes() for _ in transcripts]
+    return VirtualTherapist(
+        live_client=client, streams=ScriptedAudioStreams(utterances, speed=speed, noise=30),
+        recognizer=FakeRecognizer(transcripts, 0.01), audio_cache=audio_cache, codecs="", speculative=False,
+        send_policy=RetryPolicy(base_delay=base_delay, max_delay=max_delay, multiplier=multiplier, breaker=breaker, rng=rng),
+        reconnect_policy=RetryPolicy(max_attempts=reconnects, base_delay=base_delay, max_delay=max_delay,
+                                     multiplier=multiplier, breaker=breaker, retry_on=(TRANSIENT, RECONNECT), rng=rng))
+
+def bench_retry(args):
+    """Load on a failing backend and time to recover, for the old fixed 1 s retries vs RetryPolicy."""
+    sessions = int(args[0]) if len(args) > 0 else 50
+    outage = float(args[1]) if len(args) > 1 else 5.0
+    import asyncio
+    from fake_live import FakeLiveClient, api_error
+    from retry_policy import CircuitBreaker
+
+    async def run(strategy):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        calls = []
+        recovered = []
+
+        def backend(kind):
+            # Every connect and send is a call; all of them fail until the outage ends
+            def fault():
+                now = loop.time() - start
+                calls.append(now)
+                if now < outage:
+                    return api_error(1011)
+                if kind == "send" and not sent[0]:
+                    sent[0] = True
+                    recovered.append((now - outage) * 1000)
+            sent = [False]
+            return fault
+
+        # The old code: no breaker, 5 sends and 5 connects, 1 s apart
+        breaker = None if strategy == "fixed 1 s" else CircuitBreaker()
+        therapists = []
+        for _ in range(sessions):
+            send = backend("send")
+            client = FakeLiveClient(connect_faults=send, send_faults=send)
+            if strategy == "fixed 1 s":
+                therapist = offline_therapist(client, ["goodbye"], None, 1.0, 1.0, jitter=False)
+            else:
+                therapist = offline_therapist(client, ["goodbye"], breaker, 0.5, 30.0)
+            therapists.append(therapist)
+        await asyncio.gather(*(therapist.start_session() for therapist in therapists))
+        buckets = {}
+        for t in calls:
+            if t < outage:
+                buckets[int(t * 10)] = buckets.get(int(t * 10), 0) + 1
+        return calls, buckets, recovered, breaker.metrics if breaker else {}
+
+    print(f"{sessions} conversations failing together at the start of a {outage:.1f} s outage")
+    print(f"{'strategy':<14}{'calls':>7}{'in outage':>11}{'peak/100ms':>12}{'gave up':>9}"
+          f"{'recover p50 ms':>16}{'p95 ms':>9}  breaker")
+    for strategy in ("fixed 1 s", "RetryPolicy"):
+        with open(os.devnull, "w") as quiet, contextlib.redirect_stdout(quiet):
+            calls, buckets, recovered, metrics = asyncio.run(run(strategy))
+        p50 = f"{percentile(recovered, 50):.0f}" if recovered else "-"
+        p95 = f"{percentile(recovered, 95):.0f}" if recovered else "-"
+        print(f"{strategy:<14}{len(calls):>7}{sum(buckets.values()):>11}{max(buckets.values(), default=0):>12}"
+              f"{sessions - len(recovered):>9}{p50:>16}{p95:>9}  {metrics}")
+
+def bench_faults(args):
+    """Fault injection through the fake live API: whole conversations must retry, reconnect and give up as designed."""
+    import asyncio, tempfile
+    from audio_cache import AudioCache
+    from fake_live import FakeLiveClient, FakeRecognizer, api_error
+    from retry_policy import CircuitBreaker
+
+    def faults(*errors):
+        """A fault callable shared by every session of a client: errors in order, then success."""
+        pending = list(errors)
+        return lambda: pending.pop(0) if pending else None
+
+    def sent_texts(client):
+        return [text for session in client.sessions for text in session.sent if isinstance(text, str)]
+
+    def send_retried():
+        # The greeting goes through; the user's turn fails twice with HTTP 500
+        breaker = CircuitBreaker()
+        client = FakeLiveClient(send_faults=faults(None, api_error(500), api_error(500)))
+        therapist = offline_therapist(client, ["I feel tired", "goodbye"], breaker)
+        asyncio.run(therapist.start_session())
+        return [("one connection", client.connect_attempts == 1),
+                ("user turn sent once", sent_texts(client).count("I feel tired") == 1),
+                ("two send retries", therapist.send_policy.metrics["retries"] == 2),
+                ("breaker closed", breaker.state == "closed")]
+
+    def reconnected():
+        # The websocket closes (1006) under the user's turn: a new session picks the conversation up
+        breaker = CircuitBreaker()
+        recorded = []
+        record_failure = breaker.record_failure
+        breaker.record_failure = lambda: (recorded.append(1), record_failure())
+        client = FakeLiveClient(send_faults=faults(None, api_error(1006)))
+        therapist = offline_therapist(client, ["I feel tired", "goodbye"], breaker)
+        asyncio.run(therapist.start_session())
+        return [("two connections", client.connect_attempts == 2),
+                ("one breaker failure for the close", len(recorded) == 1),
+                ("send not retried on the closed session", therapist.send_policy.metrics["retries"] == 0),
+                ("farewell on the new session", "The client wants to end our session." in client.sessions[-1].sent)]
+
+    def gave_up():
+        # Every connect fails: reconnect_policy.max_attempts tries, then the session ends
+        breaker = CircuitBreaker(failure_threshold=100)
+        client = FakeLiveClient(connect_faults=lambda: api_error(1011))
+        therapist = offline_therapist(client, ["goodbye"], breaker, reconnects=4)
+        asyncio.run(therapist.start_session())
+        return [("four connects", client.connect_attempts == 4),
+                ("nothing sent", not client.sessions)]
+
+    def breaker_cycle():
+        # Two failures open the breaker; the half-open trial fails and reopens it; the next closes it
+        breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.2)
+        client = FakeLiveClient(connect_faults=faults(api_error(1011), api_error(1011), api_error(1011)))
+        therapist = offline_therapist(client, ["goodbye"], breaker, reconnects=10)
+        asyncio.run(therapist.start_session())
+        return [("four connects", client.connect_attempts == 4),
+                ("opened once, kept open by the failed trial", breaker.metrics["opened"] == 1),
+                ("short-circuited while open", breaker.metrics["short_circuited"] >= 1),
+                ("closed again", breaker.state == "closed"),
+                ("conversation finished", len(client.sessions) == 1)]
+
+    def healthy_session_kept():
+        # Other conversations open the shared breaker while the user speaks; the send waits for it
+        breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.2)
+        client = FakeLiveClient()
+        therapist = offline_therapist(client, ["I feel tired", "goodbye"], breaker)
+        transcribe = FakeRecognizer.transcribe
+
+        def trip(audio_file):
+            if breaker.state == "closed" and not breaker.metrics["opened"]:
+                breaker.record_failure()
+                breaker.record_failure()
+            return transcribe(therapist.recognizer, audio_file)
+        therapist.recognizer.transcribe = trip
+        asyncio.run(therapist.start_session())
+        return [("breaker opened", breaker.metrics["opened"] == 1),
+                ("one connection", client.connect_attempts == 1),
+                ("user turn sent", "I feel tired" in sent_texts(client)),
+                ("closed again", breaker.state == "closed")]
+
+    def cached_greeting():
+        # The second conversation plays the cached greeting, replays it into the session as history, and goes on
+        with tempfile.TemporaryDirectory() as directory:
+            cache = AudioCache(directory)
+            clients = []
+            for _ in range(2):
+                clients.append(FakeLiveClient())
+                therapist = offline_therapist(clients[-1], ["goodbye"], CircuitBreaker(), audio_cache=cache)
+                asyncio.run(therapist.start_session())
+        history = [message["client_content"] for message in clients[1].sessions[0].wire if "client_content" in message]
+        return [("greeting replayed as history, asking for no reply", len(history) == 1
+                 and len(history[0].get("turns", [])) == 2 and not history[0].get("turnComplete")),
+                ("went on to the cached farewell", cache.metrics["hits"] == 2)]
+
+    failures = []
+    for check in (send_retried, reconnected, gave_up, breaker_cycle, healthy_session_kept, cached_greeting):
+        with open(os.devnull, "w") as quiet, contextlib.redirect_stdout(quiet):
+            results = check()
+        for name, ok in results:
+            print(f"{'ok  ' if ok else 'FAIL'} {check.__name__}: {name}")
+            if not ok:
+                failures.append(f"{check.__name__}: {name}")
+    if failures:
+        print(f"FAIL: {len(failures)} fault-injection checks")
+        sys.exit(1)
+
+def bench_e2e(args):
+    """Full conversations offline: scripted microphone, fake speech recognition and fake live model."""
+    max_p95 = None
+    speculative = "--no-speculation" not in args
+    args = [a for a in args if a != "--no-speculation"]
+    for arg in [a for a in args if a.startswith("--max-p95-ms=")]:
+        max_p95 = float(arg.split("=", 1)[1])
+        args.remove(arg)
+    turns = int(args[0]) if len(args) > 0 else 8
+    speed = float(args[1]) if len(args) > 1 else 1.0
+    import asyncio
+    from fake_live import FakeLiveClient, FakeRecognizer, ScriptedAudioStreams
+    from turn_metrics import TurnMetrics
+    from therapist import VirtualTherapist
+
+    # Utterances of 1 to 3 s; the last user turn says goodbye
+    utterances = [to_int16(voiced_speech(1.0 + (i % 5) * 0.5)).tobytes() for i in range(turns)]
+    transcripts = ["I have been feeling anxious about work lately."] * (turns - 1) + ["goodbye"]
+    streams = ScriptedAudioStreams(utterances, speed=speed, noise=30)
+    metrics = TurnMetrics()
+    client = FakeLiveClient(first_chunk_delay=0.3 / speed, chunk_delay=0.05 / speed)
+    therapist = VirtualTherapist(live_client=client, streams=streams, recognizer=FakeRecognizer(transcripts, 0.3 / speed),
+                                 audio_cache=False, codecs="", metrics=metrics, speculative=speculative)
+    cpu, wall = time.process_time(), time.perf_counter()
+    asyncio.run(therapist.start_session())
+    cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+
+    latencies = [v * 1000 for v in streams.turn_latencies]
+    print(f"\n{turns} turns at {speed:g}x real time: fake STT {300 / speed:.0f} ms, "
+          f"first reply audio after {300 / speed:.0f} ms, 100 ms chunks every {50 / speed:.0f} ms")
+    print(f"end of speech to first reply audio (ms): p50 {percentile(latencies, 50):.0f}  "
+          f"p95 {percentile(latencies, 95):.0f}  p99 {percentile(latencies, 99):.0f}  over {len(latencies)} turns")
+    print(f"CPU per turn: {cpu / max(len(latencies), 1) * 1000:.1f} ms  ({cpu:.2f} s CPU in {wall:.1f} s)")
+    print(f"{'stage':<16}{'count':>7}{'mean ms':>10}")
+    for stage, histogram in metrics.histograms.items():
+        _, total, count = histogram.snapshot()
+        print(f"{stage:<16}{count:>7}{total / count * 1000 if count else 0:>10.1f}")
+    print(", ".join(f"{event} {count}" for event, count in metrics.counters.items()))
+    if max_p95 is not None and percentile(latencies, 95) > max_p95:
+        print(f"FAIL: p95 {percentile(latencies, 95):.0f} ms > {max_p95:.0f} ms")
+        sys.exit(1)
+
+def bench_stt(args):
+    """Real-time factor and end-of-turn to transcript latency of each speech recognition engine."""
+    from recognizers import RECOGNIZER_BACKENDS, create_recognizer
+    engines = list(RECOGNIZER_BACKENDS)
+    for arg in [a for a in args if a.startswith("--engines=")]:
+        engines = arg.split("=", 1)[1].split(",")
+        args.remove(arg)
+    clips = {os.path.basename(path): read_wav(path)[0] for path in args} or \
+            {name: samples[:int(3.5 * RATE)] for name, samples in synthetic_utterances().items()}
+    print(f"{'engine':<10}{'clip':<20}{'audio s':>8}{'RTF':>8}{'final ms':>10}  transcript")
+    for name in engines:
+        try:
+            recognizer = create_recognizer(name)
+        except ValueError as e:
+            print(f"{name:<10}skipped: {e}")
+            continue
+        for clip, samples in clips.items():
+            chunks = [chunk.tobytes() for chunk in split_chunks(samples)]
+            seconds = len(chunks) * CHUNK_SIZE / RATE
+            # Real-time factor: the whole clip fed as fast as possible
+            start = time.perf_counter()
+            recognizer.start()
+            for chunk in chunks:
+                recognizer.feed(chunk)
+            recognizer.finish()
+            rtf = (time.perf_counter() - start) / seconds
+            # Final-transcript latency: fed at capture pace, timed from the last chunk
+            recognizer.start()
+            for chunk in chunks:
+                recognizer.feed(chunk)
+                time.sleep(CHUNK_SIZE / RATE)
+            start = time.perf_counter()
+            text = recognizer.finish()
+            final = (time.perf_counter() - start) * 1000
+            print(f"{name:<10}{clip[:19]:<20}{seconds:>8.1f}{rtf:>8.3f}{final:>10.0f}  {text[:40]}")
+
+def resample(samples, rate, target=RATE):
+    if rate == target:
+        return samples
+    positions = np.arange(int(len(samples) * target / rate)) * rate / target
+    return to_int16(np.interp(positions, np.arange(len(samples)), samples))
+
+def barge_in_fixtures(rate=RATE):
+    """(mic, playback, onset) stand-ins: the therapist's voice echoing back, with and without the user talking over it."""
+    playback = to_int16(voiced_speech(5.0, 800, rate))
+    fixtures = {}
+    for name, echo_gain, user_amplitude in [("echo only", 0.3, 0), ("loud echo only", 0.8, 0), ("user over echo", 0.3, 600),
+                                            ("quiet user over echo", 0.3, 300), ("user over loud echo", 0.8, 600)]:
+        # 40 ms of acoustic delay between the speaker and the microphone
+        echo = np.concatenate((np.zeros(int(0.04 * rate)), playback[:-int(0.04 * rate)] * echo_gain))
+        user = np.zeros(len(playback))
+        if user_amplitude:
+            # A different voice, 190 Hz instead of 140 Hz, speaking from 2 s in
+            speech = voiced_speech(2.0, user_amplitude, rate * 140 / 190)[:2 * rate]
+            user[2 * rate:2 * rate + len(speech)] = speech
+        mic = to_int16(echo + user + white_noise(len(playback) / rate, 30, rate, seed=len(fixtures)))
+        fixtures[name] = (mic, playback, 2.0 if user_amplitude else None)
+    return fixtures
+
+def bench_bargein(args):
+    """False triggers on the therapist's own echo and detection latency for real interruptions."""
+    fixtures = {}
+    for arg in args:
+        mic_path, playback_path, *onset = arg.split(":")
+        mic, mic_rate = read_wav(mic_path)
+        playback, playback_rate = read_wav(playback_path)
+        fixtures[os.path.basename(mic_path)] = (resample(mic, mic_rate), resample(playback, playback_rate),
+                                                float(onset[0]) if onset else None)
+    fixtures = fixtures or barge_in_fixtures()
+    detectors = {
+        "plain VAD": lambda: BargeInDetector(echo_gain=0.0, coupling_adapt=0.0),
+        "echo-aware": lambda: BargeInDetector(),
+    }
+    print(f"{'fixture':<24}{'detector':<12}{'result':<16}{'latency ms':>11}")
+    for name, (mic, playback, onset) in fixtures.items():
+        for label, build in detectors.items():
+            triggered = replay_barge_in(build(), mic, playback)
+            if triggered is None:
+                result, latency = ("missed" if onset is not None else "ok"), ""
+            elif onset is None or triggered < onset:
+                result, latency = "FALSE TRIGGER", f"{triggered * 1000:.0f} in"
+            else:
+                result, latency = "detected", f"{(triggered - onset) * 1000:.0f}"
+            print(f"{name:<24}{label:<12}{result:<16}{latency:>11}")
+
+IMPORT_PROBE = """
+import os, signal, sys, threading, time
+before = set(os.listdir('.'))
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+import therapist
+background = threading.active_count() > 1 or signal.getsignal(signal.SIGINT) is not signal.default_int_handler
+print(elapsed, 'google.genai' in sys.modules, therapist._audio is not None, background, sorted(set(os.listdir('.')) - before))
+"""
+
+def legacy_turn_pipeline(store):
+    """A turn's bytes as they moved before PCMBuffer: ring buffer, copies out, joins and wave. Yields between steps."""
+    ring = np.zeros(RATE * 120, dtype=np.int16)
+
+    def user_turn(key, chunks):
+        written = 0
+        for chunk in chunks:
+            samples = np.frombuffer(chunk, dtype=np.int16)
+            ring[written:written + len(samples)] = samples
+            written += len(samples)
+        yield
+        speculative = io.BytesIO(wav_bytes(ring[:written].copy().tobytes(), RATE))
+        yield
+        pcm = ring[:written].copy().tobytes()
+        yield
+        wav = wav_bytes(pcm, RATE)
+        yield
+        store.put(key, wav)
+        yield io.BytesIO(wav)
+
+    def reply(key, chunks):
+        audio_chunks = []
+        for chunk in chunks:
+            audio_chunks.append(chunk)
+        yield
+        store.put(key, wav_bytes(b''.join(audio_chunks), 24000))
+        yield
+        yield b''.join(audio_chunks)
+    return user_turn, reply
+
+def pcm_buffer_pipeline(store):
+    """The same turns through one reused PCMBuffer per direction."""
+    recording, replying = PCMBuffer(RATE, max_seconds=120), PCMBuffer(24000)
+
+    def user_turn(key, chunks):
+        recording.clear()
+        for chunk in chunks:
+            recording.append(chunk)
+        yield
+        speculative = io.BytesIO(bytes(recording.wav()))
+        yield
+        wav = bytes(recording.wav())
+        yield
+        store.put(key, wav)
+        yield io.BytesIO(wav), memoryview(wav)[WAV_HEADER_BYTES:]
+
+    def reply(key, chunks):
+        replying.clear()
+        for chunk in chunks:
+            replying.append(chunk)
+        yield
+        store.put(key, bytes(replying.wav()))
+        yield replying.pcm()
+    return user_turn, reply
+
+def bench_pcm(args):
+    """Bytes allocated, turn-sized copies and CPU per minute of conversation, before and after PCMBuffer."""
+    minutes = float(args[0]) if args else 5
+    turn_seconds = float(args[1]) if len(args) > 1 else 10
+    # Half the minute the user speaks, half the therapist; chunks arrive as the callback and the model send them
+    user_chunks = [bytes(CHUNK_SIZE * 2)] * int(turn_seconds * RATE / CHUNK_SIZE)
+    reply_chunks = [bytes(9600)] * int(turn_seconds * 24000 * 2 / 9600)
+    turns = max(1, int(minutes * 30 / turn_seconds))
+
+    def conversation(pipeline, step):
+        user_turn, reply = pipeline(MemoryTurnStore(max_bytes=1 << 40))
+        for n in range(turns):
+            for stage, key, chunks in ((user_turn, f"user_{n}.wav", user_chunks), (reply, f"reply_{n}.wav", reply_chunks)):
+                steps = stage(key, chunks)
+                while step(steps, sum(map(len, chunks))):
+                    pass
+
+    def untraced(steps, turn_bytes):
+        return next(steps, StopIteration) is not StopIteration
+
+    print(f"{minutes:g} min of conversation: {turns} user turns and {turns} replies of {turn_seconds:g} s")
+    print(f"{'pipeline':<14}{'MB allocated/min':>18}{'turn copies/min':>17}{'peak MB':>9}{'CPU ms/min':>12}")
+    for name, pipeline in (("legacy", legacy_turn_pipeline), ("PCMBuffer", pcm_buffer_pipeline)):
+        totals = {"allocated": 0, "copies": 0}
+
+        def traced(steps, turn_bytes):
+            # Each copy of a turn allocates its destination, so a step's growth above where it
+            # started counts the bytes it copied, even those freed again before it ends
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            more = untraced(steps, turn_bytes)
+            grown = tracemalloc.get_traced_memory()[1] - before
+            totals["allocated"] += grown
+            totals["copies"] += round(grown / turn_bytes)
+            return more
+
+        tracemalloc.start()
+        conversation(pipeline, traced)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        cpu = time.process_time()
+        conversation(pipeline, untraced)
+        cpu = time.process_time() - cpu
+        print(f"{name:<14}{totals['allocated'] / 1e6 / minutes:>18.1f}{totals['copies'] / minutes:>17.1f}"
+              f"{peak / 1e6:>9.1f}{cpu * 1000 / minutes:>12.1f}")
+
+class SlowDiskTurnStore(DiskTurnStore):
+    """A disk store on a disk that takes delay seconds per write."""
+    def __init__(self, directory, delay):
+        super().__init__(directory, max_bytes=1 << 40)
+        self.delay = delay
+
+    def _write(self, key, data):
+        time.sleep(self.delay)
+        super()._write(key, data)
+
+def bench_persist(args):
+    """Time the conversation waits on a slow disk per turn: writes on the event loop vs the TurnWriter."""
+    import asyncio, tempfile
+    write_ms = float(args[0]) if args else 200
+    turns = int(args[1]) if len(args) > 1 else 20
+    wav = wav_bytes(bytes(RATE * 2 * 5), RATE)
+
+    async def conversation(store, writer, gap):
+        waits = []
+        for n in range(turns):
+            def write(key=f"turn_{n}.wav"):
+                store.put(key, wav)
+            start = time.perf_counter()
+            if writer:
+                await writer.submit(write)
+            else:
+                write()
+            waits.append((time.perf_counter() - start) * 1000)
+            # The rest of the turn: transcription, the reply, the user's next utterance
+            await asyncio.sleep(gap)
+        if writer:
+            await writer.close()
+        return waits
+
+    print(f"{turns} turns of {len(wav) / 1e3:.0f} kB; every write takes {write_ms:.0f} ms")
+    print(f"{'persistence':<14}{'turn gap ms':>12}{'wait p50 ms':>13}{'wait max ms':>13}{'blocked':>9}{'stored':>8}")
+    for gap_ms in (2 * write_ms, write_ms / 4):
+        for name in ("inline", "TurnWriter"):
+            with tempfile.TemporaryDirectory() as directory:
+                store = SlowDiskTurnStore(directory, write_ms / 1000)
+                writer = TurnWriter() if name == "TurnWriter" else None
+                waits = asyncio.run(conversation(store, writer, gap_ms / 1000))
+                blocked = writer.metrics["blocked"] if writer else "-"
+                print(f"{name:<14}{gap_ms:>12.0f}{percentile(waits, 50):>13.1f}{max(waits):>13.1f}"
+                      f"{blocked:>9}{len(store.keys()):>8}")
+
+def bench_import(args):
+    """Cold import time of the modules servers and tools import, and what the import left initialized."""
+    import subprocess, tempfile
+    max_ms = None
+    for arg in args:
+        if arg.startswith("--max-ms="):
+            max_ms = float(arg.split("=", 1)[1])
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [here, os.environ.get("PYTHONPATH")])))
+    print(f"{'module':<16}{'p50 ms':>8}{'max ms':>8}  {'genai loaded':<14}{'PyAudio up':<12}{'threads':<9}created")
+    failures = []
+    # therapist_web is the Flask script and starts its loop thread and signal handlers on import
+    for module, background_ok in (("therapist", False), ("web_sessions", False), ("therapist_asgi", False),
+                                  ("therapist_web", True)):
+        times = []
+        # A fresh interpreter per run, started in an empty directory so created files show up
+        with tempfile.TemporaryDirectory() as cwd:
+            for _ in range(5):
+                result = subprocess.run([sys.executable, "-c", IMPORT_PROBE.format(module=module)], cwd=cwd, env=env,
+                                        capture_output=True, text=True, check=True)
+                elapsed, genai_loaded, audio_up, background, created = result.stdout.strip().splitlines()[-1].split(" ", 4)
+                times.append(float(elapsed) * 1000)
+        print(f"{module:<16}{percentile(times, 50):>8.0f}{max(times):>8.0f}  {genai_loaded:<14}{audio_up:<12}{background:<9}{created}")
+        if max_ms is not None and percentile(times, 50) > max_ms:
+            failures.append(module)
+        if genai_loaded == "True" or audio_up == "True" or created != "[]" or (background == "True" and not background_ok):
+            failures.append(f"{module} (initialized at import)")
+    if failures:
+        print(f"FAIL: {', '.join(failures)}")
+        sys.exit(1)
+
+BENCHMARKS = {
+    "vad": bench_vad,
+    "endpoint": bench_endpoint,
+    "web": bench_web,
+    "serve": bench_serve,
+    "codec": bench_codec,
+    "import": bench_import,
+    "pool": bench_pool,
+    "retry": bench_retry,
+    "faults": bench_faults,
+    "e2e": bench_e2e,
+    "stt": bench_stt,
+    "bargein": bench_bargein,
+    "pcm": bench_pcm,
+    "persist": bench_persist,
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(f"Usage: python benchmark.py {{{'|'.join(BENCHMARKS)}}} [args...]")
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]](sys.argv[2:])
@@ -0,0 +1,322 @@
+"""
+Local stand-in for the Gemini Live API, for running VirtualTherapist without network access or an API key.
+
+    from fake_live import FakeLiveClient
+    therapist = VirtualTherapist(realtime_input=True, live_client=FakeLiveClient())
+
+FakeLiveClient mirrors the small part of genai.Client that VirtualTherapist uses
+(client.aio.live.connect). Every session records what it was sent and answers each
+completed user turn with canned 24 kHz PCM, streamed chunk by chunk like the real service.
+Sends go through the SDK's own AsyncSession serializer, and the session acts on the JSON it
+would have written to the websocket, so input the SDK rejects or drops fails here too.
+
+Faults are injected as lists of exceptions (None meaning "succeed") consumed one per call:
+
+    client = FakeLiveClient(connect_faults=[api_error(1006)], send_faults=[api_error(500), None])
+
+or as a callable returning the exception to raise, or None, for each call.
+
+ScriptedAudioStreams and FakeRecognizer stand in for the microphone, speaker and Google
+speech recognition, so a whole conversation runs offline:
+
+    therapist = VirtualTherapist(live_client=FakeLiveClient(), streams=ScriptedAudioStreams([pcm, pcm]),
+                                 recognizer=FakeRecognizer(["I feel tired", "goodbye"]))
+"""
+import asyncio, base64, contextlib, json, threading, time, wave
+import numpy as np
+from recognizers import Recognizer
+from google.genai import errors, live, types
+
+RECEIVE_SAMPLE_RATE = 24000
+SEND_SAMPLE_RATE = 16000
+
+def tone_pcm(seconds, rate=RECEIVE_SAMPLE_RATE, amplitude=3000, period=48):
+    """Return a 16-bit mono square wave, enough to look like speech to the receiving side."""
+    half = period // 2
+    high = int(amplitude).to_bytes(2, "little", signed=True)
+    low = int(-amplitude).to_bytes(2, "little", signed=True)
+    cycle = high * half + low * half
+    samples = int(seconds * rate)
+    return (cycle * (samples // period + 1))[:samples * 2]
+
+def api_error(code=1011, message="Internal error encountered."):
+    """The error the live API raises for a websocket close or HTTP status code."""
+    return errors.APIError(code, {"error": {"code": code, "message": message, "status": "INTERNAL"}})
+
+def _next_fault(faults):
+    if callable(faults):
+        return faults()
+    return faults.pop(0) if faults else None
+
+class ScriptedAudioStreams:
+    """
+    Drop-in for therapist.AudioStreamManager. Each time the recorder resumes the microphone it
+    hears lead_in seconds of silence, the next of utterances (16-bit mono PCM) and then silence,
+    with Gaussian room noise of standard deviation noise, paced like a real device. The speaker
+    only keeps time; echo times what it plays is mixed back into the microphone, as in a room.
+    speed above 1 runs both faster than real time. turn_latencies collects, per turn, the seconds
+    from the end of the user's speech to the first therapist audio reaching the speaker.
+    """
+    def __init__(self, utterances, rate=SEND_SAMPLE_RATE, chunk_size=1024, lead_in=0.5, speed=1.0, noise=0, echo=0.0):
+        self.utterances = list(utterances)
+        self.rate = rate
+        self.chunk_size = chunk_size
+        self.lead_in = lead_in
+        self.speed = speed
+        # One second of noise, cycled through for every silent chunk
+        self.silence = np.random.default_rng(0).normal(0, noise, rate).astype(np.int16).tobytes() if noise else bytes(rate * 2)
+        self.echo = echo
+        self.echo_buffer = np.zeros(0, dtype=np.float64)
+        self.echo_lock = threading.Lock()
+        self.input_callback = None
+        self.stop_feeding = threading.Event()
+        self.speech_ended_at = None
+        self.turn_latencies = []
+        self.metrics = {"input_open": [], "output_open": [], "input_first_frame": [], "output_first_frame": []}
+
+    def resume_input(self, callback):
+        if self.input_callback is not None and not self.stop_feeding.is_set():
+            # Already feeding, e.g. a recording picking up after barge-in: same utterance, new listener
+            self.input_callback = callback
+            return
+        self.input_callback = callback
+        self.stop_feeding = threading.Event()
+        with self.echo_lock:
+            self.echo_buffer = self.echo_buffer[:0]
+        pcm = self.utterances.pop(0) if self.utterances else b""
+        threading.Thread(target=self._feed, args=(pcm, self.stop_feeding), daemon=True).start()
+
+    def _feed(self, pcm, stop):
+        chunk_bytes = self.chunk_size * 2
+        audio = self.silence[:int(self.lead_in * self.rate) * 2] + pcm
+        interval = self.chunk_size / self.rate / self.speed
+        due = time.perf_counter()
+        offset = 0
+        while True:
+            # A chunk is delivered once it has been "captured", like a callback-mode stream
+            due += interval
+            if stop.wait(max(0.0, due - time.perf_counter())):
+                return
+            chunk = audio[offset:offset + chunk_bytes]
+            offset += chunk_bytes
+            if pcm and offset >= len(audio) and len(chunk):
+                self.speech_ended_at = time.perf_counter()
+            callback = self.input_callback
+            if callback is None:
+                return
+            if len(chunk) < chunk_bytes:
+                start = offset % len(self.silence)
+                chunk += (self.silence[start:] + self.silence)[:chunk_bytes - len(chunk)]
+            if self.echo:
+                chunk = self._mix_echo(chunk)
+            callback(chunk, self.chunk_size, {}, 0)
+
+    def _mix_echo(self, chunk):
+        with self.echo_lock:
+            echo, self.echo_buffer = self.echo_buffer[:self.chunk_size], self.echo_buffer[self.chunk_size:]
+        samples = np.frombuffer(chunk, dtype=np.int16).astype(np.float64)
+        samples[:len(echo)] += echo
+        return np.clip(samples, -32768, 32767).astype(np.int16).tobytes()
+
+    def pause_input(self):
+        self.input_callback = None
+        self.stop_feeding.set()
+
+    def resume_output(self):
+        return self
+
+    def write(self, data):
+        if self.speech_ended_at is not None:
+            self.turn_latencies.append(time.perf_counter() - self.speech_ended_at)
+            self.speech_ended_at = None
+        if self.echo:
+            # The speaker's 24 kHz output as the 16 kHz microphone hears it
+            played = np.frombuffer(data, dtype=np.int16)
+            heard = np.interp(np.arange(0, len(played), RECEIVE_SAMPLE_RATE / self.rate), np.arange(len(played)), played)
+            with self.echo_lock:
+                self.echo_buffer = np.concatenate((self.echo_buffer, heard * self.echo))
+        time.sleep(len(data) / 2 / RECEIVE_SAMPLE_RATE / self.speed)
+
+    def output_queued(self):
+        pass
+
+    def output_written(self):
+        pass
+
+    def pause_output(self):
+        pass
+
+    def latency_summary(self):
+        return {name: None for name in self.metrics}
+
+    def close(self):
+        self.pause_input()
+
+class FakeRecognizer(Recognizer):
+    """
+    Stand-in speech recognition engine: answers with the next of transcripts (finally "goodbye")
+    after delay seconds. A batch engine reads the turn's WAV first like the real ones; with
+    streaming, the audio is fed while the user speaks and delay is the decode left at the end.
+    """
+    def __init__(self, transcripts=(), delay=0.3, streaming=False):
+        super().__init__()
+        self.transcripts = list(transcripts)
+        self.delay = delay
+        self.streaming = streaming
+
+    def _next(self):
+        time.sleep(self.delay)
+        return self.transcripts.pop(0) if self.transcripts else "goodbye"
+
+    def finish(self):
+        if not self.streaming:
+            return super().finish()
+        self.chunks = []
+        return self._next()
+
+    def transcribe(self, audio_file):
+        with wave.open(audio_file, 'rb') as wf:
+            wf.readframes(wf.getnframes())
+        return self._next()
+
+class FakeLiveSession:
+    """
+    One connected live session; replies to every finished turn with reply_pcm. Replies are
+    generated into a message queue like the service's websocket, so new user input while a
+    reply is still being generated interrupts it: interrupted, then turn_complete.
+    """
+    def __init__(self, reply_pcm=None, chunk_bytes=4800, chunk_delay=0.0, first_chunk_delay=0.0, transcripts=None,
+                 send_faults=None):
+        self.reply_pcm = reply_pcm if reply_pcm is not None else tone_pcm(1.0)
+        self.chunk_bytes = chunk_bytes
+        self.chunk_delay = chunk_delay
+        self.first_chunk_delay = first_chunk_delay
+        # Input transcriptions reported for successive audio turns, like AudioTranscriptionConfig would
+        self.transcripts = list(transcripts or [])
+        self.send_faults = send_faults if callable(send_faults) else list(send_faults or [])
+        self.sent = []
+        # JSON messages as the SDK wrote them to the socket
+        self.wire = []
+        self._sdk = live.AsyncSession(api_client=_FakeApiClient(), websocket=_Wire(self.wire))
+        self.audio_received = bytearray()
+        self.closed = False
+        self.interruptions = 0
+        self.replying = None
+        self._messages = asyncio.Queue()
+
+    async def send(self, input=None, end_of_turn=False):
+        await self._send(self._sdk.send, input, input=input, end_of_turn=end_of_turn)
+
+    async def send_client_content(self, turns=None, turn_complete=True):
+        await self._send(self._sdk.send_client_content, turns, turns=turns, turn_complete=turn_complete)
+
+    async def send_realtime_input(self, **kwargs):
+        await self._send(self._sdk.send_realtime_input, kwargs, **kwargs)
+
+    async def _send(self, method, sent, **kwargs):
+        if self.closed:
+            raise ConnectionError("Session is closed")
+        fault = _next_fault(self.send_faults)
+        if fault:
+            raise fault
+        await method(**kwargs)
+        self.sent.append(sent)
+        message = self.wire[-1]
+        realtime = message.get("realtime_input")
+        content = message.get("client_content")
+        # The SDK writes snake_case or camelCase keys depending on the method
+        if realtime is not None:
+            chunks = realtime.get("media_chunks") or ([realtime["audio"]] if realtime.get("audio") else [])
+            if chunks:
+                for chunk in chunks:
+                    self.audio_received += base64.urlsafe_b64decode(chunk["data"])
+                self._interrupt()
+            if realtime.get("audio_stream_end") or realtime.get("audioStreamEnd"):
+                self._reply(self.transcripts.pop(0) if self.transcripts else None)
+        elif content is not None:
+            # Client content always interrupts the turn being generated, and asks for a reply when complete
+            self._interrupt()
+            if content.get("turn_complete") or content.get("turnComplete"):
+                self._reply(None)
+
+    def _interrupt(self):
+        if self.replying and not self.replying.done():
+            self.replying.cancel()
+            self.interruptions += 1
+            self._messages.put_nowait(types.LiveServerMessage(server_content=types.LiveServerContent(interrupted=True)))
+            self._messages.put_nowait(types.LiveServerMessage(server_content=types.LiveServerContent(turn_complete=True)))
+
+    def _reply(self, transcript):
+        self.replying = asyncio.get_running_loop().create_task(self._generate(transcript))
+
+    async def _generate(self, transcript):
+        """Queue one model turn: optional input transcription, audio chunks, then turn_complete."""
+        if transcript:
+            self._messages.put_nowait(types.LiveServerMessage(server_content=types.LiveServerContent(
+                input_transcription=types.Transcription(text=transcript))))
+        await asyncio.sleep(self.first_chunk_delay)
+        for start in range(0, len(self.reply_pcm), self.chunk_bytes):
+            if start:
+                await asyncio.sleep(self.chunk_delay)
+            chunk = self.reply_pcm[start:start + self.chunk_bytes]
+            self._messages.put_nowait(types.LiveServerMessage(server_content=types.LiveServerContent(model_turn=types.Content(parts=[
+                types.Part(inline_data=types.Blob(data=chunk, mime_type=f"audio/pcm;rate={RECEIVE_SAMPLE_RATE}"))]))))
+        self._messages.put_nowait(types.LiveServerMessage(server_content=types.LiveServerContent(turn_complete=True)))
+
+    async def receive(self):
+        """Yield the messages of one model turn, up to and including turn_complete."""
+        while True:
+            message = await self._messages.get()
+            yield message
+            if message.server_content and message.server_content.turn_complete:
+                return
+
+    async def close(self):
+        self.closed = True
+        if self.replying:
+            self.replying.cancel()
+
+class _FakeApiClient:
+    vertexai = False
+
+class _Wire:
+    """Stands in for the websocket under the SDK's AsyncSession, keeping each message it sends."""
+    def __init__(self, messages):
+        self.messages = messages
+
+    async def send(self, text):
+        self.messages.append(json.loads(text))
+
+class _FakeLive:
+    def __init__(self, owner):
+        self.owner = owner
+
+    @contextlib.asynccontextmanager
+    async def connect(self, model=None, config=None):
+        await asyncio.sleep(self.owner.connect_delay)
+        self.owner.connect_attempts += 1
+        fault = _next_fault(self.owner.connect_faults)
+        if fault:
+            raise fault
+        session = FakeLiveSession(**self.owner.session_options)
+        session.model = model
+        session.config = config
+        self.owner.sessions.append(session)
+        try:
+            yield session
+        finally:
+            await session.close()
+
+class _FakeAio:
+    def __init__(self, owner):
+        self.live = _FakeLive(owner)
+
+class FakeLiveClient:
+    """Drop-in for genai.Client in VirtualTherapist(live_client=...); session_options go to FakeLiveSession."""
+    def __init__(self, connect_delay=0.0, connect_faults=None, **session_options):
+        self.connect_delay = connect_delay
+        self.connect_faults = connect_faults if callable(connect_faults) else list(connect_faults or [])
+        self.connect_attempts = 0
+        self.session_options = session_options
+        self.sessions = []
+        self.aio = _FakeAio(self)
@@ -0,0 +1,94 @@
+"""
+One reusable buffer per audio stream, so a turn's PCM is copied once on its way in and once
+into storage, instead of once per stage.
+
+    buffer = PCMBuffer(16000, max_seconds=120)
+    buffer.append(in_data)          # from the audio callback, into preallocated storage
+    buffer.samples()                # numpy int16 view, no copy
+    buffer.pcm()                    # memoryview of the raw PCM, no copy
+    buffer.wav()                    # memoryview of a complete WAV file: header written in place
+    buffer.clear()                  # next turn, same storage
+
+The WAV header is reserved in front of the samples, so the PCM and the WAV file are the same
+bytes. Views stay valid until clear(), after which they show the next turn; anything that
+keeps a turn (a turn store, the audio cache) must take its own copy.
+"""
+import struct
+import numpy as np
+
+WAV_HEADER_BYTES = 44
+SAMPLE_WIDTH = 2
+
+class PCMBuffer:
+    """16-bit PCM in a bytearray behind a reserved WAV header, with only the last max_seconds kept."""
+    def __init__(self, rate, channels=1, capacity_seconds=10, max_seconds=None):
+        self.rate = rate
+        self.channels = channels
+        frame = channels * SAMPLE_WIDTH
+        self.max_bytes = int(rate * max_seconds) * frame if max_seconds else None
+        capacity = self.max_bytes or int(rate * capacity_seconds) * frame
+        self.data = bytearray(WAV_HEADER_BYTES + capacity)
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    @property
+    def frames(self):
+        return self.length // (self.channels * SAMPLE_WIDTH)
+
+    def clear(self):
+        self.length = 0
+
+    def append(self, chunk):
+        """Copy in a chunk of bytes, bytearray or byte memoryview; called for every captured chunk."""
+        size = len(chunk)
+        if self.max_bytes and self.length + size > self.max_bytes:
+            if size >= self.max_bytes:
+                chunk, size = memoryview(chunk)[size - self.max_bytes:], self.max_bytes
+                self.length = 0
+            else:
+                # Drop the oldest quarter at once rather than shifting the buffer for every chunk
+                self._drop(max(self.length + size - self.max_bytes, self.max_bytes // 4))
+        start = WAV_HEADER_BYTES + self.length
+        if start + size > len(self.data):
+            self._grow(start + size)
+        self.data[start:start + size] = chunk
+        self.length += size
+
+    def _drop(self, count):
+        frame = self.channels * SAMPLE_WIDTH
+        count = min(self.length, -(-count // frame) * frame)
+        view = memoryview(self.data)
+        view[WAV_HEADER_BYTES:WAV_HEADER_BYTES + self.length - count] = \
+            view[WAV_HEADER_BYTES + count:WAV_HEADER_BYTES + self.length]
+        self.length -= count
+
+    def _grow(self, needed):
+        # A new array instead of resizing in place: a bytearray with views exported cannot be
+        # resized, and views already handed out keep pointing at the old storage
+        data = bytearray(max(needed, 2 * len(self.data)))
+        data[:WAV_HEADER_BYTES + self.length] = memoryview(self.data)[:WAV_HEADER_BYTES + self.length]
+        self.data = data
+
+    def _end(self, end):
+        """Byte length of the first end frames, or of everything."""
+        if end is None:
+            return self.length
+        return max(0, min(self.length, end * self.channels * SAMPLE_WIDTH))
+
+    def pcm(self, end=None):
+        """The PCM up to frame end (default: all of it), without copying."""
+        return memoryview(self.data)[WAV_HEADER_BYTES:WAV_HEADER_BYTES + self._end(end)]
+
+    def samples(self, end=None):
+        return np.frombuffer(self.pcm(end), dtype=np.int16)
+
+    def wav(self, end=None):
+        """A WAV file of the PCM up to frame end, written around the samples rather than copied."""
+        size = self._end(end)
+        byte_rate = self.rate * self.channels * SAMPLE_WIDTH
+        self.data[:WAV_HEADER_BYTES] = struct.pack(
+            "<4sI4s4sIHHIIHH4sI", b"RIFF", 36 + size, b"WAVE", b"fmt ", 16, 1, self.channels, self.rate,
+            byte_rate, self.channels * SAMPLE_WIDTH, SAMPLE_WIDTH * 8, b"data", size)
+        return memoryview(self.data)[:WAV_HEADER_BYTES + size]
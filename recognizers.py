@@ -0,0 +1,135 @@
+"""
+Speech recognition engines for user turns.
+
+Every engine takes the turn either whole or while it is being spoken:
+
+    recognizer = create_recognizer("vosk")
+    recognizer.start()
+    recognizer.feed(pcm_chunk)        # from the audio callback thread, for every captured chunk
+    text = recognizer.finish()        # blocking; the transcript of everything fed since start()
+
+    text = recognizer.transcribe(wav_file)   # a WAV path or file-like object, all at once
+
+"google" (the default) sends the finished turn to Google Speech Recognition, so its
+transcript arrives a network round trip after the turn ends. "vosk" decodes locally
+while the user speaks (pip install vosk, and point VOSK_MODEL at an unpacked model from
+https://alphacephei.com/vosk/models); finish() only has the last few chunks left to decode.
+"""
+import io, json, os, queue, threading, wave
+
+SAMPLE_RATE = 16000
+VOSK_MODEL = os.getenv("VOSK_MODEL", "vosk-model-small-en-us-0.15")
+NOT_UNDERSTOOD = "Couldn't understand the audio."
+
+class Recognizer:
+    """Base engine: feed() buffers the turn and finish() transcribes it whole once it has ended."""
+    streaming = False
+
+    def __init__(self, rate=SAMPLE_RATE):
+        self.rate = rate
+        self.chunks = []
+
+    def start(self):
+        self.chunks = []
+
+    def feed(self, pcm):
+        self.chunks.append(pcm)
+
+    def finish(self):
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(self.rate)
+            wf.writeframes(b''.join(self.chunks))
+        self.chunks = []
+        buffer.seek(0)
+        return self.transcribe(buffer)
+
+    def transcribe(self, audio_file):
+        raise NotImplementedError
+
+class GoogleRecognizer(Recognizer):
+    """Google Speech Recognition through speech_recognition, after the whole turn is recorded."""
+    def __init__(self, rate=SAMPLE_RATE):
+        super().__init__(rate)
+        import speech_recognition as sr
+        self.sr = sr
+        self.recognizer = sr.Recognizer()
+
+    def transcribe(self, audio_file):
+        with self.sr.AudioFile(audio_file) as source:
+            audio_data = self.recognizer.record(source)
+            try:
+                return self.recognizer.recognize_google(audio_data)
+            except self.sr.UnknownValueError:
+                return NOT_UNDERSTOOD
+            except self.sr.RequestError as e:
+                return f"Request error: {e}"
+
+class VoskRecognizer(Recognizer):
+    """
+    Local Kaldi decoding with vosk. Chunks fed during the turn are decoded by a worker thread
+    as they arrive, so the audio callback never waits on the decoder.
+    """
+    streaming = True
+
+    def __init__(self, model_path=VOSK_MODEL, rate=SAMPLE_RATE):
+        super().__init__(rate)
+        try:
+            import vosk
+        except ImportError:
+            raise ValueError("The vosk recognizer needs the vosk package: pip install vosk")
+        if not os.path.isdir(model_path):
+            raise ValueError(f"Vosk model not found at '{model_path}'; download one and set VOSK_MODEL")
+        vosk.SetLogLevel(-1)
+        self.vosk = vosk
+        self.model = vosk.Model(model_path)
+        self.pending = None
+        self.worker = None
+        self.decoder = None
+
+    def start(self):
+        self.decoder = self.vosk.KaldiRecognizer(self.model, self.rate)
+        self.pending = queue.Queue()
+        self.worker = threading.Thread(target=self._decode, args=(self.decoder, self.pending), daemon=True)
+        self.worker.start()
+
+    def _decode(self, decoder, pending):
+        while True:
+            pcm = pending.get()
+            if pcm is None:
+                return
+            decoder.AcceptWaveform(pcm)
+
+    def feed(self, pcm):
+        self.pending.put_nowait(bytes(pcm))
+
+    def finish(self):
+        """Decode whatever is still queued and return the turn's transcript."""
+        self.pending.put(None)
+        self.worker.join()
+        text = json.loads(self.decoder.FinalResult()).get("text", "")
+        self.worker = None
+        return text or NOT_UNDERSTOOD
+
+    def transcribe(self, audio_file):
+        with wave.open(audio_file, 'rb') as wf:
+            self.start()
+            while True:
+                pcm = wf.readframes(4000)
+                if not pcm:
+                    break
+                self.feed(pcm)
+        return self.finish()
+
+RECOGNIZER_BACKENDS = {
+    "google": GoogleRecognizer,
+    "vosk": VoskRecognizer,
+}
+
+def create_recognizer(backend="google", **options):
+    """Build the named speech recognition engine."""
+    if backend not in RECOGNIZER_BACKENDS:
+        raise ValueError(f"Unknown recognizer '{backend}', expected one of {', '.join(RECOGNIZER_BACKENDS)}")
+    return RECOGNIZER_BACKENDS[backend](**options)
@@ -0,0 +1,180 @@
+"""
+Retry decisions shared by every conversation in the process.
+
+classify() sorts an exception by type into TRANSIENT (try the same call again), RECONNECT
+(the live session is gone; open a new one) or FATAL (retrying cannot help). RetryPolicy
+retries TRANSIENT failures with capped exponential backoff and full jitter, so sessions that
+failed together do not retry together, and consults a CircuitBreaker shared by all sessions:
+after failure_threshold consecutive failures it fails calls immediately for reset_seconds,
+then lets a single trial call through before closing again. Callers that were turned away
+back off until then (CircuitOpenError.retry_after) instead of spending their attempts.
+"""
+import asyncio, random, sys, time
+
+TRANSIENT = "transient"
+RECONNECT = "reconnect"
+FATAL = "fatal"
+
+# WebSocket close codes the live API reports as APIError.code
+RECONNECT_CLOSE_CODES = {1000, 1001, 1006, 1011, 1012, 1013, 1014}
+TRANSIENT_HTTP_CODES = {408, 429}
+
+class RetryExhausted(Exception):
+    """Raised when a call still fails after the policy's last attempt; __cause__ is the last error."""
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the backend while the circuit breaker is open."""
+    def __init__(self, message, retry_after=0.0):
+        super().__init__(message)
+        # Seconds until the breaker lets a trial call through
+        self.retry_after = retry_after
+
+def classify(error):
+    """TRANSIENT, RECONNECT or FATAL for an exception raised by the live API or the network."""
+    if isinstance(error, (RetryExhausted, CircuitOpenError)):
+        return RECONNECT
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return TRANSIENT
+    if isinstance(error, (ConnectionError, EOFError)):
+        return RECONNECT
+    try:
+        from websockets.exceptions import ConnectionClosed
+        if isinstance(error, ConnectionClosed):
+            return RECONNECT
+    except ImportError:
+        pass
+    # Only look at google.genai's error types once something has failed; importing it is slow
+    errors = getattr(sys.modules.get("google.genai"), "errors", None)
+    if errors is not None and isinstance(error, errors.APIError):
+        code = error.code or 0
+        if code in RECONNECT_CLOSE_CODES:
+            return RECONNECT
+        if code >= 500 or code in TRANSIENT_HTTP_CODES:
+            return TRANSIENT
+        return FATAL
+    if isinstance(error, OSError):
+        return RECONNECT
+    return FATAL
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_seconds=5.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.metrics = {"opened": 0, "short_circuited": 0}
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        """
+        Raise CircuitOpenError unless a call may go to the backend now. Returns True if that call
+        is the half-open trial, which the caller must end with record_success, record_failure or release.
+        """
+        state = self.state
+        if state == "closed":
+            return False
+        if state == "half_open" and not self.trial_running:
+            self.trial_running = True
+            return True
+        self.metrics["short_circuited"] += 1
+        raise CircuitOpenError(f"Backend circuit open after {self.failures} consecutive failures",
+                               max(0.0, self.opened_at + self.reset_seconds - self.clock()))
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    def release(self):
+        """End a trial call that neither proved nor disproved the backend's health."""
+        self.trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_running = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                self.metrics["opened"] += 1
+            # A failed trial call keeps the circuit open for another full period
+            self.opened_at = self.clock()
+
+class RetryPolicy:
+    def __init__(self, max_attempts=5, base_delay=0.5, max_delay=8.0, multiplier=2.0, breaker=None,
+                 retry_on=(TRANSIENT,), rng=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.breaker = breaker
+        self.retry_on = retry_on
+        self.rng = rng or random.Random()
+        self.metrics = {"calls": 0, "attempts": 0, "retries": 0, "successes": 0, "failures": 0, "gave_up": 0,
+                        "retry_delay_seconds": 0.0, "by_class": {TRANSIENT: 0, RECONNECT: 0, FATAL: 0}}
+
+    def delay(self, retry):
+        """Seconds to wait before retry number retry (0-based): full jitter over the capped exponential."""
+        return self.rng.uniform(0, min(self.max_delay, self.base_delay * self.multiplier ** retry))
+
+    def should_retry(self, error):
+        return classify(error) in self.retry_on
+
+    def record_failure(self, error):
+        """Count a failure against the metrics and the breaker, once per error; returns its class."""
+        kind = classify(error)
+        # Re-raised to the reconnect policy after the send policy counted it: one failure, not two
+        if getattr(error, "failure_recorded", False):
+            return kind
+        error.failure_recorded = True
+        self.metrics["failures"] += 1
+        self.metrics["by_class"][kind] += 1
+        if self.breaker:
+            # A fatal error is about the request, not the backend's health
+            self.breaker.release() if kind == FATAL else self.breaker.record_failure()
+        return kind
+
+    def record_success(self):
+        self.metrics["successes"] += 1
+        if self.breaker:
+            self.breaker.record_success()
+
+    async def backoff(self, retry, error=None):
+        """Sleep before retry number retry; after a CircuitOpenError, also wait for the breaker to reopen."""
+        delay = self.delay(retry) + getattr(error, "retry_after", 0.0)
+        self.metrics["retries"] += 1
+        self.metrics["retry_delay_seconds"] += delay
+        await asyncio.sleep(delay)
+
+    async def call(self, func, *args, **kwargs):
+        """Await func(*args, **kwargs), retrying failures the policy retries; raise RetryExhausted at the end."""
+        self.metrics["calls"] += 1
+        for attempt in range(self.max_attempts):
+            trial = self.breaker.allow() if self.breaker else False
+            self.metrics["attempts"] += 1
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                kind = self.record_failure(e)
+                if kind not in self.retry_on:
+                    raise
+                if attempt + 1 >= self.max_attempts:
+                    self.metrics["gave_up"] += 1
+                    raise RetryExhausted(f"Max retries reached after {self.max_attempts} attempts: {e}") from e
+                print(f"{type(e).__name__} during call, retrying... ({attempt + 1}/{self.max_attempts})")
+                await self.backoff(attempt)
+                continue
+            except BaseException:
+                # Cancelled: the trial proved nothing, and a trial left running keeps the breaker shut
+                if trial:
+                    self.breaker.release()
+                raise
+            self.record_success()
+            return result
@@ -0,0 +1,100 @@
+"""
+Live sessions connected ahead of time, so a new conversation skips the connection handshake.
+
+    pool = LiveSessionPool(get_client(), MODEL, live_config(), size=2)
+    pool.start()                                   # on the event loop the sessions will be used from
+    therapist = VirtualTherapist(session_pool=pool)
+
+A session is handed out once and closed when its conversation ends; the pool immediately
+connects a replacement in the background. Sessions idle for longer than max_idle_seconds
+are dropped rather than handed out, since the service may already have closed them.
+"""
+import asyncio, collections, contextlib, time
+
+class LiveSessionPool:
+    def __init__(self, client, model, config, size=2, max_idle_seconds=300, retry_seconds=5):
+        self.client = client
+        self.model = model
+        self.config = config
+        self.size = size
+        self.max_idle_seconds = max_idle_seconds
+        self.retry_seconds = retry_seconds
+        # (context manager, session, connected_at), oldest on the left
+        self.ready = collections.deque()
+        self.connecting = 0
+        self.closed = False
+        self.tasks = set()
+        self.metrics = {"hits": 0, "misses": 0, "connect_errors": 0, "expired": 0}
+
+    def start(self):
+        """Begin filling the pool; call from the event loop that will use the sessions."""
+        self.closed = False
+        self._refill()
+
+    def _refill(self):
+        while not self.closed and len(self.ready) + self.connecting < self.size:
+            self.connecting += 1
+            task = asyncio.get_running_loop().create_task(self._fill_one())
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _connect(self):
+        context = self.client.aio.live.connect(model=self.model, config=self.config)
+        return context, await context.__aenter__()
+
+    async def _fill_one(self):
+        try:
+            context, session = await self._connect()
+        except Exception as e:
+            self.metrics["connect_errors"] += 1
+            print(f"Error pre-connecting live session: {e}")
+            # Back off before trying again, rather than hammering a service that is refusing us
+            await asyncio.sleep(self.retry_seconds)
+            self.connecting -= 1
+            self._refill()
+            return
+        self.connecting -= 1
+        if self.closed:
+            await self._disconnect(context)
+            return
+        self.ready.append((context, session, time.monotonic()))
+
+    async def _disconnect(self, context, exc_info=(None, None, None)):
+        try:
+            return await context.__aexit__(*exc_info)
+        except Exception as e:
+            print(f"Error closing live session: {e}")
+
+    async def _take(self):
+        """A ready session if one is fresh enough, otherwise a freshly connected one."""
+        while self.ready:
+            context, session, connected_at = self.ready.popleft()
+            if time.monotonic() - connected_at <= self.max_idle_seconds:
+                self.metrics["hits"] += 1
+                return context, session
+            self.metrics["expired"] += 1
+            await self._disconnect(context)
+        self.metrics["misses"] += 1
+        return await self._connect()
+
+    @contextlib.asynccontextmanager
+    async def session(self):
+        """Use like client.aio.live.connect(): yields a connected session and closes it afterwards."""
+        context, session = await self._take()
+        self._refill()
+        try:
+            yield session
+        except BaseException as e:
+            if not await self._disconnect(context, (type(e), e, e.__traceback__)):
+                raise
+        else:
+            await self._disconnect(context)
+
+    async def close(self):
+        """Stop refilling and disconnect every session still waiting in the pool."""
+        self.closed = True
+        for task in list(self.tasks):
+            task.cancel()
+        while self.ready:
+            context, _, _ = self.ready.popleft()
+            await self._disconnect(context)
@@ -1,6 +1,7 @@
 import pyaudio
 import numpy as np
 import time
+from vad import VoiceActivityDetector
 
 # Audio settings
 FORMAT = pyaudio.paInt16
@@ -9,6 +10,7 @@ RATE = 16000  # Adjust as needed
 CHUNK = 1024
 
 p = pyaudio.PyAudio()
+vad = VoiceActivityDetector(CHUNK, RATE, use_zcr=True)
 
 # Open the stream for recording
 stream = p.open(format=FORMAT,
@@ -22,14 +24,9 @@ print("Recording... Press Ctrl+C to stop.")
 try:
     while True:
         data = stream.read(CHUNK, exception_on_overflow=False)
-        # Convert byte data to numpy array and cast to float32 to avoid overflow
-        audio_data = np.frombuffer(data, dtype=np.int16).astype(np.float32)
-        # Compute RMS only if audio_data is not empty
-        if audio_data.size > 0:
-            rms = np.sqrt(np.mean(audio_data ** 2))
-        else:
-            rms = 0
-        print(f"RMS: {rms:.2f}")
+        # The detector computes RMS from integer energy, without a float copy of the chunk
+        speech = vad.is_speech(np.frombuffer(data, dtype=np.int16))
+        print(f"RMS: {vad.rms:.2f}  ZCR: {vad.zcr:.3f}  {'speech' if speech else ''}")
         time.sleep(0.1)  # Delay to make the output readable
 except KeyboardInterrupt:
     print("Recording stopped.")
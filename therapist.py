@@ -1,14 +1,34 @@
-import asyncio, os, sys, time, wave, threading
-import pyaudio, numpy as np, speech_recognition as sr
+import asyncio, collections, io, os, sys, time, threading, queue
+import pyaudio, numpy as np
+from vad import Endpointer, BargeInDetector
+from recognizers import create_recognizer
+from turn_store import create_turn_store, wav_bytes, TurnIndex, TurnWriter
+from pcm_buffer import PCMBuffer, WAV_HEADER_BYTES
+from audio_codec import configured_codecs, variant_key
+from audio_cache import AudioCache
+from turn_metrics import TURN_METRICS
+from retry_policy import RetryPolicy, CircuitBreaker, RetryExhausted, CircuitOpenError, TRANSIENT, RECONNECT
 from dotenv import load_dotenv
-from google import genai
-from google.genai import types
 
-# Load API key and configure client
+# Load settings; the API key is read when the client is first needed
 load_dotenv()
-API_KEY = os.getenv("API_KEY")
-client = genai.Client(api_key=API_KEY, http_options={'api_version': 'v1alpha'})
 MODEL = "models/gemini-2.0-flash-exp"
+VOICE_NAME = "Kore"
+THERAPIST_INSTRUCTION = (
+    "You are an empathetic and supportive virtual therapist. "
+    "Listen actively, respond with empathy, ask open-ended questions, "
+    "and provide supportive feedback. Maintain a professional and approachable tone, "
+    "and use evidence-based therapeutic approaches. "
+    "If the user says just 'goodbye' or 'end session', just say 'Hope I was able to help you, you can always come back to me for help' and end the session."
+)
+# Fixed prompts whose spoken replies are kept in the audio cache, see audio_cache.py
+GREETING_PROMPT = "Hello, I'm here as your virtual therapist. How are you feeling?"
+FAREWELL_PROMPT = "The client wants to end our session."
+AUDIO_CACHE_ENABLED = os.getenv("AUDIO_CACHE", "on") != "off"
+
+# One breaker for every conversation in the process: when the backend is failing, new
+# sends and connects fail fast instead of piling more retries onto it, see retry_policy.py
+BACKEND_BREAKER = CircuitBreaker()
 
 # Audio settings
 FORMAT = pyaudio.paInt16
@@ -16,68 +36,566 @@ CHANNELS = 1
 SEND_SAMPLE_RATE = 16000
 RECEIVE_SAMPLE_RATE = 24000
 CHUNK_SIZE = 1024
+PLAYBACK_QUEUE_CHUNKS = 64      # Bound on therapist audio buffered ahead of the speaker
+MAX_RECORDING_SECONDS = 120     # Capacity of the capture ring buffer; older audio is overwritten
+CACHED_CHUNK_BYTES = 4800       # Cached turns are played in 100 ms chunks, like the live service sends them
+SPECULATION_SILENCE_CHUNKS = 4  # Silence (about 0.25 s) after which a turn is transcribed speculatively
+SPECULATIVE_TRANSCRIPTION = os.getenv("SPECULATIVE_TRANSCRIPTION", "on") != "off"
+# Full duplex: keep listening while the therapist speaks and let the user interrupt it
+BARGE_IN = os.getenv("BARGE_IN", "off") == "on"
+BARGE_IN_LEAD_CHUNKS = 2        # Audio kept from before barge-in was detected, so the first syllable is not lost
 
-# Audio directories
+# Audio directories, created by the disk turn stores when they are first used
 AUDIO_DIR = "user_audio"
 THERAPIST_AUDIO_DIR = "therapist_audio"
-os.makedirs(AUDIO_DIR, exist_ok=True)
-os.makedirs(THERAPIST_AUDIO_DIR, exist_ok=True)
+# Where recorded turns are kept: "memory" (default), "disk" or "mmap", see turn_store.py
+TURN_STORE = os.getenv("TURN_STORE", "memory")
+# Encodings stored next to each turn's WAV for the web page, see audio_codec.py
+TURN_CODECS = os.getenv("TURN_CODECS", "opus")
+# Speech recognition of user turns: "google" (default) or "vosk", see recognizers.py
+RECOGNIZER = os.getenv("RECOGNIZER", "google")
 
-# Initialize PyAudio
-p = pyaudio.PyAudio()
+# Importing google.genai takes a few hundred milliseconds and PyAudio() probes every audio
+# device, so both are built on first use and shared from then on
+_client = None
+_audio = None
+_audio_cache = None
+_factory_lock = threading.Lock()
 
-class VirtualTherapist:
+def get_client():
+    """The shared Gemini client."""
+    global _client
+    with _factory_lock:
+        if _client is None:
+            from google import genai
+            _client = genai.Client(api_key=os.getenv("API_KEY"), http_options={'api_version': 'v1alpha'})
+        return _client
+
+def get_audio():
+    """The shared PyAudio instance."""
+    global _audio
+    with _factory_lock:
+        if _audio is None:
+            _audio = pyaudio.PyAudio()
+        return _audio
+
+def get_audio_cache():
+    """The shared cache of canned therapist turns, or None when AUDIO_CACHE=off."""
+    global _audio_cache
+    with _factory_lock:
+        if _audio_cache is None and AUDIO_CACHE_ENABLED:
+            _audio_cache = AudioCache()
+        return _audio_cache
+
+def close_audio():
+    """Terminate PyAudio if it was ever started."""
+    global _audio
+    with _factory_lock:
+        if _audio is not None:
+            _audio.terminate()
+            _audio = None
+
+class AudioStreamManager:
+    """
+    Opens the microphone and speaker streams once per session and pauses them between turns.
+    Reopening a device costs tens of milliseconds and clicks audibly; stop_stream/start_stream
+    on an open stream does neither. Open and first-frame latencies are kept in self.metrics (seconds).
+    """
     def __init__(self):
-        """Initialize the virtual therapist in audio mode only."""
-        instruction_text = (
-            "You are an empathetic and supportive virtual therapist. "
-            "Listen actively, respond with empathy, ask open-ended questions, "
-            "and provide supportive feedback. Maintain a professional and approachable tone, "
-            "and use evidence-based therapeutic approaches. "
-            "If the user says just 'goodbye' or 'end session', just say 'Hope I was able to help you, you can always come back to me for help' and end the session."
-        )
-        system_instruction = types.Content(parts=[types.Part(text=instruction_text)])
-        self.config = types.LiveConnectConfig(
-            response_modalities=["audio"],
-            system_instruction=system_instruction,
-            speech_config=types.SpeechConfig(
-                voice_config=types.VoiceConfig(
-                    prebuilt_voice_config=types.PrebuiltVoiceConfig(voice_name="Kore")
-                )
+        self.input_stream = None
+        self.output_stream = None
+        self.input_callback = None
+        self.input_resumed_at = None
+        self.output_resumed_at = None
+        self.metrics = {"input_open": [], "output_open": [], "input_first_frame": [], "output_first_frame": []}
+
+    def resume_input(self, callback):
+        """Route microphone chunks to callback(in_data, frame_count, time_info, status), opening the stream on first use."""
+        self.input_callback = callback
+        self.input_resumed_at = time.perf_counter()
+        if self.input_stream is None:
+            self.input_stream = get_audio().open(format=FORMAT, channels=CHANNELS, rate=SEND_SAMPLE_RATE, input=True,
+                                       frames_per_buffer=CHUNK_SIZE, stream_callback=self._dispatch_input)
+            self.metrics["input_open"].append(time.perf_counter() - self.input_resumed_at)
+        elif self.input_stream.is_stopped():
+            self.input_stream.start_stream()
+
+    def pause_input(self):
+        self.input_callback = None
+        if self.input_stream is not None and not self.input_stream.is_stopped():
+            self.input_stream.stop_stream()
+
+    def _dispatch_input(self, in_data, frame_count, time_info, status):
+        callback = self.input_callback
+        if callback is None:
+            return (None, pyaudio.paContinue)
+        if self.input_resumed_at is not None:
+            self.metrics["input_first_frame"].append(time.perf_counter() - self.input_resumed_at)
+            self.input_resumed_at = None
+        return callback(in_data, frame_count, time_info, status)
+
+    def resume_output(self):
+        """Return the speaker stream ready for writing, opening it on first use."""
+        self.output_resumed_at = None
+        if self.output_stream is None:
+            started = time.perf_counter()
+            self.output_stream = get_audio().open(format=FORMAT, channels=CHANNELS, rate=RECEIVE_SAMPLE_RATE, output=True)
+            self.metrics["output_open"].append(time.perf_counter() - started)
+        elif self.output_stream.is_stopped():
+            self.output_stream.start_stream()
+        return self.output_stream
+
+    def output_queued(self):
+        """Called when the first chunk of a turn is handed to the writer; starts the first-frame clock."""
+        self.output_resumed_at = time.perf_counter()
+
+    def output_written(self):
+        """Called by the writer after each chunk; records the first one after output_queued."""
+        if self.output_resumed_at is not None:
+            self.metrics["output_first_frame"].append(time.perf_counter() - self.output_resumed_at)
+            self.output_resumed_at = None
+
+    def pause_output(self):
+        if self.output_stream is not None and not self.output_stream.is_stopped():
+            self.output_stream.stop_stream()
+
+    def latency_summary(self):
+        """Mean of each metric in milliseconds, or None where nothing was measured yet."""
+        return {name: (sum(values) / len(values) * 1000 if values else None) for name, values in self.metrics.items()}
+
+    def close(self):
+        for stream in (self.input_stream, self.output_stream):
+            if stream is not None:
+                try:
+                    if not stream.is_stopped():
+                        stream.stop_stream()
+                    stream.close()
+                except Exception as e:
+                    print(f"Error closing audio stream: {e}")
+        self.input_stream = None
+        self.output_stream = None
+
+class AudioPlayer:
+    """
+    Plays PCM through the session's output stream from a dedicated writer thread.
+    Blocking stream.write calls never run on the asyncio event loop; the bounded queue
+    lets network receive run ahead of the speaker without buffering a whole reply.
+    """
+    def __init__(self, streams, max_chunks=PLAYBACK_QUEUE_CHUNKS):
+        self.streams = streams
+        self.chunks = queue.Queue(maxsize=max_chunks)
+        self.stream = None
+        self.thread = None
+        self.first_chunk = True
+        # Bumped by flush(); chunks queued under an older epoch are dropped instead of played
+        self.epoch = 0
+        # Called from the writer thread with each chunk about to be played, e.g. as the barge-in echo reference
+        self.on_write = None
+
+    def start(self):
+        """Resume the speaker for a new turn, starting the writer thread on first use."""
+        self.stream = self.streams.resume_output()
+        self.first_chunk = True
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._write_loop, daemon=True)
+            self.thread.start()
+
+    def _write_loop(self):
+        while True:
+            item = self.chunks.get()
+            try:
+                if item is None:
+                    return
+                epoch, data = item
+                if epoch != self.epoch:
+                    continue
+                if self.on_write:
+                    self.on_write(data)
+                self.stream.write(data)
+                self.streams.output_written()
+            except Exception as e:
+                print(f"Error playing audio: {e}")
+            finally:
+                self.chunks.task_done()
+
+    async def play(self, data):
+        """Queue a chunk for playback, waiting off the loop only while the buffer is full."""
+        if self.first_chunk:
+            self.first_chunk = False
+            self.streams.output_queued()
+        # Tagged when queued, so a put still waiting on a full buffer during flush() lands stale
+        item = (self.epoch, data)
+        try:
+            self.chunks.put_nowait(item)
+        except queue.Full:
+            await asyncio.to_thread(self.chunks.put, item)
+
+    def flush(self):
+        """Drop every chunk still waiting to be played, or still being queued; the one being written finishes."""
+        self.epoch += 1
+        while True:
+            try:
+                self.chunks.get_nowait()
+            except queue.Empty:
+                return
+            self.chunks.task_done()
+
+    async def finish(self):
+        """Wait for queued audio to finish playing, then pause the speaker until the next turn."""
+        await asyncio.to_thread(self.chunks.join)
+        self.streams.pause_output()
+
+    async def close(self):
+        """Stop the writer thread at the end of the session."""
+        if self.thread:
+            await asyncio.to_thread(self.chunks.put, None)
+            await asyncio.to_thread(self.thread.join)
+            self.thread = None
+
+class AudioRecorder:
+    """
+    Captures microphone audio from the session's callback-mode input stream into a preallocated PCMBuffer.
+    End of speech is detected inside the audio callback, which resolves an asyncio future
+    directly, so the waiting coroutine wakes immediately instead of polling a recording thread.
+    Between recordings, watch() listens for the user talking over the therapist.
+    """
+    def __init__(self, streams, rate=SEND_SAMPLE_RATE, max_seconds=MAX_RECORDING_SECONDS):
+        self.streams = streams
+        self.rate = rate
+        self.buffer = PCMBuffer(rate, CHANNELS, max_seconds=max_seconds)
+
+        # Learns the room's noise floor and shortens the trailing-silence wait for clear speech
+        self.endpointer = Endpointer(CHUNK_SIZE, rate)
+
+        self.loop = None
+        self.done = None
+        self.on_chunk = None
+        self.on_silence = None
+        self.silence_reported = False
+        # Barge-in watch during playback; the callback and the coroutines take turns under lock
+        self.lock = threading.RLock()
+        self.watching = False
+        self.detector = None
+        self.on_barge_in = None
+        self.barged_in = False
+        self.recent = collections.deque()
+        # Trailing silence heard when the turn ended and when the callback saw it, for endpoint_latency
+        self.trailing_silence = 0.0
+        self.ended_at = None
+        self.endpoint_latency = None
+
+    def watch(self, detector, on_barge_in):
+        """
+        Listen while the therapist speaks and call on_barge_in on the event loop once detector
+        hears the user talking over it. Capture then carries on into the buffer, so that
+        record(resume=True) continues the utterance the user has already started.
+        """
+        with self.lock:
+            self.loop = asyncio.get_running_loop()
+            self.detector = detector
+            self.on_barge_in = on_barge_in
+            self.barged_in = False
+            self.recent = collections.deque(maxlen=detector.min_speech_chunks + BARGE_IN_LEAD_CHUNKS)
+            self.watching = True
+            detector.reset()
+        self.streams.resume_input(self._callback)
+
+    def stop_watching(self):
+        """Stop listening for barge-in; after one, the capture keeps running for record(resume=True)."""
+        with self.lock:
+            if self.barged_in:
+                return
+            self.watching = False
+        self.streams.pause_input()
+
+    async def record(self, on_chunk=None, on_silence=None, resume=False):
+        """
+        Record one utterance and return its 16-bit PCM as a view of the buffer, valid until the next recording.
+        on_silence, if given, is called on the event loop with the number of samples captured up
+        to the end of speech once SPECULATION_SILENCE_CHUNKS of silence follow it, and with None
+        if speech then resumes. With resume after a barge-in, the utterance starts with the audio
+        captured since the user began talking, which on_chunk receives first as one block.
+        """
+        with self.lock:
+            self.loop = asyncio.get_running_loop()
+            self.done = self.loop.create_future()
+            resuming = resume and self.barged_in
+            if resuming:
+                if on_chunk:
+                    on_chunk(bytes(self.buffer.pcm()))
+            else:
+                self.buffer.clear()
+            self.watching = False
+            self.barged_in = False
+            self.on_chunk = on_chunk
+            self.on_silence = on_silence
+            self.silence_reported = False
+            self.endpointer.reset(speech_started=resuming)
+            self.ended_at = None
+            self.endpoint_latency = None
+        self.streams.resume_input(self._callback)
+        try:
+            await self.done
+        finally:
+            self.streams.pause_input()
+        if self.ended_at is not None:
+            # From the end of speech to the coroutine holding the recording
+            self.endpoint_latency = self.trailing_silence + time.perf_counter() - self.ended_at
+        return self.buffer.pcm()
+
+    def wav(self, end=None):
+        """
+        The utterance so far as WAV bytes, up to sample end if given; only the last max_seconds
+        survive a longer utterance. The one copy a turn needs: the buffer is reused next recording.
+        """
+        with self.lock:
+            return bytes(self.buffer.wav(end))
+
+    def _resolve(self, error=None):
+        if self.done.done():
+            return
+        if error:
+            self.done.set_exception(error)
+        else:
+            self.done.set_result(None)
+
+    def _watch(self, in_data):
+        samples = np.frombuffer(in_data, dtype=np.int16)
+        if self.barged_in:
+            # The user is still talking; keep it for record(resume=True)
+            self.buffer.append(in_data)
+            return
+        self.recent.append(in_data)
+        if self.detector.process(samples):
+            self.barged_in = True
+            self.buffer.clear()
+            for chunk in self.recent:
+                self.buffer.append(chunk)
+            self.loop.call_soon_threadsafe(self.on_barge_in)
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        with self.lock:
+            return self._process(in_data)
+
+    def _process(self, in_data):
+        if self.watching:
+            try:
+                self._watch(in_data)
+            except Exception as e:
+                print(f"\nError watching for barge-in: {e}")
+            return (None, pyaudio.paContinue)
+        if self.done is None or self.done.done():
+            return (None, pyaudio.paContinue)
+        try:
+            samples = np.frombuffer(in_data, dtype=np.int16)
+            self.buffer.append(in_data)
+            if self.on_chunk:
+                self.on_chunk(in_data)
+            ended = self.endpointer.process(samples)
+            if self.on_silence and not ended:
+                silent = self.endpointer.silent_chunks
+                if silent == SPECULATION_SILENCE_CHUNKS and not self.silence_reported:
+                    self.silence_reported = True
+                    self.loop.call_soon_threadsafe(self.on_silence, self.buffer.frames - silent * len(samples))
+                elif silent == 0 and self.silence_reported:
+                    self.silence_reported = False
+                    self.loop.call_soon_threadsafe(self.on_silence, None)
+
+            # Optional: Visual feedback on recording volume
+            vol = int(min(30, self.endpointer.vad.level / 100))
+            sys.stdout.write(f"\rRecording: [{'|' * vol}{' ' * (30 - vol)}]")
+            sys.stdout.flush()
+
+            if ended:
+                self.trailing_silence = self.endpointer.silent_chunks * self.endpointer.chunk_seconds
+                self.ended_at = time.perf_counter()
+                self.loop.call_soon_threadsafe(self._resolve)
+        except Exception as e:
+            # An exception would silently stop PortAudio's callback; hand it to the waiting coroutine
+            self.loop.call_soon_threadsafe(self._resolve, e)
+        # Keep the stream running; the manager pauses it once the coroutine has the result
+        return (None, pyaudio.paContinue)
+
+def live_config(realtime_input=False):
+    """Live session settings: the therapist's system instruction, an audio reply and VOICE_NAME."""
+    from google.genai import types
+    system_instruction = types.Content(parts=[types.Part(text=THERAPIST_INSTRUCTION)])
+    config = types.LiveConnectConfig(
+        response_modalities=["audio"],
+        system_instruction=system_instruction,
+        speech_config=types.SpeechConfig(
+            voice_config=types.VoiceConfig(
+                prebuilt_voice_config=types.PrebuiltVoiceConfig(voice_name=VOICE_NAME)
             )
         )
-        self.recognizer = sr.Recognizer()
-    
-    async def send_with_retry(self, session, user_input, retries=5):
-        """Attempt to send a message, retrying if an internal error occurs."""
-        for attempt in range(retries):
+    )
+    # The words of a reply are kept with its cached audio, to replay into later sessions' history
+    config.output_audio_transcription = types.AudioTranscriptionConfig()
+    if realtime_input:
+        # Have the server transcribe streamed audio so "goodbye" can still end the session
+        config.input_audio_transcription = types.AudioTranscriptionConfig()
+    return config
+
+END_SESSION_TERMS = ["goodbye", "end session", "exit", "quit"]
+
+class VirtualTherapist:
+    def __init__(self, realtime_input=False, live_client=None, audio_dir=AUDIO_DIR, therapist_audio_dir=THERAPIST_AUDIO_DIR,
+                 turn_store=TURN_STORE, codecs=TURN_CODECS, session_pool=None, audio_cache=None,
+                 send_policy=None, reconnect_policy=None, metrics=TURN_METRICS, streams=None, recognizer=RECOGNIZER,
+                 speculative=SPECULATIVE_TRANSCRIPTION, barge_in=BARGE_IN):
+        """
+        Initialize the virtual therapist in audio mode only.
+        With realtime_input, microphone audio is streamed straight into the live session
+        instead of being saved to disk and transcribed with Google Speech Recognition.
+        live_client replaces the shared Gemini client from get_client(), e.g. with fake_live.FakeLiveClient;
+        the shared client is only created when a session connects.
+        session_pool, a session_pool.LiveSessionPool built with the same live_config, supplies
+        already connected sessions instead of connecting when the conversation starts.
+        Turns are published to self.user_turns and self.therapist_turns, built by the turn_store
+        backend, encoded in every available codec named in codecs, and numbered in self.turns,
+        all on the self.turn_writer thread. audio_dir and therapist_audio_dir, used only by the
+        disk and mmap backends, let several therapists in one process keep their files apart.
+        The greeting and farewell play from audio_cache (default: the shared get_audio_cache(),
+        False to disable) once they have been heard.
+        send_policy retries a failed send on the same session; reconnect_policy decides when a
+        failed session is replaced. Both default to jittered exponential backoff on BACKEND_BREAKER.
+        Stage timings of every turn go to metrics, a turn_metrics.TurnMetrics.
+        User turns are transcribed by recognizer, a recognizers.py backend name or engine; a
+        streaming engine is fed while the user speaks. With speculative, a batch engine starts
+        on a turn as soon as the user pauses, and the result is kept if the pause ends the turn.
+        A dropped speculation cannot stop its recognizer call, which still costs a request, so no
+        new one starts until it returns.
+        With barge_in, the microphone stays open during replies and the user can interrupt them.
+        streams replaces the PyAudio microphone and speaker, e.g. with fake_live.ScriptedAudioStreams.
+        """
+        self.config = live_config(realtime_input)
+        self.realtime_input = realtime_input
+        self.session_pool = session_pool
+        self.audio_cache = get_audio_cache() if audio_cache is None else audio_cache
+        self.send_policy = send_policy or RetryPolicy(max_attempts=5, base_delay=0.5, max_delay=8.0, breaker=BACKEND_BREAKER)
+        self.reconnect_policy = reconnect_policy or RetryPolicy(max_attempts=5, base_delay=1.0, max_delay=30.0,
+                                                                breaker=BACKEND_BREAKER, retry_on=(TRANSIENT, RECONNECT))
+        self.metrics = metrics
+        self.client = live_client
+        self.audio_dir = audio_dir
+        self.therapist_audio_dir = therapist_audio_dir
+        self.user_turns = create_turn_store(turn_store, audio_dir)
+        self.therapist_turns = create_turn_store(turn_store, therapist_audio_dir)
+        self.turns = TurnIndex()
+        # Turns the bounded stores evict leave the index too, so no page is handed a URL that 404s
+        self.user_turns.on_evict = self.therapist_turns.on_evict = self.turns.remove
+        # Turns are stored, encoded and announced on the writer's thread; queued_turns names them
+        self.turn_writer = TurnWriter()
+        self.queued_turns = 0
+        self.codecs = configured_codecs(codecs)
+        self.recognizer = create_recognizer(recognizer) if isinstance(recognizer, str) else recognizer
+        self.speculative = speculative
+        # Recognizer calls on worker threads, including speculations whose task was cancelled
+        self.transcriptions_running = 0
+        self.transcription_lock = threading.Lock()
+        self.streams = streams or AudioStreamManager()
+        self.player = AudioPlayer(self.streams)
+        self.recorder = AudioRecorder(self.streams)
+        # Reused for every reply: chunks are appended once and published without joining them
+        self.reply_audio = PCMBuffer(RECEIVE_SAMPLE_RATE, CHANNELS)
+        self.barge_in = barge_in
+        self.barge_in_detector = BargeInDetector(CHUNK_SIZE, SEND_SAMPLE_RATE)
+        self.interrupted = False
+        self.pending_reply = None
+        if barge_in:
+            self.player.on_write = lambda data: self.barge_in_detector.reference(np.frombuffer(data, dtype=np.int16))
+        self.listeners = []
+        self.input_transcript = ""
+        self.output_transcript = ""
+
+    def add_listener(self, callback):
+        """Register a callback invoked as callback(event, data) when a turn is ready."""
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    def notify(self, event, **data):
+        """Push an event to every registered listener."""
+        for callback in list(self.listeners):
             try:
-                await session.send(input=user_input, end_of_turn=True)
-                return
+                callback(event, data)
             except Exception as e:
-                if "internal error" in str(e).lower():
-                    print(f"Internal error during send, retrying... ({attempt+1}/{retries})")
-                    await asyncio.sleep(1)
-                else:
-                    raise e
-        raise Exception("Max retries reached for send.")
+                print(f"Error notifying listener: {e}")
+    
+    async def send_with_retry(self, session, user_input):
+        """
+        Send a message, retrying transient failures under self.send_policy. While other
+        conversations' failures hold the shared breaker open, the send waits on this session,
+        which is still connected, instead of failing into a reconnect.
+        """
+        with self.metrics.time("send"):
+            for wait in range(self.send_policy.max_attempts):
+                try:
+                    return await self.send_policy.call(session.send, input=user_input, end_of_turn=True)
+                except CircuitOpenError as e:
+                    if wait + 1 >= self.send_policy.max_attempts:
+                        raise
+                    print(f"{e}; waiting to send on the same session...")
+                    await self.send_policy.backoff(wait, e)
 
     async def start_session(self):
-        max_session_retries = 5
+        """Run a full conversation, releasing the session's audio streams however it ends."""
+        try:
+            await self.run_conversation()
+        finally:
+            if self.pending_reply:
+                self.pending_reply.cancel()
+            await self.player.close()
+            await self.turn_writer.close()
+            print(f"\nAudio stream latency (ms): {self.streams.latency_summary()}")
+            self.streams.close()
+
+    async def run_conversation(self):
+        max_session_retries = self.reconnect_policy.max_attempts
         session_retry = 0
         while session_retry < max_session_retries:
+            greeting_task = None
+            trial = False
             try:
                 print("\n=== Virtual Therapist Session (AUDIO MODE) ===")
                 print("Share your thoughts and I'll respond. Say 'goodbye' or 'end session' to finish.\n")
-                async with client.aio.live.connect(model=MODEL, config=self.config) as session:
-                    # Send initial greeting with retry
-                    await self.send_with_retry(session, "Hello, I'm here as your virtual therapist. How are you feeling?")
-                    await self.handle_response(session)
+                if self.reconnect_policy.breaker:
+                    # Fail fast while the backend is known to be down; the backoff below spaces the retries
+                    trial = self.reconnect_policy.breaker.allow()
+                if self.session_pool:
+                    connection = self.session_pool.session()
+                else:
+                    connection = (self.client or get_client()).aio.live.connect(model=MODEL, config=self.config)
+                # A cached greeting starts playing at once, while the live session connects
+                greeting = self.cached_turn(GREETING_PROMPT)
+                greeting_task = asyncio.create_task(self.play_cached_turn(greeting)) if greeting else None
+                async with connection as session:
+                    self.reconnect_policy.record_success()
+                    trial = False
+                    if greeting_task:
+                        await self.replay_history(session, GREETING_PROMPT, greeting)
+                        await greeting_task
+                    else:
+                        # Send initial greeting with retry
+                        await self.speak_prompt(session, GREETING_PROMPT)
                     while True:
-                        user_input = await self.get_audio_input()
-                        if user_input and any(term in user_input.lower() for term in ["goodbye", "end session", "exit", "quit"]):
-                            await self.send_with_retry(session, "The client wants to end our session.")
+                        if self.realtime_input:
+                            # The reply to streamed audio is the model's farewell when the user said goodbye
+                            await self.stream_audio_input(session)
                             await self.handle_response(session)
+                            if any(term in self.input_transcript.lower() for term in END_SESSION_TERMS):
+                                return
+                            continue
+                        user_input = await self.get_audio_input()
+                        if user_input and any(term in user_input.lower() for term in END_SESSION_TERMS):
+                            farewell = self.cached_turn(FAREWELL_PROMPT)
+                            if farewell:
+                                # The session is about to close, so there is no history to keep in step
+                                await self.play_cached_turn(farewell)
+                            else:
+                                await self.speak_prompt(session, FAREWELL_PROMPT)
                             return
                         if user_input:
                             try:
@@ -90,150 +608,350 @@ class VirtualTherapist:
                             print("I didn't catch that. Please try again.")
                 break  # Exit if session completes successfully.
             except Exception as e:
-                if "internal error" in str(e).lower() or "max retries reached" in str(e).lower():
+                if greeting_task and not greeting_task.done():
+                    await greeting_task
+                if not isinstance(e, (RetryExhausted, CircuitOpenError)):
+                    # Errors re-raised from send_with_retry were counted by the send policy and are skipped
+                    self.reconnect_policy.record_failure(e)
+                if self.reconnect_policy.should_retry(e):
                     session_retry += 1
-                    print(f"Error encountered, reconnecting session... ({session_retry}/{max_session_retries})")
-                    await asyncio.sleep(1)
+                    print(f"{type(e).__name__}: {e}. Reconnecting session... ({session_retry}/{max_session_retries})")
+                    await self.reconnect_policy.backoff(session_retry - 1, e)
                 else:
                     print(f"Unexpected error: {e}")
                     break
+            except BaseException:
+                # Cancelled while connecting: end the breaker's trial, or it stays half-open for good
+                if trial:
+                    self.reconnect_policy.breaker.release()
+                raise
         if session_retry >= max_session_retries:
             print("Session failed after maximum retries.")
+        # Listeners hear about the last turns before the session ends
+        await self.turn_writer.flush()
         self.cleanup_audio_directory()
+        self.notify("session_ended")
         print("\n=== Session Ended ===")
     
+    async def publish_turn(self, role, pcm, rate, wav=None):
+        """
+        Queue a recorded turn on self.turn_writer, which stores it as WAV, appends it to the turn
+        index, stores its encoding in each of self.codecs and then tells listeners. Returns once
+        the turn is queued; that only waits when the writer is already TURN_WRITER_MAX_PENDING behind.
+        wav, if given, must be the WAV of pcm; either may be a view of a buffer reused for the next
+        turn, so the turn keeps its own copy.
+        """
+        store = self.therapist_turns if role == "therapist" else self.user_turns
+        self.queued_turns += 1
+        # Named and numbered in the index by one counter, so a key always matches its seq
+        seq = self.queued_turns
+        key = f"{'therapist_output' if role == 'therapist' else 'user_input'}_{seq}.wav"
+        if wav is not None:
+            wav = bytes(wav)
+            pcm = memoryview(wav)[WAV_HEADER_BYTES:]
+        else:
+            pcm = bytes(pcm)
+
+        def write():
+            with self.metrics.time("wav_write"):
+                store.put(key, wav or wav_bytes(pcm, rate, CHANNELS, pyaudio.get_sample_size(FORMAT)))
+            entry = self.turns.append(role, key, seq)
+            entry["encodings"] = ["wav"]
+            for codec in self.codecs:
+                try:
+                    store.put(variant_key(key, codec), codec.encode(pcm, rate))
+                    entry["encodings"].append(codec.name)
+                except Exception as e:
+                    print(f"Error encoding turn as {codec.name}: {e}")
+            return lambda: self.notify(f"{role}_audio", filename=key, seq=entry["seq"])
+        await self.turn_writer.submit(write)
+
     def cleanup_audio_directory(self):
-        """Remove all files in the user and therapist audio directories."""
+        """Drop every stored user and therapist turn, deleting their files for the disk backends."""
         print("\nCleaning up audio files...")
-        for filename in os.listdir(AUDIO_DIR):
-            file_path = os.path.join(AUDIO_DIR, filename)
-            if os.path.isfile(file_path):
-                os.unlink(file_path)
-        for filename in os.listdir(THERAPIST_AUDIO_DIR):
-            file_path = os.path.join(THERAPIST_AUDIO_DIR, filename)
-            if os.path.isfile(file_path):
-                os.unlink(file_path)
-        print(f"All files removed from {AUDIO_DIR} and {THERAPIST_AUDIO_DIR}.")
+        def clear():
+            self.user_turns.clear()
+            self.therapist_turns.clear()
+            # Otherwise /turns and /get_audio_files would keep listing URLs of deleted turns
+            self.turns.clear()
+            print("All recorded turns removed.")
+        # Turns still queued are dropped; a turn being written is cleared once it lands, without waiting for it here
+        self.turn_writer.discard(clear)
     
+    def cached_turn(self, prompt):
+        """The cached spoken reply to a fixed prompt, or None."""
+        if not self.audio_cache:
+            return None
+        try:
+            return self.audio_cache.get(MODEL, VOICE_NAME, prompt, THERAPIST_INSTRUCTION)
+        except Exception as e:
+            print(f"Error reading audio cache: {e}")
+            return None
+
+    async def speak_prompt(self, session, prompt):
+        """Send a fixed prompt, play the reply and cache it for later sessions."""
+        await self.send_with_retry(session, prompt)
+        pcm = await self.play_audio_response(session)
+        if pcm and self.audio_cache:
+            try:
+                self.audio_cache.put(MODEL, VOICE_NAME, prompt, THERAPIST_INSTRUCTION, pcm, RECEIVE_SAMPLE_RATE,
+                                     self.output_transcript or None)
+            except Exception as e:
+                print(f"Error writing audio cache: {e}")
+
+    async def replay_history(self, session, prompt, cached):
+        """Tell the live session the prompt was asked and answered, without asking for a reply."""
+        from google.genai import types
+        reply = cached.transcript or prompt
+        # send() rejects a list of Content; client content takes the turns as history
+        await session.send_client_content(turns=[types.Content(role="user", parts=[types.Part(text=prompt)]),
+                                                 types.Content(role="model", parts=[types.Part(text=reply)])],
+                                          turn_complete=False)
+
+    async def play_cached_turn(self, cached):
+        """Play a cached therapist turn exactly as a live one, then publish it."""
+        print("\nTherapist> [Speaking...]")
+        self.player.start()
+        self.notify("therapist_audio_start", sample_rate=cached.rate)
+        try:
+            for start in range(0, len(cached.pcm), CACHED_CHUNK_BYTES):
+                chunk = cached.pcm[start:start + CACHED_CHUNK_BYTES]
+                self.notify("therapist_audio_chunk", data=chunk)
+                await self.player.play(chunk)
+        finally:
+            await self.player.finish()
+            self.notify("therapist_audio_end")
+            print("[Done speaking]")
+        await self.publish_turn("therapist", cached.pcm, cached.rate)
+
     async def handle_response(self, session):
         """Handle the audio response from the model."""
         await self.play_audio_response(session)
     
     async def play_audio_response(self, session):
-        """Play and save the audio response from the model."""
+        """
+        Play and save the audio response from the model.
+        Returns the reply's PCM if the model completed its turn, otherwise None.
+        With barge_in, the microphone stays open meanwhile, and the user talking over the
+        therapist cuts the reply short, see interrupt().
+        """
+        if self.pending_reply:
+            # The rest of an interrupted reply comes before this one on the session
+            await self.pending_reply
+            self.pending_reply = None
         print("\nTherapist> [Speaking...]")
-        output_stream = p.open(format=FORMAT, channels=CHANNELS, rate=RECEIVE_SAMPLE_RATE, output=True)
-        audio_chunks = []
+        self.player.start()
+        audio = self.reply_audio
+        audio.clear()
+        self.output_transcript = ""
+        self.interrupted = False
+        reply = asyncio.create_task(self._receive_reply(session, audio))
+        if self.barge_in:
+            self.recorder.watch(self.barge_in_detector, lambda: self.interrupt(reply))
         try:
-            async for response in session.receive():
-                if getattr(response, "data", None):
-                    audio_chunks.append(response.data)
-                    try:
-                        output_stream.write(response.data)
-                    except Exception as e:
-                        print(f"Error playing audio: {e}")
-                if getattr(getattr(response, "server_content", None), "turn_complete", False):
-                    break
-        except Exception as e:
-            print(f"\nError processing audio: {e}")
+            await asyncio.wait({reply})
         finally:
-            output_stream.close()
+            reply.cancel()
+            # Barge-in is still heard while the last queued chunks play out
+            await self.player.finish()
+            if self.barge_in:
+                self.recorder.stop_watching()
+            if audio:
+                self.notify("therapist_audio_end")
             print("[Done speaking]")
-        if audio_chunks:
-            file_path = os.path.join(THERAPIST_AUDIO_DIR, f"therapist_output_{int(time.time())}.wav")
+        completed = not reply.cancelled() and reply.result()
+        if self.interrupted:
+            if not self.realtime_input:
+                try:
+                    # Client content stops the model generating the rest of the reply
+                    await session.send_client_content(turn_complete=False)
+                except Exception as e:
+                    print(f"Error interrupting the reply: {e}")
+            self.pending_reply = asyncio.create_task(self._discard_reply(session))
+        if audio:
             try:
-                with wave.open(file_path, 'wb') as wf:
-                    wf.setnchannels(CHANNELS)
-                    wf.setsampwidth(p.get_sample_size(FORMAT))
-                    wf.setframerate(RECEIVE_SAMPLE_RATE)
-                    wf.writeframes(b''.join(audio_chunks))
-                print(f"Audio saved to {file_path}")
+                await self.publish_turn("therapist", audio.pcm(), RECEIVE_SAMPLE_RATE, bytes(audio.wav()))
+                print(f"Audio queued as turn {self.queued_turns}")
             except Exception as e:
                 print(f"Error saving audio: {e}")
-    
+        # A view of reply_audio, valid until the next reply
+        return audio.pcm() if completed and audio else None
+
+    async def _receive_reply(self, session, audio):
+        """Receive one model turn into the PCMBuffer audio, playing it as it arrives; True if the turn completed."""
+        started = time.perf_counter()
+        try:
+            async for response in session.receive():
+                if getattr(response, "data", None):
+                    if not audio:
+                        self.metrics.observe("first_audio", time.perf_counter() - started)
+                        self.notify("therapist_audio_start", sample_rate=RECEIVE_SAMPLE_RATE)
+                    audio.append(response.data)
+                    self.notify("therapist_audio_chunk", data=response.data)
+                    await self.player.play(response.data)
+                server_content = getattr(response, "server_content", None)
+                transcription = getattr(server_content, "input_transcription", None)
+                if getattr(transcription, "text", None):
+                    self.input_transcript += transcription.text
+                output_transcription = getattr(server_content, "output_transcription", None)
+                if getattr(output_transcription, "text", None):
+                    self.output_transcript += output_transcription.text
+                if getattr(server_content, "turn_complete", False):
+                    self.metrics.observe("turn_complete", time.perf_counter() - started)
+                    return True
+        except Exception as e:
+            print(f"\nError processing audio: {e}")
+        return False
+
+    def interrupt(self, reply):
+        """
+        Barge-in, on the event loop: silence the speaker at once and stop taking the reply.
+        play_audio_response then tells the service to stop generating with an empty client
+        content message; in realtime mode the user's speech, streamed next, does that instead.
+        What the model still sends of the reply is read and dropped by _discard_reply.
+        """
+        self.player.flush()
+        if not reply.done():
+            self.interrupted = True
+            reply.cancel()
+        print("\n[Interrupted]")
+        self.notify("therapist_interrupted")
+
+    async def _discard_reply(self, session):
+        try:
+            async for response in session.receive():
+                server_content = getattr(response, "server_content", None)
+                transcription = getattr(server_content, "input_transcription", None)
+                if getattr(transcription, "text", None):
+                    self.input_transcript += transcription.text
+                if getattr(server_content, "turn_complete", False):
+                    break
+        except Exception as e:
+            print(f"Error discarding interrupted reply: {e}")
+
+    async def record_until_silence(self, on_chunk=None, on_silence=None):
+        """
+        Record microphone audio until silence follows speech and return the captured PCM bytes.
+        on_chunk, if given, is called from the audio callback thread with each raw chunk;
+        on_silence as described in AudioRecorder.record.
+        """
+        # After a barge-in, the utterance the user started over the therapist carries on
+        pcm = await self.recorder.record(on_chunk, on_silence, resume=self.barge_in)
+        if self.recorder.endpoint_latency is not None:
+            self.metrics.observe("endpoint", self.recorder.endpoint_latency)
+        return pcm
+
     async def get_audio_input(self):
         """
         Record audio input and transcribe it.
         Automatically terminates recording after detecting silence once speech has started.
         """
         print("Listening... (Recording will start automatically and stop when silence is detected)")
-        frames = []
-        recording_active = threading.Event()
-        recording_active.set()
-
-        # Parameters for silence detection
-        silence_threshold = 200         # RMS threshold; adjust based on your mic sensitivity/environment
-        silence_chunk_limit = 32        # Number of consecutive silent chunks to consider as "end of speech"
-
-        def record_audio():
-            stream = p.open(format=FORMAT, channels=CHANNELS, rate=SEND_SAMPLE_RATE, input=True, frames_per_buffer=CHUNK_SIZE)
-            speech_started = False
-            silent_chunks = 0
-            try:
-                while recording_active.is_set():
-                    data = stream.read(CHUNK_SIZE, exception_on_overflow=False)
-                    frames.append(data)
-                    audio_data = np.frombuffer(data, dtype=np.int16).astype(np.float32)
-                    rms = np.sqrt(np.mean(audio_data**2)) if audio_data.size > 0 else 0
-
-                    if rms > silence_threshold:
-                        speech_started = True
-                        silent_chunks = 0
-                    else:
-                        if speech_started:
-                            silent_chunks += 1
-
-                    # Optional: Visual feedback on recording volume
-                    vol = int(min(30, np.abs(audio_data).mean() / 100))
-                    sys.stdout.write(f"\rRecording: [{'|' * vol}{' ' * (30 - vol)}]")
-                    sys.stdout.flush()
+        if self.recognizer.streaming:
+            # The engine decodes while the user speaks, leaving only the last chunks once the turn ends
+            self.recognizer.start()
+            pcm = await self.record_until_silence(on_chunk=self.recognizer.feed)
+            print("\nRecording stopped. Transcribing...")
+            text, _ = await asyncio.gather(self.transcribe_audio(),
+                                           self.publish_turn("user", pcm, SEND_SAMPLE_RATE, self.recorder.wav()))
+            print(f"Transcript: {text}")
+            return text
+        speculation = None
 
-                    if speech_started and silent_chunks >= silence_chunk_limit:
-                        recording_active.clear()
-                        break
-            finally:
-                stream.stop_stream()
-                stream.close()
-
-        t = threading.Thread(target=record_audio, daemon=True)
-        t.start()
+        def on_silence(end):
+            # Transcribe what was said before the pause while the endpointer is still waiting;
+            # if the user carries on, the guess is dropped
+            nonlocal speculation
+            if speculation:
+                speculation.cancel()
+                self.metrics.increment("speculation_cancelled")
+                speculation = None
+            if end is None:
+                return
+            if self.transcriptions_running:
+                # A cancelled speculation's recognizer call still runs on its thread; one at a time
+                self.metrics.increment("speculation_skipped")
+                return
+            speculation = asyncio.create_task(self.transcribe_audio(io.BytesIO(self.recorder.wav(end))))
+            self.metrics.increment("speculation_started")
 
-        while t.is_alive():
-            await asyncio.sleep(0.1)
+        try:
+            await self.record_until_silence(on_silence=on_silence if self.speculative else None)
+        except BaseException:
+            if speculation:
+                speculation.cancel()
+            raise
         print("\nRecording stopped. Transcribing...")
 
-        temp_filename = os.path.join(AUDIO_DIR, f"user_input_{int(time.time())}.wav")
-        with wave.open(temp_filename, 'wb') as wf:
-            wf.setnchannels(CHANNELS)
-            wf.setsampwidth(p.get_sample_size(FORMAT))
-            wf.setframerate(SEND_SAMPLE_RATE)
-            wf.writeframes(b''.join(frames))
-        
-        text = await self.transcribe_audio(temp_filename)
+        # The turn's one copy out of the recorder; the recognizer, the store and the codecs share it
+        wav = self.recorder.wav()
+        pcm = memoryview(wav)[WAV_HEADER_BYTES:]
+        if speculation:
+            # The pause that started it ended the turn, so it heard all the speech there was
+            self.metrics.increment("speculation_committed")
+            transcription = speculation
+        else:
+            # Recognizers read WAV from any file-like object, so the turn never touches disk
+            transcription = self.transcribe_audio(io.BytesIO(wav))
+        # Transcription runs while the turn is being encoded for the web page
+        text, _ = await asyncio.gather(transcription, self.publish_turn("user", pcm, SEND_SAMPLE_RATE, wav))
         print(f"Transcript: {text}")
         return text
-    
-    async def transcribe_audio(self, audio_file):
-        """Transcribe an audio file to text using Google Speech Recognition."""
+
+    async def stream_audio_input(self, session):
+        """
+        Stream 16 kHz PCM chunks into the live session while the user is speaking.
+        Nothing is written to disk; the model hears the audio directly and replies when it ends.
+        """
+        print("Listening... (Audio is streamed to the therapist as you speak)")
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        self.input_transcript = ""
+
+        async def send_chunks():
+            while True:
+                data = await chunks.get()
+                if data is None:
+                    break
+                await session.send(input={"data": data, "mime_type": f"audio/pcm;rate={SEND_SAMPLE_RATE}"})
+            # Not send(input=LiveClientRealtimeInput(...)): the legacy send() only forwards media_chunks
+            await session.send_realtime_input(audio_stream_end=True)
+
+        sender = asyncio.create_task(send_chunks())
+        try:
+            await self.record_until_silence(on_chunk=lambda data: loop.call_soon_threadsafe(chunks.put_nowait, data))
+        finally:
+            chunks.put_nowait(None)
+            await sender
+        print("\nRecording stopped. Waiting for the therapist...")
+
+    async def transcribe_audio(self, audio_file=None):
+        """
+        Transcribe a WAV file path or file-like object to text with self.recognizer, or with
+        audio_file None, finish the streaming transcription of the turn just recorded.
+        """
         try:
-            return await asyncio.to_thread(self._perform_transcription, audio_file)
+            with self.metrics.time("transcribe"):
+                return await asyncio.to_thread(self._perform_transcription, audio_file)
         except Exception as e:
             print(f"Error transcribing: {e}")
             return "Transcription failed. Please try again."
     
     def _perform_transcription(self, audio_file):
-        with sr.AudioFile(audio_file) as source:
-            audio_data = self.recognizer.record(source)
-            try:
-                return self.recognizer.recognize_google(audio_data)
-            except sr.UnknownValueError:
-                return "Couldn't understand the audio."
-            except sr.RequestError as e:
-                return f"Request error: {e}"
+        with self.transcription_lock:
+            self.transcriptions_running += 1
+        try:
+            if audio_file is None:
+                return self.recognizer.finish()
+            return self.recognizer.transcribe(audio_file)
+        finally:
+            with self.transcription_lock:
+                self.transcriptions_running -= 1
 
 def list_audio_devices():
     """List available audio devices."""
     print("\n=== Available Audio Devices ===")
+    p = get_audio()
     for i in range(p.get_device_count()):
         info = p.get_device_info_by_index(i)
         print(f"Device {i}: {info['name']} | In: {info['maxInputChannels']} | Out: {info['maxOutputChannels']} | Rate: {info['defaultSampleRate']}")
@@ -242,19 +960,19 @@ def list_audio_devices():
 def cleanup_audio():
     """Remove all files in the user and therapist audio directories."""
     print("\nCleaning up audio files...")
-    for filename in os.listdir(AUDIO_DIR):
-        file_path = os.path.join(AUDIO_DIR, filename)
-        if os.path.isfile(file_path):
-            os.unlink(file_path)
-    for filename in os.listdir(THERAPIST_AUDIO_DIR):
-        file_path = os.path.join(THERAPIST_AUDIO_DIR, filename)
-        if os.path.isfile(file_path):
-            os.unlink(file_path)
+    for directory in (AUDIO_DIR, THERAPIST_AUDIO_DIR):
+        if not os.path.isdir(directory):
+            continue
+        for filename in os.listdir(directory):
+            file_path = os.path.join(directory, filename)
+            if os.path.isfile(file_path):
+                os.unlink(file_path)
     print(f"All files removed from {AUDIO_DIR} and {THERAPIST_AUDIO_DIR}.")
 
 async def main():
     list_audio_devices()
-    therapist = VirtualTherapist()
+    # --realtime streams microphone audio into the live session instead of transcribing it first
+    therapist = VirtualTherapist(realtime_input="--realtime" in sys.argv)
     await therapist.start_session()
     cleanup_audio()
 
@@ -262,4 +980,4 @@ if __name__ == "__main__":
     try:
         asyncio.run(main())
     finally:
-        p.terminate()
\ No newline at end of file
+        close_audio()
\ No newline at end of file
@@ -0,0 +1,245 @@
+"""
+ASGI entry point for the web interface, for production use.
+
+    python therapist_asgi.py                 # uvicorn on port 3000, or $PORT
+    uvicorn therapist_asgi:app --port 3000   # or any other ASGI server
+
+Serves the same page and routes as therapist_web.py. The route handlers are async and
+run each session's VirtualTherapist coroutine as a task on the server's own event loop,
+so requests need neither the Flask worker threads nor the hand-made background loop.
+The sessions and page come from web_sessions.py, which starts no threads or signal handlers.
+
+Sessions live in the memory of the process that started them, so the server runs a single
+worker: uvicorn workers share one listening socket, and the kernel would hand a session's
+/events, /stream and /audio requests to workers that have never heard of it. To scale out,
+run one instance per port (PORT) behind a proxy that routes each session_id to one instance.
+"""
+import asyncio, contextlib, json, os
+from email.utils import formatdate, parsedate_to_datetime
+from starlette.applications import Starlette
+from starlette.datastructures import Headers
+from starlette.responses import HTMLResponse, JSONResponse, Response, StreamingResponse, FileResponse
+from starlette.routing import Route
+from starlette.staticfiles import NotModifiedResponse
+
+from audio_codec import negotiate
+from web_sessions import (HTML_CONTENT, EVENT_KEEPALIVE_SECONDS, AUDIO_CACHE_SECONDS, METRICS_CONTENT_TYPE, registry,
+                          metrics_text, cleanup_audio_directories)
+
+class AsyncSubscriber:
+    """Event queue for one /events client; put() is safe to call from any thread, like queue.Queue.put."""
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+
+    def put(self, item):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, item)
+
+async def requested_session(request):
+    """Look up the session named by the session_id query parameter or JSON body."""
+    session_id = request.query_params.get('session_id')
+    if not session_id and request.method == 'POST':
+        try:
+            session_id = (await request.json() or {}).get('session_id')
+        except (ValueError, AttributeError):
+            session_id = None
+    return registry.get(session_id) if session_id else None
+
+async def index(request):
+    return HTMLResponse(HTML_CONTENT)
+
+async def start_session(request):
+    try:
+        session = registry.create()
+        if session is None:
+            return JSONResponse({'status': 'error', 'message': 'Server is at capacity, please try again shortly'})
+        session.active = True
+        session.future = asyncio.create_task(session.run())
+        return JSONResponse({'status': 'success', 'message': 'Session started', 'session_id': session.session_id})
+    except Exception as e:
+        print(f"Error starting session: {e}")
+        return JSONResponse({'status': 'error', 'message': f'Error starting session: {str(e)}'})
+
+async def end_session(request):
+    session = await requested_session(request)
+    if not session or not session.active:
+        return JSONResponse({'status': 'error', 'message': 'No active session'})
+    try:
+        session.therapist.cleanup_audio_directory()
+        return JSONResponse({'status': 'success', 'message': 'Say "goodbye" to end the session'})
+    except Exception as e:
+        print(f"Error ending session: {e}")
+        return JSONResponse({'status': 'error', 'message': f'Error ending session: {str(e)}'})
+
+async def get_audio_files(request):
+    session = await requested_session(request)
+    if not session:
+        return JSONResponse({'therapist_audio': None, 'user_audio': None, 'session_active': False})
+    return JSONResponse({**session.latest_audio(), 'session_active': session.active})
+
+async def turns(request):
+    """Turns recorded after sequence number `after` (default 0, i.e. all), oldest first."""
+    session = await requested_session(request)
+    if not session:
+        return JSONResponse({'turns': [], 'last_seq': 0, 'session_active': False})
+    try:
+        after = int(request.query_params.get('after', 0))
+    except ValueError:
+        after = 0
+    entries = session.therapist.turns.after(after)
+    return JSONResponse({
+        'turns': [session.turn_json(entry) for entry in entries],
+        'last_seq': entries[-1]['seq'] if entries else max(after, 0),
+        'session_active': session.active
+    })
+
+async def events(request):
+    """Server-sent event stream pushing session and audio updates as they happen."""
+    session = await requested_session(request)
+    if not session:
+        return Response('event: session\ndata: {"active": false}\n\n', media_type='text/event-stream')
+    subscriber = AsyncSubscriber()
+    with session.subscribers_lock:
+        session.subscribers.append(subscriber)
+
+    def format_event(event, data):
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    async def generate():
+        try:
+            yield format_event('session', {'active': session.active})
+            latest = session.therapist.turns.last('therapist')
+            if latest:
+                yield format_event('therapist_audio', {'url': session.turn_url(latest), 'seq': latest['seq']})
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(subscriber.queue.get(), EVENT_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_event(event, data)
+        finally:
+            with session.subscribers_lock:
+                session.subscribers.remove(subscriber)
+
+    return StreamingResponse(generate(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+async def therapist_stream(request):
+    """Raw 16-bit mono PCM of a therapist turn, sent chunk by chunk as the model generates it."""
+    session = registry.get(request.path_params['session_id'])
+    stream = session.current_stream if session else None
+    if not stream or stream.stream_id != request.path_params['stream_id']:
+        return Response("Stream not found", status_code=404)
+    # iter_chunks blocks between chunks, so Starlette iterates it in its thread pool
+    return StreamingResponse(stream.iter_chunks(), media_type='audio/pcm',
+                             headers={'Cache-Control': 'no-cache', 'X-Sample-Rate': str(stream.sample_rate)})
+
+def is_not_modified(response_headers, request_headers):
+    """True when the client's cached copy, named by If-None-Match or If-Modified-Since, is current."""
+    if_none_match = request_headers.get('if-none-match')
+    if if_none_match:
+        etag = response_headers['etag']
+        return etag in [tag.strip(' W/') for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+    if_modified_since = request_headers.get('if-modified-since')
+    if if_modified_since:
+        try:
+            return parsedate_to_datetime(response_headers['last-modified']) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def requested_range(range_header, size):
+    """(start, end) inclusive of a single "bytes=" range; None to send everything, False if unsatisfiable."""
+    if not range_header or not range_header.startswith('bytes=') or ',' in range_header:
+        return None
+    first, _, last = range_header[6:].strip().partition('-')
+    try:
+        if first:
+            start, end = int(first), int(last) if last else size - 1
+        else:
+            start, end = max(0, size - int(last)), size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        return False
+    return start, min(end, size - 1)
+
+def serve_session_audio(request, kind):
+    session = registry.get(request.path_params['session_id'])
+    if not session:
+        return Response("File not found", status_code=404)
+    store = session.therapist.therapist_turns if kind == 'therapist' else session.therapist.user_turns
+    # Only names the store holds are served, so a crafted filename can never reach another path
+    filename = request.path_params['filename']
+    if not store.info(filename):
+        return Response("File not found", status_code=404)
+    # The same URL serves WAV or a compressed encoding of the turn, chosen by ?format= or Accept
+    key, codec = negotiate(filename, request.query_params.get('format'), request.headers.get('accept'), store.info)
+    info = store.info(key)
+    headers = {'Cache-Control': f'private, max-age={AUDIO_CACHE_SECONDS}', 'Vary': 'Accept'}
+    path = store.path(key)
+    if path:
+        # FileResponse streams the file (or uses the server's pathsend extension) and answers Range requests
+        response = FileResponse(path, media_type=codec.mimetype, stat_result=os.stat(path), headers=headers)
+        if is_not_modified(response.headers, request.headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+    headers.update({'ETag': f'"{info.etag}"', 'Last-Modified': formatdate(info.created, usegmt=True), 'Accept-Ranges': 'bytes'})
+    if is_not_modified(Headers(headers), request.headers):
+        return NotModifiedResponse(headers)
+    data = store.get(key)
+    byte_range = requested_range(request.headers.get('range'), info.size)
+    if byte_range is False:
+        return Response(status_code=416, headers={'Content-Range': f'bytes */{info.size}'})
+    if byte_range:
+        start, end = byte_range
+        headers['Content-Range'] = f'bytes {start}-{end}/{info.size}'
+        return Response(bytes(data[start:end + 1]), status_code=206, media_type=codec.mimetype, headers=headers)
+    return Response(bytes(data), media_type=codec.mimetype, headers=headers)
+
+async def therapist_audio(request):
+    return serve_session_audio(request, 'therapist')
+
+async def user_audio(request):
+    return serve_session_audio(request, 'user')
+
+async def metrics(request):
+    return Response(metrics_text(), headers={'Content-Type': METRICS_CONTENT_TYPE})
+
+async def session_status(request):
+    session = await requested_session(request)
+    return JSONResponse({'active': bool(session and session.active), 'sessions': len(registry), 'max_sessions': registry.max_sessions})
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # Connect the first live sessions on the server's own loop, where the conversations run
+    registry.start_pool()
+    yield
+    print("\nShutting down server...")
+    await registry.close_pool()
+    cleanup_audio_directories()
+
+app = Starlette(routes=[
+    Route('/', index),
+    Route('/start_session', start_session, methods=['POST']),
+    Route('/end_session', end_session, methods=['POST']),
+    Route('/get_audio_files', get_audio_files),
+    Route('/turns', turns),
+    Route('/events', events),
+    Route('/stream/therapist/{session_id}/{stream_id:int}', therapist_stream),
+    Route('/audio/therapist/{session_id}/{filename}', therapist_audio),
+    Route('/audio/user/{session_id}/{filename}', user_audio),
+    Route('/metrics', metrics),
+    Route('/session_status', session_status),
+], lifespan=lifespan)
+
+if __name__ == '__main__':
+    import uvicorn
+    port = int(os.getenv("PORT", "3000"))
+    print("\n=== Virtual Therapist Web Interface (ASGI) ===")
+    print(f"Starting server at http://localhost:{port}")
+    print("Use Ctrl+C to exit")
+    # One worker only: sessions are not shared between processes, see the module docstring
+    uvicorn.run("therapist_asgi:app", host='0.0.0.0', port=port, workers=1)
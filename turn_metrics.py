@@ -0,0 +1,102 @@
+"""
+Where a conversational turn's time goes, as Prometheus histograms.
+
+Every VirtualTherapist records into the process-wide TURN_METRICS:
+
+    with TURN_METRICS.time("transcribe"):
+        text = await self.transcribe_audio(audio)
+
+and the web servers publish them on /metrics in the Prometheus text format, one
+therapist_turn_stage_seconds series per stage in TURN_STAGES, next to a
+therapist_turn_events_total counter per event in TURN_EVENTS.
+"""
+import asyncio, bisect, contextlib, threading, time
+
+TURN_STAGES = {
+    "endpoint": "End of speech until the recorder stopped: trailing silence waited plus wake-up",
+    "wav_write": "Storing a turn's WAV in its turn store, on the turn writer's thread",
+    "transcribe": "Speech recognition of a user turn",
+    "send": "send_with_retry, including retries",
+    "first_audio": "Start of the reply until its first audio chunk arrived",
+    "turn_complete": "Start of the reply until turn_complete",
+}
+TURN_EVENTS = {
+    "speculation_started": "A user turn was transcribed speculatively when the user paused",
+    "speculation_cancelled": "Speech resumed, so the speculative transcription was dropped",
+    "speculation_committed": "The pause ended the turn and its speculative transcription was used",
+    "speculation_skipped": "A pause came while a dropped speculative transcription was still running",
+}
+# Upper bounds in seconds; a reply can take several seconds to complete
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Histogram:
+    """Cumulative-bucket histogram of observations in seconds, safe to update from any thread."""
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        """(cumulative count per bucket bound, including +Inf, sum, count)."""
+        with self.lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative, running = [], 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            running += n
+            cumulative.append((bound, running))
+        return cumulative, total, count
+
+class TurnMetrics:
+    def __init__(self, stages=TURN_STAGES, buckets=LATENCY_BUCKETS, events=TURN_EVENTS):
+        self.stages = stages
+        self.histograms = {stage: Histogram(buckets) for stage in stages}
+        self.counters = dict.fromkeys(events, 0)
+        self.lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        self.histograms[stage].observe(seconds)
+
+    def increment(self, event):
+        with self.lock:
+            self.counters[event] += 1
+
+    @contextlib.contextmanager
+    def time(self, stage):
+        """Observe the time spent in the with block under stage, whether or not it raised, unless it was cancelled."""
+        start = time.perf_counter()
+        cancelled = False
+        try:
+            yield
+        except asyncio.CancelledError:
+            # A stage that was abandoned part way would only skew the histogram
+            cancelled = True
+            raise
+        finally:
+            if not cancelled:
+                self.observe(stage, time.perf_counter() - start)
+
+    def render(self, name="therapist_turn_stage_seconds"):
+        """The histograms in the Prometheus text exposition format."""
+        lines = [f"# HELP {name} Time spent in each stage of a conversational turn.", f"# TYPE {name} histogram"]
+        for stage, histogram in self.histograms.items():
+            cumulative, total, count = histogram.snapshot()
+            for bound, n in cumulative:
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{le}"}} {n}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {total}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+        events = "therapist_turn_events_total"
+        lines += [f"# HELP {events} Turn pipeline events.", f"# TYPE {events} counter"]
+        with self.lock:
+            lines += [f'{events}{{event="{event}"}} {count}' for event, count in self.counters.items()]
+        return "\n".join(lines) + "\n"
+
+TURN_METRICS = TurnMetrics()
@@ -0,0 +1,348 @@
+"""
+Storage for recorded conversation turns, kept as complete WAV files keyed by name.
+
+    store = create_turn_store("memory")          # default: no filesystem I/O at all
+    store = create_turn_store("disk", "therapist_audio")
+    store = create_turn_store("mmap", "therapist_audio")
+
+Every backend is bounded by max_bytes and evicts the least recently used turns first.
+Stores are shared between the asyncio loop that records turns and the web threads that
+serve them, so every operation takes the store's lock. Writes go through a TurnWriter,
+which runs them on a worker thread so a slow disk never holds up the conversation.
+"""
+import asyncio, bisect, hashlib, io, mmap, os, queue, threading, time, wave
+from collections import OrderedDict
+
+TURN_STORE_MAX_BYTES = 64 * 1024 * 1024
+# Turns queued for writing before submit() makes the conversation wait, and turns written per wake-up
+TURN_WRITER_MAX_PENDING = int(os.getenv("TURN_WRITER_MAX_PENDING", "8"))
+TURN_WRITER_BATCH = 4
+
+def wav_bytes(pcm, rate, channels=1, sample_width=2):
+    """Wrap raw PCM in a WAV header, in memory."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(sample_width)
+        wf.setframerate(rate)
+        wf.writeframes(pcm)
+    return buffer.getvalue()
+
+class TurnInfo:
+    """Metadata the web routes need for validators: size, content hash and creation time."""
+    def __init__(self, key, size, etag, created):
+        self.key = key
+        self.size = size
+        self.etag = etag
+        self.created = created
+
+class TurnStore:
+    """Base class: LRU bookkeeping and size bound. Subclasses implement _write, _read and _remove."""
+    def __init__(self, max_bytes=TURN_STORE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.turns = OrderedDict()
+        self.lock = threading.Lock()
+        # Called with each key evicted to stay under max_bytes, e.g. TurnIndex.remove
+        self.on_evict = None
+
+    def put(self, key, data):
+        """Store a turn, evicting the least recently used ones if the store would exceed max_bytes."""
+        info = TurnInfo(key, len(data), hashlib.md5(data).hexdigest(), time.time())
+        with self.lock:
+            if key in self.turns:
+                self._discard(key)
+            self._write(key, data)
+            self.turns[key] = info
+            self.total_bytes += info.size
+            while self.total_bytes > self.max_bytes and len(self.turns) > 1:
+                self._discard(next(iter(self.turns)), evicted=True)
+        return info
+
+    def get(self, key):
+        """Return the turn's bytes (a bytes-like object), or None if it is not stored."""
+        with self.lock:
+            if key not in self.turns:
+                return None
+            self.turns.move_to_end(key)
+            return self._read(key)
+
+    def info(self, key):
+        with self.lock:
+            return self.turns.get(key)
+
+    def path(self, key):
+        """Filesystem path of the turn for zero-copy serving, or None for backends without one."""
+        return None
+
+    def keys(self):
+        with self.lock:
+            return list(self.turns)
+
+    def clear(self):
+        with self.lock:
+            for key in list(self.turns):
+                self._discard(key)
+
+    def _discard(self, key, evicted=False):
+        info = self.turns.pop(key)
+        self.total_bytes -= info.size
+        self._remove(key)
+        if evicted and self.on_evict:
+            self.on_evict(key)
+
+    def _write(self, key, data):
+        raise NotImplementedError
+
+    def _read(self, key):
+        raise NotImplementedError
+
+    def _remove(self, key):
+        raise NotImplementedError
+
+class MemoryTurnStore(TurnStore):
+    """Turns held as bytes in process memory."""
+    def __init__(self, max_bytes=TURN_STORE_MAX_BYTES):
+        super().__init__(max_bytes)
+        self.data = {}
+
+    def _write(self, key, data):
+        self.data[key] = bytes(data)
+
+    def _read(self, key):
+        return self.data[key]
+
+    def _remove(self, key):
+        del self.data[key]
+
+class DiskTurnStore(TurnStore):
+    """Turns written as WAV files in a directory, which the web routes can sendfile directly."""
+    def __init__(self, directory, max_bytes=TURN_STORE_MAX_BYTES):
+        super().__init__(max_bytes)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def _write(self, key, data):
+        with open(self.path(key), 'wb') as file:
+            file.write(data)
+
+    def _read(self, key):
+        with open(self.path(key), 'rb') as file:
+            return file.read()
+
+    def _remove(self, key):
+        try:
+            os.unlink(self.path(key))
+        except FileNotFoundError:
+            pass
+
+class MmapTurnStore(DiskTurnStore):
+    """Disk-backed turns read through read-only memory maps, so reads cost no heap copy."""
+    def __init__(self, directory, max_bytes=TURN_STORE_MAX_BYTES):
+        super().__init__(directory, max_bytes)
+        self.maps = {}
+
+    def _read(self, key):
+        if key not in self.maps:
+            with open(self.path(key), 'rb') as file:
+                self.maps[key] = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(self.maps[key])
+
+    def _remove(self, key):
+        # A map still referenced by a reader stays valid until it is released
+        self.maps.pop(key, None)
+        super()._remove(key)
+
+class TurnIndex:
+    """
+    Log of a conversation's turns, numbered 1, 2, 3... in the order they were recorded; a turn
+    numbered but never stored, or evicted from its store since, leaves a gap. Entries are plain
+    dicts ({"seq", "role", "key", "created"}) so they serialize straight to JSON.
+    One writer (the therapist's TurnWriter thread) appends and removes; any thread may read.
+    """
+    def __init__(self):
+        self.entries = []
+        self.latest = {}
+        self.last_seq = 0
+        self.lock = threading.Lock()
+
+    @property
+    def next_seq(self):
+        return self.last_seq + 1
+
+    def append(self, role, key, seq=None):
+        """Record a turn as seq (default: the next number); seq must be above every earlier one."""
+        with self.lock:
+            seq = seq or self.last_seq + 1
+            entry = {"seq": seq, "role": role, "key": key, "created": time.time()}
+            self.entries.append(entry)
+            self.latest[role] = entry
+            self.last_seq = seq
+            return entry
+
+    def after(self, seq):
+        """Every turn with a sequence number above seq, found by binary search."""
+        with self.lock:
+            return self.entries[bisect.bisect_right(self.entries, seq, key=lambda entry: entry["seq"]):]
+
+    def remove(self, key):
+        """Forget the turn stored under key, if any; other keys, such as a turn's encodings, are ignored."""
+        with self.lock:
+            entry = next((entry for entry in self.entries if entry["key"] == key), None)
+            if entry is None:
+                return
+            self.entries.remove(entry)
+            if self.latest.get(entry["role"]) is entry:
+                previous = [other for other in self.entries if other["role"] == entry["role"]]
+                if previous:
+                    self.latest[entry["role"]] = previous[-1]
+                else:
+                    del self.latest[entry["role"]]
+
+    def clear(self):
+        """Forget every turn. Numbering carries on, so pages polling after() still see the next one."""
+        with self.lock:
+            self.entries = []
+            self.latest = {}
+
+    def last(self, role):
+        """Most recent turn of a role, or None."""
+        with self.lock:
+            return self.latest.get(role)
+
+    def __len__(self):
+        return len(self.entries)
+
+class TurnWriter:
+    """
+    Persists turns in the background. Jobs run in submission order on one worker thread, which
+    takes up to batch_size queued jobs per wake-up and hands whatever they return (a callable,
+    or None) back to the event loop in one call once the batch is written. submit() only waits
+    when max_pending jobs are already queued, which bounds the audio held in memory.
+    """
+    def __init__(self, max_pending=TURN_WRITER_MAX_PENDING, batch_size=TURN_WRITER_BATCH):
+        self.jobs = queue.Queue(max_pending)
+        self.batch_size = batch_size
+        self.thread = None
+        self.loop = None
+        # Held only to check or bump the generation, never across a write, so discard() returns at once
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.writing = False
+        self.after_write = []
+        self.metrics = {"submitted": 0, "written": 0, "failed": 0, "discarded": 0, "batches": 0,
+                        "blocked": 0, "blocked_seconds": 0.0}
+
+    async def submit(self, job):
+        """Queue job to run on the worker thread; waits for room while the queue is full."""
+        if self.thread is None:
+            self.loop = asyncio.get_running_loop()
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+        item = (self.generation, job)
+        self.metrics["submitted"] += 1
+        try:
+            self.jobs.put_nowait(item)
+        except queue.Full:
+            self.metrics["blocked"] += 1
+            start = time.perf_counter()
+            await asyncio.to_thread(self.jobs.put, item)
+            self.metrics["blocked_seconds"] += time.perf_counter() - start
+
+    def discard(self, then=None):
+        """
+        Drop every job queued so far without running it. then, e.g. clearing the stores, runs once
+        nothing from before the discard can still write: right away, or on the worker thread as
+        soon as the job being written finishes.
+        """
+        with self.lock:
+            self.generation += 1
+            if self.writing:
+                if then:
+                    self.after_write.append(then)
+                return
+        if then:
+            then()
+
+    async def flush(self):
+        """Wait until every job submitted so far has run and its result reached the loop."""
+        if self.thread:
+            # Results are scheduled before their jobs are marked done, so they run before this returns
+            await asyncio.to_thread(self.jobs.join)
+
+    async def close(self):
+        """Write what is queued, then stop the worker thread."""
+        if self.thread:
+            await self.flush()
+            await asyncio.to_thread(self.jobs.put, None)
+            await asyncio.to_thread(self.thread.join)
+            self.thread = None
+
+    def _run(self):
+        while True:
+            batch = [self.jobs.get()]
+            while len(batch) < self.batch_size and batch[-1] is not None:
+                try:
+                    batch.append(self.jobs.get_nowait())
+                except queue.Empty:
+                    break
+            results = []
+            for item in batch:
+                if item is None:
+                    continue
+                generation, job = item
+                with self.lock:
+                    if generation != self.generation:
+                        self.metrics["discarded"] += 1
+                        continue
+                    self.writing = True
+                result = None
+                try:
+                    result = job()
+                    self.metrics["written"] += 1
+                except Exception as e:
+                    self.metrics["failed"] += 1
+                    print(f"Error writing turn: {e}")
+                with self.lock:
+                    self.writing = False
+                    # Discarded mid-write: nobody should hear about a turn that is about to be cleared
+                    if generation == self.generation:
+                        results.append(result)
+                    pending, self.after_write = self.after_write, []
+                for then in pending:
+                    try:
+                        then()
+                    except Exception as e:
+                        print(f"Error after discarding turns: {e}")
+            self.metrics["batches"] += 1
+            results = [result for result in results if result]
+            if results:
+                try:
+                    self.loop.call_soon_threadsafe(self._deliver, results)
+                except RuntimeError:
+                    pass  # The loop has closed; nobody is left to tell
+            for _ in batch:
+                self.jobs.task_done()
+            if batch[-1] is None:
+                return
+
+    @staticmethod
+    def _deliver(results):
+        for result in results:
+            try:
+                result()
+            except Exception as e:
+                print(f"Error publishing turn: {e}")
+
+TURN_STORE_BACKENDS = {"memory": MemoryTurnStore, "disk": DiskTurnStore, "mmap": MmapTurnStore}
+
+def create_turn_store(backend="memory", directory=None, max_bytes=TURN_STORE_MAX_BYTES):
+    """Build a store by backend name; directory is required by the disk and mmap backends."""
+    if backend not in TURN_STORE_BACKENDS:
+        raise ValueError(f"Unknown turn store backend '{backend}', expected one of {', '.join(TURN_STORE_BACKENDS)}")
+    if backend == "memory":
+        return MemoryTurnStore(max_bytes)
+    return TURN_STORE_BACKENDS[backend](directory, max_bytes)
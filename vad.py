@@ -0,0 +1,246 @@
+"""
+Voice activity detection for 16-bit mono PCM chunks.
+
+Shared by the capture loop in therapist.py, sound_test.py and benchmark.py.
+"""
+import math
+import numpy as np
+
+SPEECH_BAND_HZ = (300, 3400)
+
+class VoiceActivityDetector:
+    """
+    Decides per chunk whether the microphone is hearing speech.
+
+    All working buffers are allocated once up front. Energy is the integer sum of squares
+    of the int16 samples, compared against threshold**2 * n, so the per-chunk path needs no
+    float copy, no squared temporary and no square root. The zero-crossing and spectral
+    features are optional extra gates that reject hiss and hum loud enough to pass on energy.
+    """
+    def __init__(self, chunk_size=1024, rate=16000, threshold=200,
+                 use_zcr=False, zcr_range=(0.01, 0.35),
+                 use_spectral=False, min_band_ratio=0.5):
+        self.rate = rate
+        self.threshold = threshold
+        self.use_zcr = use_zcr
+        self.zcr_range = zcr_range
+        self.use_spectral = use_spectral
+        self.min_band_ratio = min_band_ratio
+
+        # Results of the last processed chunk
+        self.energy = 0
+        self.rms = 0.0
+        self.level = 0.0
+        self.zcr = 0.0
+        self.band_ratio = 1.0
+        self._allocate(chunk_size)
+
+    def _allocate(self, chunk_size):
+        self.chunk_size = chunk_size
+        self._wide = np.empty(chunk_size, dtype=np.int64)
+        self._abs = np.empty(chunk_size, dtype=np.int64)
+        self._negative = np.empty(chunk_size, dtype=bool)
+        self._crossings = np.empty(chunk_size, dtype=bool)
+        if self.use_spectral:
+            self._window = np.hanning(chunk_size)
+            self._windowed = np.empty(chunk_size, dtype=np.float64)
+            freqs = np.fft.rfftfreq(chunk_size, 1.0 / self.rate)
+            self._band = (freqs >= SPEECH_BAND_HZ[0]) & (freqs <= SPEECH_BAND_HZ[1])
+
+    def is_speech(self, samples):
+        """Update the features for one chunk of int16 samples and return whether it is speech."""
+        n = len(samples)
+        if n == 0:
+            self.energy, self.rms, self.level = 0, 0.0, 0.0
+            return False
+        if n > self.chunk_size:
+            self._allocate(n)
+        wide = self._wide[:n]
+        np.copyto(wide, samples, casting="unsafe")
+        self.energy = int(np.dot(wide, wide))
+        self.rms = math.sqrt(self.energy / n)
+        self.level = int(np.abs(wide, out=self._abs[:n]).sum()) / n
+
+        speech = self.energy > self.threshold * self.threshold * n
+        if self.use_zcr:
+            self.zcr = self._zero_crossing_rate(wide)
+            speech = speech and self.zcr_range[0] <= self.zcr <= self.zcr_range[1]
+        if speech and self.use_spectral and n == self.chunk_size:
+            self.band_ratio = self._speech_band_ratio(wide)
+            speech = self.band_ratio >= self.min_band_ratio
+        return speech
+
+    def _zero_crossing_rate(self, wide):
+        n = len(wide)
+        negative = np.less(wide, 0, out=self._negative[:n])
+        crossings = np.not_equal(negative[1:], negative[:-1], out=self._crossings[:n - 1])
+        return np.count_nonzero(crossings) / (n - 1) if n > 1 else 0.0
+
+    def _speech_band_ratio(self, wide):
+        # rfft always returns a fresh array; this is the one allocation, and only when enabled
+        np.multiply(wide, self._window, out=self._windowed)
+        power = np.abs(np.fft.rfft(self._windowed)) ** 2
+        total = power.sum()
+        return float(power[self._band].sum() / total) if total > 0 else 0.0
+
+class Endpointer:
+    """
+    Decides when the user has finished speaking.
+
+    The first calibration_chunks heard learn the ambient noise floor, which keeps adapting
+    slowly to chunks near it; the speech threshold is the floor times margin, but never
+    below min_threshold. The trailing silence needed to end a turn shrinks from
+    max_silence_seconds towards min_silence_seconds as the utterance's signal-to-noise
+    ratio approaches confident_snr, so clear speech in a quiet room ends quickly while
+    marginal speech in a noisy one still gets the full window.
+    With adaptive=False it reproduces the fixed rule: threshold RMS and max_silence_seconds.
+    """
+    def __init__(self, chunk_size=1024, rate=16000, adaptive=True, threshold=200, min_threshold=60,
+                 calibration_chunks=6, margin=3.0, noise_adapt=0.05,
+                 max_silence_seconds=2.048, min_silence_seconds=0.5, confident_snr=10.0,
+                 min_speech_chunks=2, **vad_options):
+        self.chunk_seconds = chunk_size / rate
+        self.adaptive = adaptive
+        self.fixed_threshold = threshold
+        self.min_threshold = min_threshold
+        self.calibration_chunks = calibration_chunks if adaptive else 0
+        self.margin = margin
+        self.noise_adapt = noise_adapt
+        # The default window is the old fixed rule: 32 chunks of 1024 samples at 16 kHz
+        self.max_silence_chunks = max(1, round(max_silence_seconds / self.chunk_seconds))
+        self.min_silence_chunks = max(1, round(min_silence_seconds / self.chunk_seconds))
+        self.confident_snr = confident_snr
+        self.min_speech_chunks = min_speech_chunks if adaptive else 1
+        self.vad = VoiceActivityDetector(chunk_size, rate, threshold=threshold, **vad_options)
+        self.noise_floor = None
+        self._calibration = []
+        self.reset()
+
+    def reset(self, speech_started=False):
+        """
+        Start a new turn, or with speech_started one the user is already speaking in, as after
+        a barge-in. The learned noise floor is kept across turns.
+        """
+        self.speech_started = speech_started
+        self.speech_chunks = self.min_speech_chunks if speech_started else 0
+        self.silent_chunks = 0
+        self.speech_rms_total = 0.0
+        self.silence_limit = self.max_silence_chunks
+
+    @property
+    def threshold(self):
+        if not self.adaptive or self.noise_floor is None:
+            return self.fixed_threshold
+        return max(self.min_threshold, self.noise_floor * self.margin)
+
+    def process(self, samples):
+        """Feed one chunk of int16 samples; return True once the turn has ended."""
+        self.vad.threshold = self.threshold
+        speech = self.vad.is_speech(samples)
+
+        # Calibrating on a turn that starts mid-speech would take the voice for the noise floor
+        if self.adaptive and not self.speech_started and len(self._calibration) < self.calibration_chunks:
+            self._calibration.append(self.vad.rms)
+            if len(self._calibration) == self.calibration_chunks:
+                # The quietest chunk: steady noise barely varies between chunks, while
+                # someone already talking still leaves gaps between syllables
+                self.noise_floor = float(min(self._calibration))
+            return False
+
+        if speech:
+            self.speech_chunks += 1
+            self.silent_chunks = 0
+            self.speech_rms_total += self.vad.rms
+            if self.speech_chunks >= self.min_speech_chunks:
+                self.speech_started = True
+        else:
+            # Only chunks close to the floor update it, so quiet syllables do not drag it upwards
+            if self.adaptive and self.noise_floor is not None and self.vad.rms < self.noise_floor * 1.5:
+                self.noise_floor += self.noise_adapt * (self.vad.rms - self.noise_floor)
+            if self.speech_started:
+                self.silent_chunks += 1
+            else:
+                # A click or cough before the user speaks must not count towards the utterance's SNR
+                self.speech_chunks = 0
+                self.speech_rms_total = 0.0
+
+        if self.speech_started and self.adaptive and self.noise_floor:
+            snr = self.speech_rms_total / self.speech_chunks / self.noise_floor
+            confidence = min(1.0, max(0.0, (snr - self.margin) / (self.confident_snr - self.margin)))
+            self.silence_limit = round(self.max_silence_chunks - confidence * (self.max_silence_chunks - self.min_silence_chunks))
+        return self.speech_started and self.silent_chunks >= self.silence_limit
+
+class BargeInDetector:
+    """
+    Decides when the user starts talking over the therapist's playback.
+
+    The microphone also hears the speaker. reference() is fed every chunk handed to the
+    speaker; its RMS, held with echo_decay per microphone chunk to cover the room's echo
+    tail, times the learned speaker-to-microphone coupling predicts how loud the echo is.
+    The coupling starts at echo_gain and tracks the microphone-to-playback ratio of chunks
+    that are plausibly echo alone. A microphone chunk counts as the user when it is margin
+    times louder than the predicted echo and louder than threshold; min_speech_chunks such
+    chunks in a row trigger.
+    """
+    def __init__(self, chunk_size=1024, rate=16000, threshold=300, echo_gain=0.5, echo_decay=0.7, margin=1.4,
+                 coupling_adapt=0.1, min_speech_chunks=3, **vad_options):
+        self.threshold = threshold
+        self.echo_gain = echo_gain
+        self.echo_decay = echo_decay
+        self.margin = margin
+        self.coupling_adapt = coupling_adapt
+        self.min_speech_chunks = min_speech_chunks
+        self.vad = VoiceActivityDetector(chunk_size, rate, threshold=threshold, **vad_options)
+        self.coupling = echo_gain
+        self.reset()
+
+    def reset(self):
+        """Start listening over a new reply. The learned coupling is kept, like the endpointer's noise floor."""
+        self.speech_chunks = 0
+        self.playback_rms = 0.0
+
+    def reference(self, samples):
+        """Feed int16 samples as they are handed to the speaker, at any sample rate."""
+        if len(samples):
+            wide = samples.astype(np.int64)
+            self.playback_rms = max(self.playback_rms, math.sqrt(np.dot(wide, wide) / len(wide)))
+
+    def process(self, samples):
+        """Feed one microphone chunk of int16 samples; return True once the user is talking."""
+        echo = self.coupling * self.playback_rms
+        self.vad.threshold = max(self.threshold, self.margin * echo)
+        speech = self.vad.is_speech(samples)
+        if not speech and self.playback_rms > self.threshold:
+            # Only chunks consistent with echo alone teach the coupling
+            self.coupling += self.coupling_adapt * (self.vad.rms / self.playback_rms - self.coupling)
+        self.playback_rms *= self.echo_decay
+        self.speech_chunks = self.speech_chunks + 1 if speech else 0
+        return self.speech_chunks >= self.min_speech_chunks
+
+def replay(endpointer, samples, chunk_size=1024, rate=16000):
+    """
+    Run a recording through an endpointer as if it were captured live.
+    Returns the time the turn ended (None if it never did) and the end of the last
+    speech chunk before it, both in seconds from the start of the recording.
+    """
+    endpointer.reset()
+    last_speech_end = None
+    for index, start in enumerate(range(0, len(samples) - chunk_size + 1, chunk_size)):
+        ended = endpointer.process(samples[start:start + chunk_size])
+        if endpointer.silent_chunks == 0 and endpointer.speech_started:
+            last_speech_end = (index + 1) * chunk_size / rate
+        if ended:
+            return (index + 1) * chunk_size / rate, last_speech_end
+    return None, last_speech_end
+
+def replay_barge_in(detector, mic, playback, chunk_size=1024, rate=16000):
+    """
+    Run a microphone recording and the playback it overlaps (both 16 kHz, aligned at the
+    start) through a barge-in detector; returns the trigger time in seconds, or None.
+    """
+    detector.reset()
+    for index, start in enumerate(range(0, len(mic) - chunk_size + 1, chunk_size)):
+        detector.reference(playback[start:start + chunk_size])
+        if detector.process(mic[start:start + chunk_size]):
+            return (index + 1) * chunk_size / rate
+    return None
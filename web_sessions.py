@@ -0,0 +1,1441 @@
+"""
+Session state and page shared by therapist_web.py (Flask) and therapist_asgi.py (Starlette).
+
+Importing this module starts no event loop, thread or signal handler; each server sets those
+up itself, so either can import it without running the other.
+"""
+import threading
+import os
+import uuid
+
+from therapist import (VirtualTherapist, AUDIO_DIR, THERAPIST_AUDIO_DIR, MODEL, BACKEND_BREAKER, get_client,
+                       get_audio_cache, live_config)
+from turn_metrics import TURN_METRICS
+from session_pool import LiveSessionPool
+
+EVENT_KEEPALIVE_SECONDS = 15
+STREAM_IDLE_TIMEOUT_SECONDS = 30
+AUDIO_CACHE_SECONDS = 3600
+LIVE_POOL_SIZE = int(os.getenv("LIVE_POOL_SIZE", "1"))
+
+class LiveAudioStream:
+    """PCM chunks of the therapist turn being generated, readable while the turn is still growing."""
+    def __init__(self, stream_id, sample_rate):
+        self.stream_id = stream_id
+        self.sample_rate = sample_rate
+        self.chunks = []
+        self.done = False
+        self.cond = threading.Condition()
+
+    def append(self, data):
+        with self.cond:
+            self.chunks.append(data)
+            self.cond.notify_all()
+
+    def finish(self):
+        with self.cond:
+            self.done = True
+            self.cond.notify_all()
+
+    def iter_chunks(self, timeout=STREAM_IDLE_TIMEOUT_SECONDS):
+        """Yield every chunk from the start of the turn, blocking for new ones until it is finished."""
+        sent = 0
+        while True:
+            with self.cond:
+                while sent >= len(self.chunks) and not self.done:
+                    if not self.cond.wait(timeout):
+                        return
+                if sent >= len(self.chunks):
+                    return
+                pending = self.chunks[sent:]
+                sent = len(self.chunks)
+            for chunk in pending:
+                yield chunk
+
+class TherapySession:
+    """One browser conversation: its own VirtualTherapist, turn stores and event subscribers."""
+    def __init__(self, session_id, registry, session_pool=None, streams=None):
+        self.session_id = session_id
+        # The SessionRegistry that created the session, which it leaves when the conversation ends
+        self.registry = registry
+        self.audio_dir = os.path.join(AUDIO_DIR, session_id)
+        self.therapist_audio_dir = os.path.join(THERAPIST_AUDIO_DIR, session_id)
+        self.therapist = VirtualTherapist(audio_dir=self.audio_dir, therapist_audio_dir=self.therapist_audio_dir,
+                                          session_pool=session_pool, streams=streams)
+        self.therapist.add_listener(self.on_therapist_event)
+        self.active = False
+        self.future = None
+
+        # Server-sent event subscribers, one queue per connected page
+        self.subscribers = []
+        self.subscribers_lock = threading.Lock()
+        self.current_stream = None
+        self.stream_counter = 0
+
+    def broadcast(self, event, data):
+        """Queue an event for every /events client of this session."""
+        with self.subscribers_lock:
+            for q in self.subscribers:
+                q.put((event, data))
+
+    def turn_url(self, entry):
+        return f"/audio/{entry['role']}/{self.session_id}/{entry['key']}" if entry else None
+
+    def turn_json(self, entry):
+        return {'seq': entry['seq'], 'role': entry['role'], 'url': self.turn_url(entry), 'created': entry['created'],
+                'encodings': list(entry.get('encodings', ['wav']))}
+
+    def latest_audio(self):
+        """URLs of the newest therapist and user turns, read from the turn index in O(1)."""
+        turns = self.therapist.turns
+        return {'therapist_audio': self.turn_url(turns.last('therapist')), 'user_audio': self.turn_url(turns.last('user'))}
+
+    def on_therapist_event(self, event, data):
+        """Listener registered on the VirtualTherapist; runs on the asyncio loop thread."""
+        if event == 'therapist_audio_start':
+            self.stream_counter += 1
+            self.current_stream = LiveAudioStream(self.stream_counter, data['sample_rate'])
+            self.broadcast('therapist_stream', {
+                'url': f'/stream/therapist/{self.session_id}/{self.current_stream.stream_id}',
+                'sample_rate': self.current_stream.sample_rate
+            })
+        elif event == 'therapist_audio_chunk':
+            if self.current_stream:
+                self.current_stream.append(data['data'])
+        elif event == 'therapist_audio_end':
+            if self.current_stream:
+                self.current_stream.finish()
+        elif event == 'therapist_interrupted':
+            if self.current_stream:
+                self.current_stream.finish()
+            self.broadcast('therapist_interrupted', {})
+        elif event == 'therapist_audio':
+            payload = {'url': f"/audio/therapist/{self.session_id}/{data['filename']}", 'seq': data['seq']}
+            if self.current_stream:
+                # Lets pages that already played the stream skip the complete file
+                payload['stream_url'] = f'/stream/therapist/{self.session_id}/{self.current_stream.stream_id}'
+            self.broadcast('therapist_audio', payload)
+        elif event == 'user_audio':
+            self.broadcast('user_audio', {'url': f"/audio/user/{self.session_id}/{data['filename']}", 'seq': data['seq']})
+
+    async def run(self):
+        try:
+            await self.therapist.start_session()
+        except Exception as e:
+            print(f"Error in therapy session {self.session_id}: {e}")
+        finally:
+            self.active = False
+            self.broadcast('session', {'active': False})
+            self.registry.remove(self.session_id)
+
+class SessionRegistry:
+    """
+    Live sessions keyed by session ID, capped at max_sessions running at once.
+    The web servers run one conversation at a time, on the server's one microphone and speaker.
+    More need streams, a factory giving each session its own audio (e.g. fake_live.ScriptedAudioStreams).
+    """
+    def __init__(self, max_sessions=1, streams=None):
+        if max_sessions > 1 and not streams:
+            raise ValueError("Concurrent sessions need their own audio streams; they would share one microphone")
+        self.max_sessions = max_sessions
+        self.streams = streams
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.session_pool = None
+
+    def start_pool(self, size=LIVE_POOL_SIZE):
+        """Keep live sessions connected ahead of /start_session; call on the loop the sessions run on."""
+        if size > 0 and self.session_pool is None:
+            self.session_pool = LiveSessionPool(get_client(), MODEL, live_config(), size)
+            self.session_pool.start()
+
+    async def close_pool(self):
+        if self.session_pool:
+            await self.session_pool.close()
+            self.session_pool = None
+
+    def create(self):
+        """Register a new session, or return None when the server is at capacity."""
+        with self.lock:
+            if len(self.sessions) >= self.max_sessions:
+                return None
+            session = TherapySession(uuid.uuid4().hex, self, self.session_pool, self.streams() if self.streams else None)
+            self.sessions[session.session_id] = session
+            return session
+
+    def get(self, session_id):
+        with self.lock:
+            return self.sessions.get(session_id)
+
+    def remove(self, session_id):
+        with self.lock:
+            session = self.sessions.pop(session_id, None)
+        if session:
+            for directory in (session.audio_dir, session.therapist_audio_dir):
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    pass
+
+    def __len__(self):
+        with self.lock:
+            return len(self.sessions)
+
+registry = SessionRegistry()
+
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def metrics_text():
+    """Turn latency histograms plus session, breaker, pool and audio cache counters, for Prometheus."""
+    lines = [TURN_METRICS.render().rstrip("\n")]
+    def metric(name, kind, value, help_text):
+        lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value}"])
+    metric("therapist_sessions", "gauge", len(registry), "Conversations currently registered.")
+    metric("therapist_backend_circuit_open", "gauge", int(BACKEND_BREAKER.state != "closed"),
+           "1 while the live API circuit breaker is open or half-open.")
+    for key, value in BACKEND_BREAKER.metrics.items():
+        metric(f"therapist_backend_circuit_{key}_total", "counter", value, f"Circuit breaker {key.replace('_', ' ')} count.")
+    pool = registry.session_pool
+    if pool:
+        metric("therapist_live_pool_ready", "gauge", len(pool.ready), "Pre-connected live sessions waiting.")
+        for key, value in pool.metrics.items():
+            metric(f"therapist_live_pool_{key}_total", "counter", value, f"Live session pool {key.replace('_', ' ')}.")
+    cache = get_audio_cache()
+    if cache:
+        for key, value in cache.metrics.items():
+            metric(f"therapist_audio_cache_{key}_total", "counter", value, f"Audio cache {key}.")
+    return "\n".join(lines) + "\n"
+
+def cleanup_audio_directories():
+    """Remove every session's audio files, then the audio directories themselves."""
+    try:
+        # Each session keeps its turns in its own subdirectory; the disk stores recreate them as needed
+        for directory in (AUDIO_DIR, THERAPIST_AUDIO_DIR):
+            if os.path.exists(directory):
+                for root, dirs, files in os.walk(directory, topdown=False):
+                    for filename in files:
+                        os.unlink(os.path.join(root, filename))
+                    os.rmdir(root)
+    except Exception as e:
+        print(f"Error cleaning up: {e}")
+
+# HTML, CSS and JavaScript content as strings
+HTML_CONTENT = """
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Virtual Therapist</title>
+    <link rel="preconnect" href="https://fonts.googleapis.com">
+    <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
+    <link href="https://fonts.googleapis.com/css2?family=Quicksand:wght@300;400;500;600;700&display=swap" rel="stylesheet">
+    <style>
+        :root {
+            --primary: #6a8caf;
+            --primary-light: #a6c0dd;
+            --primary-dark: #4a6e99;
+            --accent: #ff8fab;
+            --accent-light: #ffc2d1;
+            --accent-dark: #ff5c8d;
+            --background: #f9f7f7;
+            --card-bg: #ffffff;
+            --text: #333333;
+            --text-light: #666666;
+            --shadow: 0 8px 25px rgba(0, 0, 0, 0.05);
+            --shadow-hover: 0 12px 30px rgba(0, 0, 0, 0.08);
+            --border-radius: 20px;
+            --transition: all 0.3s ease;
+            --flower-1: #f8b6cd;
+            --flower-2: #c9dce6;
+            --flower-3: #cee5d5;
+            --flower-4: #f3e7d3;
+            --flower-5: #d1c2e0;
+        }
+
+        * {
+            margin: 0;
+            padding: 0;
+            box-sizing: border-box;
+        }
+
+        body {
+            font-family: 'Quicksand', sans-serif;
+            background: var(--background);
+            color: var(--text);
+            min-height: 100vh;
+            display: flex;
+            flex-direction: column;
+            position: relative;
+            overflow-x: hidden;
+        }
+
+        /* Flower decorations */
+        .flower {
+            position: absolute;
+            z-index: -1;
+            opacity: 0.7;
+            border-radius: 50%;
+        }
+
+        .flower-1 {
+            top: 5vh;
+            left: 5vw;
+            width: 100px;
+            height: 100px;
+            background: var(--flower-1);
+            animation: float 8s ease-in-out infinite;
+        }
+
+        .flower-2 {
+            top: 15vh;
+            right: 8vw;
+            width: 120px;
+            height: 120px;
+            background: var(--flower-2);
+            animation: float 12s ease-in-out infinite 1s;
+        }
+
+        .flower-3 {
+            bottom: 10vh;
+            left: 10vw;
+            width: 80px;
+            height: 80px;
+            background: var(--flower-3);
+            animation: float 10s ease-in-out infinite 0.5s;
+        }
+
+        .flower-4 {
+            bottom: 15vh;
+            right: 5vw;
+            width: 90px;
+            height: 90px;
+            background: var(--flower-4);
+            animation: float 9s ease-in-out infinite 1.5s;
+        }
+
+        @keyframes float {
+            0%, 100% {
+                transform: translateY(0) rotate(0deg);
+            }
+            50% {
+                transform: translateY(-20px) rotate(5deg);
+            }
+        }
+
+        /* Petal shapes for flowers */
+        .flower::before, .flower::after {
+            content: "";
+            position: absolute;
+            border-radius: 50%;
+            background: inherit;
+            opacity: 0.7;
+        }
+
+        .flower::before {
+            width: 100%;
+            height: 100%;
+            top: -30%;
+            left: 15%;
+        }
+
+        .flower::after {
+            width: 100%;
+            height: 100%;
+            top: 15%;
+            left: -30%;
+        }
+
+        .container {
+            max-width: 1200px;
+            margin: 0 auto;
+            padding: 40px 20px;
+            flex: 1;
+            display: flex;
+            flex-direction: column;
+            position: relative;
+            z-index: 1;
+        }
+
+        header {
+            text-align: center;
+            padding: 0 0 30px 0;
+            margin-bottom: 30px;
+            position: relative;
+        }
+
+        header::after {
+            content: '';
+            position: absolute;
+            bottom: 0;
+            left: 50%;
+            transform: translateX(-50%);
+            width: 60px;
+            height: 4px;
+            background: var(--accent);
+            border-radius: 2px;
+        }
+
+        h1 {
+            font-size: 3rem;
+            font-weight: 700;
+            color: var(--primary-dark);
+            position: relative;
+            display: inline-block;
+        }
+
+        h1 span {
+            position: relative;
+        }
+
+        h1::before {
+            content: '✿';
+            color: var(--accent);
+            margin-right: 15px;
+            font-size: 0.8em;
+        }
+
+        h1::after {
+            content: '✿';
+            color: var(--accent);
+            margin-left: 15px;
+            font-size: 0.8em;
+        }
+
+        .subtitle {
+            color: var(--text-light);
+            font-size: 1.2rem;
+            margin-top: 10px;
+        }
+
+        .main-content {
+            display: grid;
+            grid-template-columns: 1fr;
+            gap: 40px;
+            align-items: center;
+        }
+
+        .avatar-container {
+            position: relative;
+            height: 300px;
+            border-radius: var(--border-radius);
+            overflow: hidden;
+            background: var(--card-bg);
+            box-shadow: var(--shadow);
+            transition: var(--transition);
+            display: flex;
+            justify-content: center;
+            align-items: center;
+        }
+
+        .avatar-container:hover {
+            box-shadow: var(--shadow-hover);
+            transform: translateY(-5px);
+        }
+
+        .avatar-image {
+            width: 200px;
+            height: 200px;
+            background: var(--primary-light);
+            border-radius: 50%;
+            position: relative;
+            display: flex;
+            justify-content: center;
+            align-items: flex-end;
+            overflow: hidden;
+        }
+
+        .avatar-image::before {
+            content: '';
+            position: absolute;
+            top: 20%;
+            left: 10%;
+            width: 80%;
+            height: 60%;
+            background: var(--card-bg);
+            border-radius: 50%;
+        }
+
+        /* Eyes */
+        .avatar-eyes {
+            position: absolute;
+            top: 35%;
+            width: 100%;
+            display: flex;
+            justify-content: center;
+            gap: 40px;
+        }
+
+        .eye {
+            width: 30px;
+            height: 30px;
+            background: var(--text);
+            border-radius: 50%;
+            position: relative;
+        }
+
+        .eye::after {
+            content: '';
+            position: absolute;
+            top: 5px;
+            left: 5px;
+            width: 10px;
+            height: 10px;
+            background: white;
+            border-radius: 50%;
+        }
+
+        /* Mouth */
+        .avatar-mouth {
+            position: absolute;
+            bottom: 25%;
+            width: 80px;
+            height: 40px;
+            background: var(--accent);
+            border-radius: 0 0 40px 40px;
+            overflow: hidden;
+        }
+
+        .avatar-mouth.speaking {
+            animation: speaking 0.5s infinite alternate;
+        }
+
+        @keyframes speaking {
+            from { height: 40px; }
+            to { height: 50px; }
+        }
+
+        /* Teeth */
+        .avatar-teeth {
+            position: absolute;
+            top: 0;
+            width: 100%;
+            height: 15px;
+            background: white;
+            display: flex;
+        }
+
+        .tooth {
+            flex: 1;
+            height: 100%;
+            border-right: 1px solid rgba(0,0,0,0.1);
+        }
+
+        /* Flower on top */
+        .avatar-flower {
+            position: absolute;
+            top: 0;
+            left: 50%;
+            transform: translateX(-50%) translateY(-50%);
+            width: 60px;
+            height: 60px;
+        }
+
+        .flower-center {
+            position: absolute;
+            top: 50%;
+            left: 50%;
+            transform: translate(-50%, -50%);
+            width: 20px;
+            height: 20px;
+            background: #ffdf80;
+            border-radius: 50%;
+            z-index: 2;
+        }
+
+        .flower-petal {
+            position: absolute;
+            width: 25px;
+            height: 25px;
+            background: var(--accent);
+            border-radius: 50%;
+        }
+
+        .petal-1 { top: 0; left: 50%; transform: translateX(-50%); }
+        .petal-2 { top: 50%; right: 0; transform: translateY(-50%); }
+        .petal-3 { bottom: 0; left: 50%; transform: translateX(-50%); }
+        .petal-4 { top: 50%; left: 0; transform: translateY(-50%); }
+        .petal-5 { top: 15%; right: 15%; }
+        .petal-6 { bottom: 15%; right: 15%; }
+        .petal-7 { bottom: 15%; left: 15%; }
+        .petal-8 { top: 15%; left: 15%; }
+
+        .status-indicator {
+            position: absolute;
+            bottom: 20px;
+            right: 20px;
+            width: 15px;
+            height: 15px;
+            border-radius: 50%;
+            background-color: var(--text-light);
+            transition: var(--transition);
+        }
+
+        .status-indicator.listening {
+            background-color: #35d0ba;
+            box-shadow: 0 0 10px #35d0ba;
+            animation: pulse 1.5s infinite;
+        }
+
+        .status-indicator.speaking {
+            background-color: var(--accent);
+            box-shadow: 0 0 10px var(--accent);
+            animation: pulse 0.75s infinite;
+        }
+
+        .status-indicator.idle {
+            background-color: var(--primary);
+        }
+
+        @keyframes pulse {
+            0% {
+                transform: scale(1);
+                opacity: 1;
+            }
+            50% {
+                transform: scale(1.2);
+                opacity: 0.7;
+            }
+            100% {
+                transform: scale(1);
+                opacity: 1;
+            }
+        }
+
+        .controls {
+            display: flex;
+            flex-direction: column;
+            gap: 30px;
+            padding: 40px;
+            background: var(--card-bg);
+            border-radius: var(--border-radius);
+            box-shadow: var(--shadow);
+            transition: var(--transition);
+        }
+
+        .controls:hover {
+            box-shadow: var(--shadow-hover);
+        }
+
+        .controls-header {
+            text-align: center;
+            margin-bottom: 10px;
+        }
+
+        .controls-header h2 {
+            font-size: 1.75rem;
+            font-weight: 600;
+            margin-bottom: 10px;
+            color: var(--primary-dark);
+        }
+
+        .controls-header p {
+            color: var(--text-light);
+            font-size: 0.95rem;
+        }
+
+        .btn {
+            padding: 15px 30px;
+            border: none;
+            border-radius: 50px;
+            background: linear-gradient(135deg, var(--primary) 0%, var(--primary-dark) 100%);
+            color: white;
+            font-size: 16px;
+            font-weight: 600;
+            cursor: pointer;
+            transition: var(--transition);
+            outline: none;
+            box-shadow: 0 4px 10px rgba(0, 0, 0, 0.1);
+            position: relative;
+            overflow: hidden;
+            text-transform: uppercase;
+            letter-spacing: 1px;
+            font-family: 'Quicksand', sans-serif;
+        }
+
+        .btn::before {
+            content: '';
+            position: absolute;
+            top: 0;
+            left: 0;
+            width: 100%;
+            height: 100%;
+            background: linear-gradient(to right, rgba(255,255,255,0.1), rgba(255,255,255,0.2));
+            transform: translateX(-100%);
+            transition: transform 0.6s;
+        }
+
+        .btn:hover {
+            transform: translateY(-3px);
+            box-shadow: 0 7px 15px rgba(0, 0, 0, 0.15);
+        }
+
+        .btn:hover::before {
+            transform: translateX(100%);
+        }
+
+        .btn:active {
+            transform: translateY(1px);
+            box-shadow: 0 2px 5px rgba(0, 0, 0, 0.1);
+        }
+
+        .btn:disabled {
+            background: var(--text-light);
+            cursor: not-allowed;
+            transform: none;
+            box-shadow: none;
+        }
+
+        .btn:disabled::before {
+            display: none;
+        }
+
+        .btn.accent {
+            background: linear-gradient(135deg, var(--accent) 0%, var(--accent-dark) 100%);
+        }
+
+        .status {
+            font-size: 18px;
+            margin-top: 10px;
+            text-align: center;
+            height: 50px;
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            font-weight: 500;
+            color: var(--text);
+            background: rgba(0, 0, 0, 0.03);
+            border-radius: 25px;
+            position: relative;
+            overflow: hidden;
+        }
+
+        .status::before {
+            content: '';
+            position: absolute;
+            top: 0;
+            left: 0;
+            width: 100%;
+            height: 100%;
+            background: linear-gradient(90deg, 
+                transparent 0%, 
+                rgba(255, 255, 255, 0.5) 50%, 
+                transparent 100%);
+            transform: translateX(-100%);
+        }
+
+        .status.animated::before {
+            animation: shine 2s infinite;
+        }
+
+        @keyframes shine {
+            100% {
+                transform: translateX(100%);
+            }
+        }
+
+        .instructions {
+            background: var(--card-bg);
+            padding: 30px;
+            border-radius: var(--border-radius);
+            margin-top: 40px;
+            box-shadow: var(--shadow);
+            transition: var(--transition);
+        }
+
+        .instructions:hover {
+            box-shadow: var(--shadow-hover);
+        }
+
+        .instructions h3 {
+            margin-bottom: 20px;
+            color: var(--primary-dark);
+            font-size: 1.5rem;
+            font-weight: 600;
+            display: flex;
+            align-items: center;
+        }
+
+        .instructions h3::before {
+            content: '❀';
+            color: var(--accent);
+            margin-right: 15px;
+        }
+
+        .instructions-grid {
+            display: grid;
+            grid-template-columns: repeat(2, 1fr);
+            gap: 20px;
+        }
+
+        .instruction-card {
+            background: rgba(0, 0, 0, 0.02);
+            padding: 25px;
+            border-radius: 12px;
+            display: flex;
+            flex-direction: column;
+            align-items: center;
+            text-align: center;
+            transition: var(--transition);
+            border: 1px solid rgba(0, 0, 0, 0.03);
+        }
+
+        .instruction-card:hover {
+            transform: translateY(-5px);
+            background: rgba(0, 0, 0, 0.03);
+        }
+
+        .instruction-number {
+            width: 40px;
+            height: 40px;
+            background: linear-gradient(135deg, var(--primary-light) 0%, var(--primary) 100%);
+            border-radius: 50%;
+            display: flex;
+            justify-content: center;
+            align-items: center;
+            font-weight: 600;
+            margin-bottom: 15px;
+            color: white;
+        }
+
+        .instruction-text {
+            font-size: 0.95rem;
+            line-height: 1.5;
+            color: var(--text);
+        }
+
+        .audio-player {
+            margin-top: 40px;
+            text-align: center;
+            position: relative;
+        }
+
+        .audio-player::before {
+            content: '';
+            position: absolute;
+            top: 50%;
+            left: 0;
+            right: 0;
+            height: 2px;
+            background: rgba(0, 0, 0, 0.05);
+            z-index: -1;
+        }
+
+        .audio-player audio {
+            width: 100%;
+            max-width: 600px;
+            border-radius: 50px;
+            background: var(--card-bg);
+            height: 50px;
+            box-shadow: var(--shadow);
+        }
+
+        footer {
+            text-align: center;
+            padding: 30px;
+            color: var(--text-light);
+            font-size: 14px;
+            margin-top: auto;
+            position: relative;
+        }
+
+        footer::before {
+            content: '';
+            position: absolute;
+            top: 0;
+            left: 50%;
+            transform: translateX(-50%);
+            width: 100px;
+            height: 1px;
+            background: rgba(0, 0, 0, 0.1);
+        }
+
+        .heart {
+            color: var(--accent);
+            animation: heartbeat 1.5s infinite;
+            display: inline-block;
+        }
+
+        @keyframes heartbeat {
+            0%, 100% {
+                transform: scale(1);
+            }
+            50% {
+                transform: scale(1.2);
+            }
+        }
+
+        /* Debug section */
+        .debug-panel {
+            background: var(--card-bg);
+            padding: 20px;
+            margin-top: 30px;
+            border-radius: var(--border-radius);
+            box-shadow: var(--shadow);
+            display: none;
+        }
+
+        .debug-panel h3 {
+            margin-bottom: 15px;
+            font-size: 1.2rem;
+            color: var(--primary-dark);
+        }
+
+        .debug-log {
+            background: rgba(0, 0, 0, 0.03);
+            padding: 15px;
+            border-radius: 8px;
+            height: 150px;
+            overflow-y: auto;
+            font-family: monospace;
+            font-size: 0.9rem;
+            white-space: pre-wrap;
+        }
+
+        .debug-buttons {
+            display: flex;
+            gap: 10px;
+            margin-top: 15px;
+        }
+
+        .debug-btn {
+            padding: 8px 15px;
+            border-radius: 6px;
+            background: var(--primary-light);
+            color: var(--text);
+            border: none;
+            cursor: pointer;
+            font-size: 0.9rem;
+        }
+
+        .debug-btn:hover {
+            background: var(--primary);
+            color: white;
+        }
+
+        @media (max-width: 768px) {
+            .instructions-grid {
+                grid-template-columns: 1fr;
+            }
+            
+            .container {
+                padding: 20px 15px;
+            }
+            
+            h1 {
+                font-size: 2.2rem;
+            }
+            
+            .controls {
+                padding: 25px;
+            }
+        }
+    </style>
+</head>
+<body>
+    <!-- Decorative flower elements -->
+    <div class="flower flower-1"></div>
+    <div class="flower flower-2"></div>
+    <div class="flower flower-3"></div>
+    <div class="flower flower-4"></div>
+
+    <div class="container">
+        <header>
+            <h1><span>Virtual Therapist</span></h1>
+            <div class="subtitle">Your AI companion for emotional well-being</div>
+        </header>
+        
+        <div class="main-content">
+            <div class="avatar-container">
+                <div class="avatar-image">
+                    <div class="avatar-eyes">
+                        <div class="eye"></div>
+                        <div class="eye"></div>
+                    </div>
+                    <div class="avatar-mouth" id="avatar-mouth">
+                        <div class="avatar-teeth">
+                            <div class="tooth"></div>
+                            <div class="tooth"></div>
+                            <div class="tooth"></div>
+                            <div class="tooth"></div>
+                        </div>
+                    </div>
+                    <div class="avatar-flower">
+                        <div class="flower-center"></div>
+                        <div class="flower-petal petal-1"></div>
+                        <div class="flower-petal petal-2"></div>
+                        <div class="flower-petal petal-3"></div>
+                        <div class="flower-petal petal-4"></div>
+                        <div class="flower-petal petal-5"></div>
+                        <div class="flower-petal petal-6"></div>
+                        <div class="flower-petal petal-7"></div>
+                        <div class="flower-petal petal-8"></div>
+                    </div>
+                </div>
+                <div class="status-indicator" id="status-indicator"></div>
+            </div>
+            
+            <div class="controls">
+                <div class="controls-header">
+                    <h2>Therapy Session</h2>
+                    <p>Your AI companion is ready to listen</p>
+                </div>
+                
+                <button id="start-session" class="btn">Start Session</button>
+                <button id="end-session" class="btn accent" disabled>End Session</button>
+                <div class="status" id="status-message">Ready to start</div>
+            </div>
+            
+            <div class="instructions">
+                <h3>How It Works</h3>
+                <div class="instructions-grid">
+                    <div class="instruction-card">
+                        <div class="instruction-number">1</div>
+                        <div class="instruction-text">Click "Start Session" to begin your therapy conversation</div>
+                    </div>
+                    <div class="instruction-card">
+                        <div class="instruction-number">2</div>
+                        <div class="instruction-text">Speak naturally when the status shows "Listening..."</div>
+                    </div>
+                    <div class="instruction-card">
+                        <div class="instruction-number">3</div>
+                        <div class="instruction-text">Your therapist will respond with helpful insights</div>
+                    </div>
+                    <div class="instruction-card">
+                        <div class="instruction-number">4</div>
+                        <div class="instruction-text">Say "goodbye" or "end session" when you're done</div>
+                    </div>
+                </div>
+            </div>
+
+            <!-- Hidden debug panel - can be enabled with keyboard shortcut Ctrl+D -->
+            <div class="debug-panel" id="debug-panel">
+                <h3>Debug Panel</h3>
+                <div class="debug-log" id="debug-log">Debug information will appear here...</div>
+                <div class="debug-buttons">
+                    <button class="debug-btn" id="debug-check-session">Check Session</button>
+                    <button class="debug-btn" id="debug-clear">Clear Log</button>
+                </div>
+            </div>
+        </div>
+        
+        <div class="audio-player">
+            <audio id="therapist-audio" controls autoplay></audio>
+        </div>
+    </div>
+    
+    <footer>
+        <p>Virtual Therapist - Created with <span class="heart">♥</span> - Powered by Google Gemini AI</p>
+    </footer>
+    
+    <script>
+        document.addEventListener('DOMContentLoaded', () => {
+            // DOM elements
+            const startButton = document.getElementById('start-session');
+            const endButton = document.getElementById('end-session');
+            const statusMessage = document.getElementById('status-message');
+            const statusIndicator = document.getElementById('status-indicator');
+            const therapistAudio = document.getElementById('therapist-audio');
+            const avatarMouth = document.getElementById('avatar-mouth');
+            const debugPanel = document.getElementById('debug-panel');
+            const debugLog = document.getElementById('debug-log');
+            const debugCheckSession = document.getElementById('debug-check-session');
+            const debugClear = document.getElementById('debug-clear');
+            
+            // State variables
+            let sessionActive = false;
+            // Kept per tab so a reload reattaches to the same conversation
+            let sessionId = sessionStorage.getItem('therapySessionId');
+            let eventSource = null;
+            let lastTherapistAudio = null;
+            let audioContext = null;
+            let activeStreamUrl = null;
+            let activeSources = new Set();
+            let consecutiveErrors = 0;
+            
+            // Debug helpers
+            function logDebug(message, type = 'info') {
+                const timestamp = new Date().toLocaleTimeString();
+                const msgType = type.toUpperCase();
+                const msgText = `[${timestamp}] [${msgType}] ${message}`;
+                
+                const logElement = document.getElementById('debug-log');
+                if (logElement) {
+                    logElement.innerHTML += msgText + '\\n';
+                    logElement.scrollTop = logElement.scrollHeight;
+                }
+                
+                if (type === 'error') {
+                    console.error(message);
+                } else {
+                    console.log(message);
+                }
+            }
+            
+            // Enable debug panel with Ctrl+D
+            document.addEventListener('keydown', (e) => {
+                if (e.ctrlKey && e.key === 'd') {
+                    e.preventDefault();
+                    debugPanel.style.display = debugPanel.style.display === 'none' ? 'block' : 'none';
+                    logDebug('Debug panel toggled');
+                }
+            });
+            
+            // Debug buttons
+            debugCheckSession.addEventListener('click', async () => {
+                try {
+                    const response = await fetch(`/session_status?session_id=${sessionId || ''}`);
+                    const data = await response.json();
+                    logDebug(`Session status: ${JSON.stringify(data)}`);
+                } catch (error) {
+                    logDebug(`Error checking session: ${error}`, 'error');
+                }
+            });
+            
+            debugClear.addEventListener('click', () => {
+                debugLog.innerHTML = '';
+            });
+            
+            // Initialize
+            updateStatus('Ready to start');
+            
+            // Start session button
+            startButton.addEventListener('click', async () => {
+                try {
+                    startButton.disabled = true;
+                    // Created inside the click handler so browsers allow it to play
+                    ensureAudioContext();
+                    updateStatus('Starting session...', true);
+                    logDebug('Starting new session');
+                    
+                    const response = await fetch('/start_session', {
+                        method: 'POST'
+                    });
+                    
+                    const data = await response.json();
+                    
+                    if (data.status === 'success') {
+                        sessionId = data.session_id;
+                        sessionStorage.setItem('therapySessionId', sessionId);
+                        sessionActive = true;
+                        endButton.disabled = false;
+                        updateStatus('Session started', true);
+                        setStatusIndicator('listening');
+                        
+                        // Reset error counters
+                        consecutiveErrors = 0;
+                        
+                        // Listen for pushed audio events
+                        startEventStream();
+                        logDebug('Session started successfully');
+                    } else {
+                        updateStatus(`Error: ${data.message}`, true);
+                        startButton.disabled = false;
+                        logDebug(`Error starting session: ${data.message}`, 'error');
+                    }
+                } catch (error) {
+                    console.error('Error starting session:', error);
+                    updateStatus('Failed to start session', true);
+                    startButton.disabled = false;
+                    logDebug(`Exception starting session: ${error}`, 'error');
+                }
+            });
+            
+            // End session button
+            endButton.addEventListener('click', async () => {
+                try {
+                    updateStatus('Say "goodbye" to end the session', true);
+                    logDebug('User requested to end session - instructed to say "goodbye"');
+                } catch (error) {
+                    console.error('Error ending session:', error);
+                    updateStatus('Failed to end session', true);
+                    logDebug(`Error ending session: ${error}`, 'error');
+                }
+            });
+            
+            // Subscribe to server-pushed session and audio events
+            function startEventStream() {
+                if (eventSource) eventSource.close();
+                
+                eventSource = new EventSource(`/events?session_id=${sessionId}`);
+                
+                eventSource.addEventListener('session', (e) => {
+                    const data = JSON.parse(e.data);
+                    consecutiveErrors = 0;
+                    
+                    if (!data.active && sessionActive) {
+                        sessionActive = false;
+                        stopEventStream();
+                        updateStatus('Session ended', false);
+                        setStatusIndicator('idle');
+                        startButton.disabled = false;
+                        endButton.disabled = true;
+                        logDebug('Session has ended');
+                    }
+                });
+                
+                eventSource.addEventListener('therapist_stream', (e) => {
+                    const data = JSON.parse(e.data);
+                    consecutiveErrors = 0;
+                    
+                    // Without Web Audio, wait for the complete file instead
+                    if (audioContext) {
+                        playTherapistStream(data.url, data.sample_rate);
+                        logDebug(`Streaming new audio: ${data.url}`);
+                    }
+                });
+                
+                // The user talked over the therapist: stop what is still scheduled to play
+                eventSource.addEventListener('therapist_interrupted', () => {
+                    activeSources.forEach(source => source.stop());
+                    activeSources.clear();
+                    logDebug('Therapist interrupted');
+                });
+                
+                eventSource.addEventListener('therapist_audio', (e) => {
+                    const data = JSON.parse(e.data);
+                    consecutiveErrors = 0;
+                    
+                    // Already heard this turn while it was streaming
+                    if (data.stream_url && data.stream_url === activeStreamUrl) {
+                        lastTherapistAudio = data.url;
+                        return;
+                    }
+                    
+                    // Check for new therapist audio
+                    if (data.url && data.url !== lastTherapistAudio) {
+                        lastTherapistAudio = data.url;
+                        playTherapistAudio(data.url);
+                        logDebug(`Playing new audio: ${data.url}`);
+                    }
+                });
+                
+                eventSource.onerror = async () => {
+                    // EventSource reconnects on its own; only intervene if it keeps failing
+                    consecutiveErrors++;
+                    logDebug(`Event stream error (${consecutiveErrors})`, 'error');
+                    
+                    if (consecutiveErrors > 5 && sessionActive) {
+                        logDebug(`Too many consecutive errors (${consecutiveErrors}), checking session status`, 'error');
+                        
+                        try {
+                            const statusResponse = await fetch(`/session_status?session_id=${sessionId}`);
+                            const statusData = await statusResponse.json();
+                            
+                            if (!statusData.active && sessionActive) {
+                                logDebug('Session inconsistency detected - session is reported as inactive but UI shows active', 'error');
+                                
+                                // Update UI to reflect actual session state
+                                sessionActive = false;
+                                stopEventStream();
+                                updateStatus('Session disconnected - please restart', false);
+                                setStatusIndicator('idle');
+                                startButton.disabled = false;
+                                endButton.disabled = true;
+                            }
+                        } catch (statusError) {
+                            logDebug(`Error checking session status: ${statusError}`, 'error');
+                        }
+                    }
+                };
+                
+                logDebug('Subscribed to session events');
+            }
+            
+            function stopEventStream() {
+                if (eventSource) {
+                    eventSource.close();
+                    eventSource = null;
+                    logDebug('Closed session event stream');
+                }
+            }
+            
+            function ensureAudioContext() {
+                const AudioContextClass = window.AudioContext || window.webkitAudioContext;
+                if (!audioContext && AudioContextClass) {
+                    audioContext = new AudioContextClass();
+                }
+                if (audioContext && audioContext.state === 'suspended') {
+                    audioContext.resume();
+                }
+                return audioContext;
+            }
+            
+            // Play therapist PCM as it arrives, scheduling each chunk right after the previous one
+            async function playTherapistStream(streamUrl, sampleRate) {
+                activeStreamUrl = streamUrl;
+                setStatusIndicator('speaking');
+                updateStatus('Therapist is speaking...', true);
+                avatarMouth.classList.add('speaking');
+                
+                let playhead = audioContext.currentTime;
+                let leftover = null;
+                let lastSource = null;
+                
+                try {
+                    const response = await fetch(streamUrl);
+                    if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                    const reader = response.body.getReader();
+                    
+                    while (true) {
+                        const { done, value } = await reader.read();
+                        if (done) break;
+                        
+                        // Network chunks can split a 16-bit sample; carry the odd byte over
+                        let bytes = value;
+                        if (leftover) {
+                            bytes = new Uint8Array(leftover.length + value.length);
+                            bytes.set(leftover);
+                            bytes.set(value, leftover.length);
+                        }
+                        const usable = bytes.length - (bytes.length % 2);
+                        leftover = usable < bytes.length ? bytes.slice(usable) : null;
+                        if (!usable) continue;
+                        
+                        const samples = new Int16Array(bytes.buffer.slice(bytes.byteOffset, bytes.byteOffset + usable));
+                        const buffer = audioContext.createBuffer(1, samples.length, sampleRate);
+                        const channel = buffer.getChannelData(0);
+                        for (let i = 0; i < samples.length; i++) {
+                            channel[i] = samples[i] / 32768;
+                        }
+                        
+                        const source = audioContext.createBufferSource();
+                        source.buffer = buffer;
+                        source.connect(audioContext.destination);
+                        playhead = Math.max(playhead, audioContext.currentTime);
+                        source.start(playhead);
+                        playhead += buffer.duration;
+                        lastSource = source;
+                        activeSources.add(source);
+                        source.addEventListener('ended', () => activeSources.delete(source));
+                    }
+                } catch (error) {
+                    logDebug(`Error streaming audio: ${error}`, 'error');
+                }
+                
+                const finish = () => {
+                    if (activeStreamUrl !== streamUrl) return;
+                    setStatusIndicator('listening');
+                    updateStatus('Listening...', true);
+                    avatarMouth.classList.remove('speaking');
+                    logDebug('Streamed playback finished, now listening');
+                };
+                if (lastSource) {
+                    lastSource.onended = finish;
+                } else {
+                    finish();
+                }
+            }
+            
+            // Play therapist audio with error handling
+            function playTherapistAudio(audioUrl) {
+                setStatusIndicator('speaking');
+                updateStatus('Therapist is speaking...', true);
+                
+                // Animate the avatar mouth
+                avatarMouth.classList.add('speaking');
+                
+                // Ask for the Opus encoding where the browser plays it; the server falls back to WAV
+                therapistAudio.src = therapistAudio.canPlayType('audio/ogg; codecs=opus') ? `${audioUrl}?format=opus` : audioUrl;
+                therapistAudio.onended = () => {
+                    setStatusIndicator('listening');
+                    updateStatus('Listening...', true);
+                    avatarMouth.classList.remove('speaking');
+                    logDebug('Audio playback finished, now listening');
+                };
+                
+                therapistAudio.onerror = (e) => {
+                    logDebug(`Audio error: ${e.target.error}`, 'error');
+                    setStatusIndicator('listening');
+                    updateStatus('Error playing audio. Listening...', true);
+                    avatarMouth.classList.remove('speaking');
+                };
+                
+                therapistAudio.play().catch(error => {
+                    console.error('Error playing audio:', error);
+                    logDebug(`Error playing audio: ${error}`, 'error');
+                    // Fall back to listening state if audio fails
+                    setStatusIndicator('listening');
+                    updateStatus('Listening...', true);
+                    avatarMouth.classList.remove('speaking');
+                });
+            }
+            
+            // Update status message
+            function updateStatus(message, animated = false) {
+                statusMessage.textContent = message;
+                statusMessage.className = 'status' + (animated ? ' animated' : '');
+                logDebug(`Status updated: ${message}`);
+            }
+            
+            // Set status indicator
+            function setStatusIndicator(state) {
+                statusIndicator.className = 'status-indicator';
+                if (state) {
+                    statusIndicator.classList.add(state);
+                }
+                logDebug(`Status indicator changed to: ${state}`);
+            }
+            
+            // Check if session is active on page load
+            async function checkSessionStatus() {
+                if (!sessionId) {
+                    logDebug('No active session on page load');
+                    return;
+                }
+                try {
+                    const response = await fetch(`/session_status?session_id=${sessionId}`);
+                    const data = await response.json();
+                    
+                    if (data.active) {
+                        sessionActive = true;
+                        startButton.disabled = true;
+                        endButton.disabled = false;
+                        updateStatus('Session active', true);
+                        setStatusIndicator('listening');
+                        startEventStream();
+                        logDebug('Existing session detected on page load');
+                    } else {
+                        logDebug('No active session on page load');
+                    }
+                } catch (error) {
+                    console.error('Error checking session status:', error);
+                    logDebug(`Error checking initial session status: ${error}`, 'error');
+                }
+            }
+            
+            // Initialize by checking session status
+            checkSessionStatus();
+            
+            // Animate the blinking
+            setInterval(() => {
+                const eyes = document.querySelectorAll('.eye');
+                eyes.forEach(eye => {
+                    eye.style.transform = 'scaleY(0.1)';
+                    setTimeout(() => {
+                        eye.style.transform = 'scaleY(1)';
+                    }, 150);
+                });
+            }, 5000);
+            
+            // Add subtle head animation
+            const avatarImage = document.querySelector('.avatar-image');
+            let animationFrame;
+            
+            function animateAvatar() {
+                const time = Date.now() * 0.001;
+                avatarImage.style.transform = `translateY(${Math.sin(time) * 5}px)`;
+                animationFrame = requestAnimationFrame(animateAvatar);
+            }
+            
+            animateAvatar();
+            
+            // Clean up on page unload
+            window.addEventListener('beforeunload', () => {
+                cancelAnimationFrame(animationFrame);
+            });
+        });
+    </script>
+</body>
+</html>
+"""